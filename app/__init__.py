@@ -1,6 +1,10 @@
+import atexit
+import os
 from flask import Flask
 from app.api.routes import api_bp
+from app.services import extraction
 from app.services.recommendation import FlexibleRecipeRecommendationSystem
+from app.utils.llm_client import default_client
 from config import Config
 
 def create_app(config_object=Config):
@@ -10,8 +14,47 @@ def create_app(config_object=Config):
     # Initialize the recommendation system with both CSV_FILE_PATH and PRECOMPUTED_DIR
     app.recommendation_system = FlexibleRecipeRecommendationSystem(
         app.config['CSV_FILE_PATH'],
-        app.config['PRECOMPUTED_DIR']
+        app.config['PRECOMPUTED_DIR'],
+        ann_mode=app.config['ANN_MODE'],
+        ann_n_probe=app.config['ANN_N_PROBE'],
+        use_inverted_index=app.config['INVERTED_INDEX'],
+        weight_profiles=app.config['WEIGHT_PROFILES'],
+        ingest_workers=app.config['INGEST_WORKERS'],
+        ingest_memory_limit_mb=app.config['INGEST_MEMORY_LIMIT_MB'],
+        verify_checksums=app.config['VERIFY_ARTIFACT_CHECKSUMS'],
+        cache_size=app.config['RECOMMENDATION_CACHE_SIZE'],
+        ranking_cache_ttl=app.config['RANKING_CACHE_TTL'],
+        payload_cache_ttl=app.config['PAYLOAD_CACHE_TTL'],
+        image_cache_ttl=app.config['IMAGE_CACHE_TTL'],
+        image_cache_negative_ttl=app.config['IMAGE_CACHE_NEGATIVE_TTL'],
+        http_connection_limit=app.config['HTTP_CONNECTION_LIMIT'],
+        http_connection_limit_per_host=app.config['HTTP_CONNECTION_LIMIT_PER_HOST'],
+        http_keepalive_timeout=app.config['HTTP_KEEPALIVE_TIMEOUT'],
+        http_dns_cache_ttl=app.config['HTTP_DNS_CACHE_TTL'],
+        image_concurrency=app.config['IMAGE_LOOKUP_CONCURRENCY'],
+        image_time_budget=app.config['IMAGE_LOOKUP_TIME_BUDGET'],
+        scraper_racing=app.config['IMAGE_SCRAPER_RACING'],
+        scraper_race_width=app.config['IMAGE_SCRAPER_RACE_WIDTH'],
+        scraper_timeout=app.config['IMAGE_SCRAPER_TIMEOUT'],
+        image_verify_concurrency=app.config['IMAGE_VERIFY_CONCURRENCY'],
+        image_verify_timeout=app.config['IMAGE_VERIFY_TIMEOUT'],
+        scraper_breaker_failure_rate=app.config['SCRAPER_BREAKER_FAILURE_RATE'],
+        scraper_breaker_open_seconds=app.config['SCRAPER_BREAKER_OPEN_SECONDS'],
+        scraper_slow_call_seconds=app.config['SCRAPER_SLOW_CALL_SECONDS']
     )
+    # The image search keeps its HTTP session open across requests; close it with the worker
+    atexit.register(app.recommendation_system.close)
+
+    if app.config['FAST_PATH_EXTRACTION']:
+        extraction.enable_fast_path(app.recommendation_system.query_builder.compiled('ingredients'),
+                                    app.config['FAST_PATH_CONFIDENCE'])
+    default_client.configure(max_concurrency=app.config['LLM_MAX_CONCURRENCY'], timeout=app.config['LLM_TIMEOUT'])
+    atexit.register(default_client.shutdown)
+    if app.config['EXTRACTION_CACHE']:
+        extraction.enable_response_cache(
+            os.path.join(app.config['PRECOMPUTED_DIR'], 'extraction_cache', 'responses.sqlite3'),
+            app.config['EXTRACTION_CACHE_SIZE']
+        )
 
     app.register_blueprint(api_bp)
 
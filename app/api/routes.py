@@ -5,6 +5,7 @@ import asyncio
 import os
 from app.services import extraction
 from app.services import image_query 
+from app.utils.llm_client import LLMTimeoutError, default_client
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -21,44 +22,109 @@ def get_form_data():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+MAX_BATCH_QUERIES = 50
+
+FEATURE_WEIGHTS_RECOMMEND = {
+    'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
+    'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10
+}
+
+def parse_recommend_query(data):
+    """
+    Read the /recommend fields from a request body. Raises ValueError if calories or time are not integers.
+    """
+    calories = data.get('calories')
+    time = data.get('time')
+    if calories is not None:
+        calories = int(calories)
+    if time is not None:
+        time = int(time)
+
+    return {
+        'category': data.get('category'),
+        'dietary_preference': data.get('dietary_preference'),
+        'ingredients': data.get('ingredients', []),
+        'calories': calories,
+        'time': time,
+        'keywords': data.get('keywords', []),
+        'keywords_name': data.get('keywords_name', [])
+    }
+
 @api_bp.route('/recommend', methods=['POST'])
 async def recommend_recipes():  # Make this function async
     data = request.json
-    category = data.get('category')
-    dietary_preference = data.get('dietary_preference')
-    ingredients = data.get('ingredients', [])
-    calories = data.get('calories')
-    time = data.get('time')
-    keywords = data.get('keywords', [])
-    keywords_name = data.get('keywords_name', [])
 
     try:
-        if calories is not None:
-            calories = int(calories)
-        if time is not None:
-            time = int(time)
+        query = parse_recommend_query(data)
     except ValueError:
         return jsonify({"error": "Calories and time must be integers if provided"}), 400
 
-    feature_weights_recommend = {
-        'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
-        'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10
-    }
+    profile = data.get('profile')
+    if profile is not None and profile not in current_app.recommendation_system.weight_profiles:
+        return jsonify({"error": f"Unknown weight profile '{profile}'"}), 400
 
     # Use await to call the async function
     recommendations = await current_app.recommendation_system.get_recommendations(
-        category=category,
-        dietary_preference=dietary_preference,
-        ingredients=ingredients,
-        calories=calories,
-        time=time,
-        keywords=keywords,
-        keywords_name=keywords_name,
-        feature_weights=feature_weights_recommend
+        **query,
+        feature_weights=FEATURE_WEIGHTS_RECOMMEND,
+        profile=profile
     )
 
     return jsonify([vars(recipe) for recipe in recommendations])
 
+@api_bp.route('/recommend/batch', methods=['POST'])
+async def recommend_recipes_batch():
+    data = request.get_json()
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "A non-empty 'queries' list is required"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries are allowed per batch"}), 400
+    profile = data.get('profile')
+    if profile is not None and profile not in current_app.recommendation_system.weight_profiles:
+        return jsonify({"error": f"Unknown weight profile '{profile}'"}), 400
+
+    parsed_queries = []
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict):
+            return jsonify({"error": f"Query {position} must be an object"}), 400
+        try:
+            parsed_queries.append(parse_recommend_query(query))
+        except (ValueError, TypeError):
+            return jsonify({"error": f"Calories and time must be integers if provided (query {position})"}), 400
+
+    recommendations = await current_app.recommendation_system.get_recommendations_batch(
+        parsed_queries,
+        feature_weights=FEATURE_WEIGHTS_RECOMMEND,
+        profile=profile
+    )
+
+    return jsonify([[vars(recipe) for recipe in recipes] for recipes in recommendations])
+
+@api_bp.route('/recommend/cache-stats', methods=['GET'])
+def recommend_cache_stats():
+    return jsonify(current_app.recommendation_system.cache_stats())
+
+@api_bp.route('/image-search/status', methods=['GET'])
+def image_search_status():
+    return jsonify(current_app.recommendation_system.image_search_status())
+
+@api_bp.route('/extract-recipe-attributes/cache-stats', methods=['GET'])
+def extraction_cache_stats():
+    if extraction.response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **extraction.response_cache.stats()})
+
+@api_bp.route('/extract-recipe-attributes/fast-path-stats', methods=['GET'])
+def extraction_fast_path_stats():
+    if extraction.fast_path is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **extraction.fast_path.stats()})
+
+@api_bp.route('/llm/status', methods=['GET'])
+def llm_status():
+    return jsonify(default_client.stats())
+
 @api_bp.route('/extract-recipe-attributes', methods=['POST'])
 async def recommend_recipes2():
     try:
@@ -71,7 +137,7 @@ async def recommend_recipes2():
             return jsonify({"error": "No search text provided"}), 400
 
         # Extract recipe attributes
-        extracted_info = extraction.extract_recipe_attributes(raw_text)  # Call the extraction function
+        extracted_info = await extraction.extract_recipe_attributes(raw_text)  # Call the extraction function
 
         # Check if extraction was successful
         if 'error' in extracted_info:
@@ -113,6 +179,8 @@ async def recommend_recipes2():
 
         return jsonify(recipe_list)
 
+    except LLMTimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -129,10 +197,10 @@ async def handle_analyze_food_image():
             return jsonify({"error": "No selected file"}), 400
         
         # Call the analyze function with the file
-        description = image_query.analyze_food_image(file)
+        description = await image_query.analyze_food_image(file)
         
         # Extract recipe attributes
-        extracted_info = extraction.extract_recipe_attributes(description)  # Call the extraction function
+        extracted_info = await extraction.extract_recipe_attributes(description)  # Call the extraction function
 
         # Check if extraction was successful
         if 'error' in extracted_info:
@@ -174,6 +242,8 @@ async def handle_analyze_food_image():
 
         return jsonify(recipe_list)
 
+    except LLMTimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -189,7 +259,13 @@ def health_check():
         "endpoints": [
             "/api/form-data",
             "/api/recommend",
+            "/api/recommend/batch",
+            "/api/recommend/cache-stats",
+            "/api/image-search/status",
             "/api/extract-recipe-attributes",
+            "/api/extract-recipe-attributes/cache-stats",
+            "/api/extract-recipe-attributes/fast-path-stats",
+            "/api/llm/status",
             "/api/analyze-food-image"
         ]
     }), 200
@@ -1,13 +1,27 @@
+import asyncio
 import google.generativeai as genai
+import hashlib
 import json
+import re
+import threading
+import time
 from difflib import get_close_matches
 import os
 from dotenv import load_dotenv
 from difflib import SequenceMatcher
+from app.utils.llm_cache import LLMResponseCache
+from app.utils.llm_client import default_client
 
 load_dotenv() 
 genai.configure(api_key=os.getenv("EXTRACTION_API_KEY"))
 
+MODEL_NAME = 'gemini-2.0-flash'
+GENERATION_CONFIG = {'temperature': 0, 'max_output_tokens': 150, 'top_p': 1}
+# LLMResponseCache of raw model outputs, set up by enable_response_cache
+response_cache = None
+# FastPathExtractor tried before the LLM, set up by enable_fast_path
+fast_path = None
+
 # Define categories from dataset
 RECIPE_CATEGORIES = [
     "frozen desserts",
@@ -261,7 +275,140 @@ def find_closest_category(category):
     # If no match is found at all, return empty string
     return ""
 
-def extract_recipe_attributes(text):
+# "under 300 calories", "300 kcal"; "30 minutes", "1.5 hours", "1 hr"
+CALORIES_PATTERN = re.compile(r'(\d+(?:\.\d+)?)[\s-]*(?:k?cals?|calories|calorie)\b')
+TIME_PATTERN = re.compile(r'(\d+(?:\.\d+)?)[\s-]*(minutes|minute|mins|min|hours|hour|hrs|hr)\b')
+# Words of a request that say nothing about the recipe, besides the vectorizer's stop words
+FILLER_WORDS = {'recipe', 'recipes', 'make', 'cook', 'cooking', 'want', 'need', 'like', 'looking', 'ideas',
+                'idea', 'dish', 'dishes', 'meal', 'meals', 'food', 'using', 'use', 'just', 'lets', 'let',
+                'maybe', 'kind', 'sort', 'type', 'prepare', 'try', 'give', 'show', 'find', 'suggest'}
+
+class FastPathExtractor:
+    """
+    Rule-based extraction for inputs that name a category and at most calories and time,
+    such as "chicken in 30 minutes", "desserts under 300 calories" or a bare category name.
+
+    Categories come from RECIPE_CATEGORIES (with find_closest_category for misspellings), and
+    calories and time from number and unit phrases. The rules cannot add the companion
+    ingredients and keywords the LLM does, so extract_recipe_attributes takes those from the
+    model's output for the bare category; one output then serves every such query about it.
+    Inputs that mention anything else, ingredients included, are left to the LLM. The
+    confidence is the share of the input's meaningful words that were recognized.
+    """
+
+    def __init__(self, ingredient_vocabulary, threshold=1.0):
+        # CompiledTfidf of the ingredient vectorizer, for its tokenizer and stop words
+        self.ingredients = ingredient_vocabulary
+        self.threshold = threshold
+        self.categories = {}
+        for category in RECIPE_CATEGORIES:
+            words = tuple(re.findall(r'[a-z]+', category.lower()))
+            if words and not re.search(r'\d', category):
+                self.categories.setdefault(words, category)
+        self.max_category_words = max(len(words) for words in self.categories)
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+
+    def _category(self, words):
+        if words in self.categories:
+            return self.categories[words]
+        if words[-1].endswith('s'):
+            return self.categories.get(words[:-1] + (words[-1][:-1],))
+        return None
+
+    def _close_category(self, word):
+        # find_closest_category also matches substrings, which is too loose for a single word
+        category = find_closest_category(word) if len(word) >= 4 else ''
+        if category and SequenceMatcher(None, word, category.lower()).ratio() >= 0.85:
+            return category
+        return None
+
+    def extract(self, text):
+        """
+        ({category, calories, time, keywords for the numbers}, confidence between 0 and 1).
+        """
+        text = text.lower()
+        calories = CALORIES_PATTERN.search(text)
+        time = TIME_PATTERN.search(text)
+        keywords = []
+        recognized = 0
+        minutes = ''
+        if calories:
+            recognized += 1
+            keywords.append(f"{calories.group(1)} calories")
+            text = CALORIES_PATTERN.sub(' ', text, count=1)
+        if time:
+            recognized += 1
+            value = float(time.group(1)) * (60 if time.group(2).startswith('h') else 1)
+            minutes = str(round(value))
+            keywords.append(f"{minutes} minutes")
+            text = TIME_PATTERN.sub(' ', text, count=1)
+
+        words = self.ingredients.token_pattern.findall(text)
+        category = ''
+        unknown = 0
+        i = 0
+        while i < len(words):
+            match = None
+            for n in range(min(self.max_category_words, len(words) - i), 0, -1):
+                match = self._category(tuple(words[i:i + n]))
+                if match:
+                    break
+            if not match:
+                word = words[i]
+                n = 1
+                if word in self.ingredients.stop_words or word in FILLER_WORDS or word.isdigit():
+                    i += 1
+                    continue
+                match = self._close_category(word)
+            # A second category is as unknown to the rules as any other word
+            if match and category in ('', match):
+                category = match
+                recognized += n
+            else:
+                unknown += n
+            i += n
+
+        # Without a category there is no model output to take the ingredients and keywords from
+        confidence = recognized / (recognized + unknown) if category else 0.0
+        result = {
+            "category": category,
+            "calories": str(round(float(calories.group(1)))) if calories else "",
+            "time": minutes,
+            "keywords": keywords
+        }
+        return result, confidence
+
+    def try_extract(self, text):
+        """
+        The extracted attributes if the confidence reaches the threshold, else None.
+        """
+        result, confidence = self.extract(text)
+        hit = confidence >= self.threshold
+        with self._lock:
+            self.attempts += 1
+            self.hits += hit
+        return result if hit else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threshold': self.threshold,
+                'attempts': self.attempts,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.attempts if self.attempts else 0.0
+            }
+
+def enable_fast_path(ingredient_vocabulary, threshold=1.0):
+    """
+    Answer category and number inputs from the model's output for the bare category, given the
+    CompiledTfidf of the ingredient vectorizer.
+    """
+    global fast_path
+    fast_path = FastPathExtractor(ingredient_vocabulary, threshold)
+
+def build_prompt(text):
     messages = [
         {"role": "system", "content": "You are an assistant that extracts recipe attributes from user input. If the input contains an uncommon or unrecognized category, add relevant general keywords based on common culinary types, such as 'beverages' for drinks, 'dessert' for sweets, etc."},
         {"role": "user", "content": f"""
@@ -357,17 +504,30 @@ Output:
             prompt += message["content"] + "\n\n"
         else:
             prompt += message["content"]
+    return prompt
 
-    # Configure the Gemini model
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
+def prompt_version():
+    """
+    Hash of everything besides the input that shapes a model output: the prompt template,
+    the model and its settings, and the categories outputs are matched against.
+    """
+    fingerprint = json.dumps([build_prompt('\x00'), MODEL_NAME, GENERATION_CONFIG, RECIPE_CATEGORIES])
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+def enable_response_cache(path, memory_entries=1024):
+    """
+    Memoize model outputs in memory and in a SQLite store at path, shared by the workers.
+    """
+    global response_cache
+    response_cache = LLMResponseCache(path, prompt_version(), memory_entries)
+
+async def generate_output(text):
+    """
+    The model output for the text, with any markdown code fence removed.
+    """
     # Generate response
-    response = model.generate_content(prompt, 
-                                     generation_config=genai.types.GenerationConfig(
-                                         temperature=0,
-                                         max_output_tokens=150,
-                                         top_p=1
-                                     ))
+    response = await default_client.generate(MODEL_NAME, build_prompt(text),
+                                             generation_config=genai.types.GenerationConfig(**GENERATION_CONFIG))
     
     # Process the response
     output_text = response.text.strip()
@@ -378,121 +538,161 @@ Output:
         match = re.search(r'```(?:json)?\n(.*?)\n```', output_text, re.DOTALL)
         if match:
             output_text = match.group(1).strip()
-    
+    return output_text
+
+async def model_output(text):
+    """
+    The model output for the text, from the response cache when it is enabled.
+    """
+    output_text = response_cache.get(text) if response_cache is not None else None
+    if output_text is None:
+        start = time.time()
+        output_text = await generate_output(text)
+        latency = time.time() - start
+        if response_cache is not None and is_json(output_text):
+            response_cache.set(text, output_text, latency)
+    return output_text
+
+async def extract_recipe_attributes(text):
+    simple = fast_path.try_extract(text) if fast_path is not None else None
+    if simple is not None:
+        output_text = await model_output(simple["category"])
+        if is_json(output_text):
+            # The model's ingredients and keywords for the bare category, with the input's numbers
+            result = json.loads(output_text)
+            result["calories"] = simple["calories"]
+            result["time"] = simple["time"]
+            result["keywords"] = list(dict.fromkeys(result.get("keywords", []) + simple["keywords"]))
+            return refine_attributes(result, text)
+
+    output_text = await model_output(text)
     try:
         result = json.loads(output_text)
-        # Update category with closest match from dataset
-        original_category = result["category"]
-        matched_category = find_closest_category(original_category)
-        
-        if matched_category:
-            result["category"] = matched_category
-            if original_category != matched_category:
-                result["keywords_name"] = matched_category.split()
-        else:
-            result["category"] = ""
-            # Add additional context-based keywords and ingredients if category is empty
-            if "coffee" in text.lower() or "latte" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["coffee", "beverages", "caffeinated", "hot drink"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "caffeinated", "coffee"]
-                result["ingredients"] = result.get("ingredients", []) + ["coffee beans", "water"]
-                
-            elif "smoothie bowl" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverages", "healthy", "smoothie bowl"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "smoothie bowl"]
-                result["ingredients"] = result.get("ingredients", []) + ["fruits", "yogurt", "granola"]
-                
-            elif "kombucha" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverage", "fermented", "kombucha"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "kombucha"]
-                result["ingredients"] = result.get("ingredients", []) + ["tea", "sugar", "SCOBY"]
-
-            elif "herbal tea" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverages", "caffeine-free", "herbal tea"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "herbal tea"]
-                result["ingredients"] = result.get("ingredients", []) + ["herbs", "water"]
-
-            elif "seaweed" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["ingredient", "seafood", "seaweed"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["seaweed"]
-                result["ingredients"] = result.get("ingredients", []) + ["seaweed"]
-
-            elif "vegan cheese" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["dairy-free", "vegan", "cheese"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["vegan cheese"]
-                result["ingredients"] = result.get("ingredients", []) + ["cashews", "nutritional yeast", "coconut oil"]
-
-            elif "air fryer" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["cooking method", "air fryer", "healthy"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["air fryer"]
-                result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
-
-            elif "instant pot" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["cooking method", "instant pot", "pressure cooker"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["instant pot"]
-                result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
-
-            elif "sous vide" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["cooking method", "sous vide", "precision cooking"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["sous vide"]
-                result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
-
-            elif "paleo" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["diet", "paleo", "low-carb"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["paleo"]
-                result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
-
-            elif "fodmap" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["diet", "fodmap", "digestive health"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["fodmap"]
-                result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
-
-            elif "cold brew" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverages", "caffeinated", "cold coffee"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "cold brew"]
-                result["ingredients"] = result.get("ingredients", []) + ["coffee grounds", "water"]
-
-            elif "matcha" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverages", "green tea", "matcha"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "matcha"]
-                result["ingredients"] = result.get("ingredients", []) + ["matcha powder", "water", "milk"]
-
-            elif "smoothie" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverages", "healthy", "smoothie"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "smoothie"]
-                result["ingredients"] = result.get("ingredients", []) + ["fruits", "milk", "yogurt"]
-
-            elif "protein shake" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverages", "high protein", "shake"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "protein shake"]
-                result["ingredients"] = result.get("ingredients", []) + ["protein powder", "milk", "banana"]
-
-            elif "oat milk" in text.lower() or "almond milk" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["dairy-free", "vegan", "plant-based milk"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["oat milk" if "oat" in text.lower() else "almond milk"]
-                result["ingredients"] = result.get("ingredients", []) + ["oats" if "oat" in text.lower() else "almonds", "water"]
-
-            elif "zoodles" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["low carb", "gluten-free", "vegetable noodles", "noodles"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["zoodles", "noodles"]
-                result["ingredients"] = result.get("ingredients", []) + ["zucchini"]
-
-            elif "avocado toast" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["breakfast", "healthy", "avocado"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["avocado toast"]
-                result["ingredients"] = result.get("ingredients", []) + ["avocado", "bread"]
-
-            elif "golden milk" in text.lower():
-                result["keywords"] = result.get("keywords", []) + ["beverage", "turmeric", "anti-inflammatory"]
-                result["keywords_name"] = result.get("keywords_name", []) + ["golden milk"]
-                result["ingredients"] = result.get("ingredients", []) + ["turmeric", "milk", "honey", "spices"]
-            # other cases...
-            
     except json.JSONDecodeError:
-        result = {"error": "Failed to parse JSON", "output": output_text}
+        return {"error": "Failed to parse JSON", "output": output_text}
+    return refine_attributes(result, text)
+
+def refine_attributes(result, text):
+    """
+    Match the extracted category to the dataset's, and add context-based keywords and
+    ingredients for common inputs that have none.
+    """
+    # Update category with closest match from dataset
+    original_category = result["category"]
+    matched_category = find_closest_category(original_category)
     
+    if matched_category:
+        result["category"] = matched_category
+        if original_category != matched_category:
+            result["keywords_name"] = matched_category.split()
+    else:
+        result["category"] = ""
+        # Add additional context-based keywords and ingredients if category is empty
+        if "coffee" in text.lower() or "latte" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["coffee", "beverages", "caffeinated", "hot drink"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "caffeinated", "coffee"]
+            result["ingredients"] = result.get("ingredients", []) + ["coffee beans", "water"]
+            
+        elif "smoothie bowl" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverages", "healthy", "smoothie bowl"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "smoothie bowl"]
+            result["ingredients"] = result.get("ingredients", []) + ["fruits", "yogurt", "granola"]
+            
+        elif "kombucha" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverage", "fermented", "kombucha"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "kombucha"]
+            result["ingredients"] = result.get("ingredients", []) + ["tea", "sugar", "SCOBY"]
+
+        elif "herbal tea" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverages", "caffeine-free", "herbal tea"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "herbal tea"]
+            result["ingredients"] = result.get("ingredients", []) + ["herbs", "water"]
+
+        elif "seaweed" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["ingredient", "seafood", "seaweed"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["seaweed"]
+            result["ingredients"] = result.get("ingredients", []) + ["seaweed"]
+
+        elif "vegan cheese" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["dairy-free", "vegan", "cheese"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["vegan cheese"]
+            result["ingredients"] = result.get("ingredients", []) + ["cashews", "nutritional yeast", "coconut oil"]
+
+        elif "air fryer" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["cooking method", "air fryer", "healthy"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["air fryer"]
+            result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
+
+        elif "instant pot" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["cooking method", "instant pot", "pressure cooker"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["instant pot"]
+            result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
+
+        elif "sous vide" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["cooking method", "sous vide", "precision cooking"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["sous vide"]
+            result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
+
+        elif "paleo" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["diet", "paleo", "low-carb"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["paleo"]
+            result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
+
+        elif "fodmap" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["diet", "fodmap", "digestive health"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["fodmap"]
+            result["ingredients"] = result.get("ingredients", [])  # Ingredients vary with recipe, left blank
+
+        elif "cold brew" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverages", "caffeinated", "cold coffee"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "cold brew"]
+            result["ingredients"] = result.get("ingredients", []) + ["coffee grounds", "water"]
+
+        elif "matcha" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverages", "green tea", "matcha"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "matcha"]
+            result["ingredients"] = result.get("ingredients", []) + ["matcha powder", "water", "milk"]
+
+        elif "smoothie" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverages", "healthy", "smoothie"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "smoothie"]
+            result["ingredients"] = result.get("ingredients", []) + ["fruits", "milk", "yogurt"]
+
+        elif "protein shake" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverages", "high protein", "shake"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["beverages", "protein shake"]
+            result["ingredients"] = result.get("ingredients", []) + ["protein powder", "milk", "banana"]
+
+        elif "oat milk" in text.lower() or "almond milk" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["dairy-free", "vegan", "plant-based milk"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["oat milk" if "oat" in text.lower() else "almond milk"]
+            result["ingredients"] = result.get("ingredients", []) + ["oats" if "oat" in text.lower() else "almonds", "water"]
+
+        elif "zoodles" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["low carb", "gluten-free", "vegetable noodles", "noodles"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["zoodles", "noodles"]
+            result["ingredients"] = result.get("ingredients", []) + ["zucchini"]
+
+        elif "avocado toast" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["breakfast", "healthy", "avocado"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["avocado toast"]
+            result["ingredients"] = result.get("ingredients", []) + ["avocado", "bread"]
+
+        elif "golden milk" in text.lower():
+            result["keywords"] = result.get("keywords", []) + ["beverage", "turmeric", "anti-inflammatory"]
+            result["keywords_name"] = result.get("keywords_name", []) + ["golden milk"]
+            result["ingredients"] = result.get("ingredients", []) + ["turmeric", "milk", "honey", "spices"]
+        # other cases...
+
     return result
 
+def is_json(text):
+    try:
+        json.loads(text)
+        return True
+    except json.JSONDecodeError:
+        return False
+
 # Example usage:
 if __name__ == '__main__':
     test_cases = [
@@ -528,5 +728,5 @@ if __name__ == '__main__':
     
     for test_input in test_cases:
         print(f"\nTesting: {test_input}")
-        result = extract_recipe_attributes(test_input)
+        result = asyncio.run(extract_recipe_attributes(test_input))
         print(json.dumps(result, indent=2))
\ No newline at end of file
@@ -4,6 +4,7 @@ import PIL.Image
 import io
 import os
 from dotenv import load_dotenv
+from app.utils.llm_client import LLMTimeoutError, default_client
 app = Flask(__name__)
 load_dotenv()
 
@@ -11,10 +12,10 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 genai.configure(api_key=GOOGLE_API_KEY)
 
-# Initialize the model - UPDATED MODEL NAME HERE
-model = genai.GenerativeModel('gemini-2.0')  
+# The model - UPDATED MODEL NAME HERE
+MODEL_NAME = 'gemini-2.0'
 
-def analyze_food_image(image_content) -> str:
+async def analyze_food_image(image_content) -> str:
     """
     Analyze image using Gemini API and return food description
     """
@@ -32,7 +33,7 @@ def analyze_food_image(image_content) -> str:
         image = PIL.Image.open(io.BytesIO(image_bytes))
         
         # Generate response
-        response = model.generate_content([prompt, image])
+        response = await default_client.generate(MODEL_NAME, [prompt, image])
         
         # Clean and format the response
         description = response.text.strip().lower()
@@ -42,6 +43,8 @@ def analyze_food_image(image_content) -> str:
 
         return description if description else "food dish"
         
+    except LLMTimeoutError:
+        raise
     except Exception as e:
         print(f"Error in analysis: {str(e)}")
         return f"food dish (Error: {str(e)})"
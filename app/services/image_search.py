@@ -4,6 +4,10 @@ import aiohttp
 import random
 import re
 from typing import List, Union
+from app.utils.background_loop import BackgroundLoop
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.image_cache import InFlightLookups, recipe_key
+from app.utils.scraper_stats import ScraperStats
 from app.utils.scrapers.google_scraper import GoogleScraper
 from app.utils.scrapers.food_network_scraper import FoodNetworkScraper
 from app.utils.scrapers.allrecipes_scraper import AllRecipesScraper
@@ -12,8 +16,17 @@ from app.utils.scrapers.fooddotcom_scraper import FoodDotComScraper
 
 logger = logging.getLogger(__name__)
 
+class ScraperTimeoutError(Exception):
+    """
+    A scraper lookup ran past its adaptive timeout.
+    """
+
 class ImageSearchService:
-    def __init__(self):
+    def __init__(self, image_cache=None, connection_limit=100, connection_limit_per_host=8,
+                 keepalive_timeout=30, dns_cache_ttl=300, racing=True, race_width=2, scraper_timeout=60,
+                 verify_concurrency=4, verify_timeout=5, breaker_failure_rate=0.5, breaker_open_seconds=30,
+                 slow_call_seconds=10, min_scraper_timeout=2, timeout_margin=1.5,
+                 backfilled_images=None, trace_configs=None):
         self.scrapers = [
             GoogleScraper(),
             FoodNetworkScraper(),
@@ -22,25 +35,72 @@ class ImageSearchService:
             FoodDotComScraper()
         ]
         self.session = None
+        self.session_loop = None
         self.placeholder_images = [
             "https://drive.google.com/file/d/1gYOjs06yiq7EUXaO19BE-L7MkrTR6wlc/view?usp=sharing",
             "https://drive.google.com/file/d/1ob4KbzVLtwsE_ckYKBu_70FLEXNCJRSr/view?usp=sharing",
             "https://drive.google.com/file/d/1UUv3zF1ouXteZVt8Oc_UXORcJrlWfRXR/view?usp=sharing"
         ]
+        # Optional ImageUrlCache of scraper results, shared across requests and workers
+        self.image_cache = image_cache
+        # Image URLs found offline by the backfill job, by recipe_key of the recipe name
+        self.backfilled_images = backfilled_images or {}
+        self.trace_configs = trace_configs
+        self.in_flight = InFlightLookups()
+        # Racing returns once enough images are found instead of waiting for every scraper
+        self.racing = racing
+        self.race_width = race_width
+        self.scraper_timeout = scraper_timeout
+        self.stats = {type(scraper).__name__: ScraperStats() for scraper in self.scrapers}
+        self.breakers = {type(scraper).__name__: CircuitBreaker(breaker_failure_rate, open_seconds=breaker_open_seconds,
+                                                                slow_call_seconds=slow_call_seconds)
+                         for scraper in self.scrapers}
+        self.min_scraper_timeout = min_scraper_timeout
+        self.timeout_margin = timeout_margin
+        for scraper in self.scrapers:
+            scraper.verify_concurrency = verify_concurrency
+            scraper.verify_timeout = verify_timeout
+        # The session and its connection pool live on one loop for the lifetime of the
+        # worker, so keep-alive connections and DNS results are reused across requests
+        self.http_loop = BackgroundLoop('image-search-http')
+        self.connector_options = dict(limit=connection_limit, limit_per_host=connection_limit_per_host,
+                                      keepalive_timeout=keepalive_timeout, ttl_dns_cache=dns_cache_ttl)
 
     async def __aenter__(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-            for scraper in self.scrapers:
-                scraper.session = self.session
-        logger.info("ImageSearchService session initialized")
+        # Kept so callers can still scope their use of the service; the session outlives it
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        pass
+
+    async def _ensure_session(self):
+        # Runs on the HTTP loop, which is the only place the session is created or used
+        # A worker forked after the first lookup gets a new loop and needs its own session
+        if self.session is None or self.session.closed or self.session_loop is not asyncio.get_running_loop():
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(**self.connector_options),
+                                                 trace_configs=self.trace_configs)
+            self.session_loop = asyncio.get_running_loop()
+            for scraper in self.scrapers:
+                scraper.session = self.session
+            logger.info("ImageSearchService session initialized")
+        return self.session
+
+    async def _close_session(self):
+        if self.session is not None:
             await self.session.close()
             self.session = None
-        logger.info("ImageSearchService session closed")
+            logger.info("ImageSearchService session closed")
+
+    def close(self):
+        """
+        Close the pooled session and stop its loop; called when the app shuts down.
+        """
+        if self.http_loop.loop is not None:
+            try:
+                self.http_loop.submit(self._close_session()).result(timeout=5)
+            except Exception as e:
+                logger.error(f"Error closing ImageSearchService session: {str(e)}")
+        self.http_loop.stop()
 
     async def search_recipe_images(self, recipe_name: str, image_data: Union[str, float, int], num_images: int = 3) -> List[str]:
         logger.info(f"Searching images for recipe: {recipe_name}")
@@ -51,57 +111,229 @@ class ImageSearchService:
             logger.info(f"Found {len(existing_urls)} existing URLs")
             return existing_urls[:num_images]
         
+        backfilled_urls = self.backfilled_images.get(recipe_key(recipe_name))
+        if backfilled_urls:
+            logger.info(f"Found {len(backfilled_urls)} backfilled image URLs")
+            return backfilled_urls[:num_images]
+
+        if self.image_cache is not None:
+            cached_urls = await asyncio.to_thread(self.image_cache.get, recipe_name, num_images)
+            if cached_urls is not None:
+                logger.info(f"Found {len(cached_urls)} cached image URLs")
+                return cached_urls or self.select_placeholders(num_images)
+
+        # Concurrent lookups of the same recipe share the first one's scraping
+        key = (recipe_key(recipe_name), num_images)
+        future, owner = self.in_flight.claim(key)
+        if owner:
+            # Detached on the HTTP loop, so a lookup that outlives this request's time
+            # budget still finishes and is cached for the next request
+            self.http_loop.submit(self.lookup_images(key, recipe_name, num_images))
+        else:
+            logger.info(f"Waiting for the in-flight image search for {recipe_name}")
+        # Shielded, so a caller whose time budget runs out does not cancel the shared lookup
+        urls = await asyncio.shield(asyncio.wrap_future(future))
+        if urls is None:
+            # Return placeholder images in case of error, without caching the failure. Its
+            # waiters do the same rather than all scraping again; the next request retries.
+            return self.select_placeholders(num_images)
+        if urls:
+            return urls
+
+        # If no images found, return random placeholder images
+        logger.info("No images found, using placeholder images")
+        return self.select_placeholders(num_images)
+
+    async def lookup_images(self, key, recipe_name: str, num_images: int):
+        """
+        Scrape and cache the images of a claimed in-flight key, then resolve it with the
+        URLs, or None if the lookup failed. Runs on the HTTP loop.
+        """
+        urls = None
         try:
-            # Try to get images from scrapers
-            all_results = []
-            tasks = []
-            
-            for scraper in self.scrapers:
-                task = asyncio.create_task(scraper.search_images(recipe_name, num_images))
-                tasks.append(task)
-            
-            logger.info(f"Created {len(tasks)} scraper tasks")
-            done, pending = await asyncio.wait(tasks, timeout=60)
-            
-            for task in pending:
-                logger.warning(f"Cancelling pending task for {task.get_coro().__name__}")
-                task.cancel()
-            
-            for task in done:
-                try:
-                    results = await task
-                    logger.info(f"Scraper {task.get_coro().__name__} found {len(results)} images")
-                    all_results.extend(results)
-                except Exception as e:
-                    logger.error(f"Error in scraper task {task.get_coro().__name__}: {str(e)}")
-            
-            # Get unique results
-            seen = set()
-            unique_results = []
-            for url in all_results:
-                if url not in seen:
-                    seen.add(url)
-                    unique_results.append(url)
-            
-            if unique_results:
-                logger.info(f"Found {len(unique_results)} unique image URLs")
-                return unique_results[:num_images]
-            
-            # If no images found, return random placeholder images
-            logger.info("No images found, using placeholder images")
-            selected_placeholders = []
-            for _ in range(num_images):
-                placeholder = random.choice(self.placeholder_images)
-                while placeholder in selected_placeholders and len(selected_placeholders) < len(self.placeholder_images):
-                    placeholder = random.choice(self.placeholder_images)
-                selected_placeholders.append(placeholder)
-            
-            return selected_placeholders
-            
+            urls = await self.scrape_images(recipe_name, num_images)
+            if self.image_cache is not None:
+                await asyncio.to_thread(self.image_cache.set, recipe_name, num_images, urls)
         except Exception as e:
             logger.error(f"Error in image search: {str(e)}")
-            # Return placeholder images even in case of error
-            return random.sample(self.placeholder_images, min(num_images, len(self.placeholder_images)))
+        finally:
+            self.in_flight.finish(key, urls)
+
+    async def scrape_images(self, recipe_name: str, num_images: int) -> List[str]:
+        """
+        Unique image URLs found by the scrapers, at most num_images of them. Runs on the HTTP loop.
+        """
+        await self._ensure_session()
+        if self.racing:
+            return await self.race_scrapers(recipe_name, num_images)
+        return await self.scrape_all(recipe_name, num_images)
+
+    def scraper_stats(self):
+        """
+        Statistics, circuit breaker state and current timeout of every scraper.
+        """
+        status = {}
+        for scraper in self.scrapers:
+            name = type(scraper).__name__
+            status[name] = {**self.stats[name].snapshot(), 'breaker': self.breakers[name].snapshot(),
+                            'timeout_seconds': round(self.adaptive_timeout(scraper), 3)}
+        return status
+
+    def available_scrapers(self):
+        """
+        The scrapers whose circuit breaker lets a lookup through now.
+        """
+        available = [scraper for scraper in self.scrapers if self.breakers[type(scraper).__name__].allow()]
+        skipped = len(self.scrapers) - len(available)
+        if skipped:
+            logger.info(f"Skipping {skipped} scrapers with an open circuit breaker")
+        return available
+
+    def adaptive_timeout(self, scraper) -> float:
+        """
+        Timeout of one lookup: a margin over the scraper's p95 latency, within
+        [min_scraper_timeout, scraper_timeout]. The full scraper timeout until there is a p95.
+        """
+        p95 = self.stats[type(scraper).__name__].p95()
+        if p95 is None:
+            return self.scraper_timeout
+        return min(max(p95 * self.timeout_margin, self.min_scraper_timeout), self.scraper_timeout)
+
+    async def run_scraper(self, scraper, recipe_name: str, num_images: int) -> List[str]:
+        """
+        One scraper lookup under its adaptive timeout, reported to its circuit breaker.
+        The caller must have been let through by the breaker.
+        """
+        name = type(scraper).__name__
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            results = await asyncio.wait_for(scraper.search_images(recipe_name, num_images),
+                                             self.adaptive_timeout(scraper))
+        except asyncio.CancelledError:
+            self.breakers[name].release()
+            raise
+        except asyncio.TimeoutError:
+            self.breakers[name].record(False, loop.time() - started)
+            raise ScraperTimeoutError(f"{name} timed out after {loop.time() - started:.1f}s")
+        except Exception:
+            self.breakers[name].record(False, loop.time() - started)
+            raise
+        self.breakers[name].record(True, loop.time() - started)
+        self.stats[name].record_completed(loop.time() - started)
+        return results
+
+    def hedge_delay(self, scraper) -> float:
+        # How long a launched scraper gets before the next one is started alongside it
+        return min(max(self.stats[type(scraper).__name__].latency, 0.2), 5.0)
+
+    async def race_scrapers(self, recipe_name: str, num_images: int) -> List[str]:
+        """
+        Launch the scrapers in order of expected cost, race_width at a time, and return as
+        soon as num_images unique URLs are in, cancelling the rest. A scraper slower than
+        its usual latency is hedged by launching the next one alongside it.
+        """
+        loop = asyncio.get_running_loop()
+        queue = sorted(self.available_scrapers(),
+                       key=lambda scraper: self.stats[type(scraper).__name__].expected_cost())
+        deadline = loop.time() + self.scraper_timeout
+        running = {}
+        unique_results = []
+        hedge_at = None
+
+        def launch():
+            nonlocal hedge_at
+            scraper = queue.pop(0)
+            task = asyncio.create_task(self.run_scraper(scraper, recipe_name, num_images))
+            running[task] = (scraper, loop.time())
+            hedge_at = loop.time() + self.hedge_delay(scraper)
+
+        for _ in range(min(self.race_width, len(queue))):
+            launch()
+        try:
+            while running and len(unique_results) < num_images and loop.time() < deadline:
+                wake_at = min(deadline, hedge_at) if queue else deadline
+                done, _ = await asyncio.wait(running, timeout=max(wake_at - loop.time(), 0),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    scraper, started = running.pop(task)
+                    name = type(scraper).__name__
+                    try:
+                        results = task.result()
+                    except Exception as e:
+                        logger.error(f"Error in scraper task {name}: {str(e)}")
+                        results = []
+                    logger.info(f"Scraper {name} found {len(results)} images in {loop.time() - started:.2f}s")
+                    self.stats[name].record(loop.time() - started, bool(results))
+                    for url in results:
+                        if url not in unique_results:
+                            unique_results.append(url)
+                # Replace finished scrapers, or hedge the running ones once they are overdue
+                while queue and len(unique_results) < num_images and \
+                        (len(running) < self.race_width or loop.time() >= hedge_at):
+                    launch()
+        finally:
+            # Scrapers never launched give back the trial call their breaker may have granted
+            for scraper in queue:
+                self.breakers[type(scraper).__name__].release()
+            for task, (scraper, started) in running.items():
+                task.cancel()
+                if loop.time() >= deadline:
+                    logger.warning(f"Scraper {type(scraper).__name__} timed out")
+                    self.stats[type(scraper).__name__].record(loop.time() - started, False)
+                else:
+                    self.stats[type(scraper).__name__].record_cancelled(loop.time() - started)
+
+        logger.info(f"Found {len(unique_results)} unique image URLs")
+        return unique_results[:num_images]
+
+    async def scrape_all(self, recipe_name: str, num_images: int) -> List[str]:
+        """
+        Wait for every scraper (up to the scraper timeout) and merge their results.
+        """
+        all_results = []
+        tasks = []
+
+        for scraper in self.available_scrapers():
+            task = asyncio.create_task(self.run_scraper(scraper, recipe_name, num_images), name=type(scraper).__name__)
+            tasks.append(task)
+
+        logger.info(f"Created {len(tasks)} scraper tasks")
+        if not tasks:
+            return []
+        done, pending = await asyncio.wait(tasks, timeout=self.scraper_timeout)
+
+        for task in pending:
+            logger.warning(f"Cancelling pending task for {task.get_name()}")
+            task.cancel()
+
+        for task in done:
+            try:
+                results = await task
+                logger.info(f"Scraper {task.get_name()} found {len(results)} images")
+                all_results.extend(results)
+            except Exception as e:
+                logger.error(f"Error in scraper task {task.get_name()}: {str(e)}")
+
+        # Get unique results
+        seen = set()
+        unique_results = []
+        for url in all_results:
+            if url not in seen:
+                seen.add(url)
+                unique_results.append(url)
+
+        logger.info(f"Found {len(unique_results)} unique image URLs")
+        return unique_results[:num_images]
+
+    def select_placeholders(self, num_images: int) -> List[str]:
+        selected_placeholders = []
+        for _ in range(num_images):
+            placeholder = random.choice(self.placeholder_images)
+            while placeholder in selected_placeholders and len(selected_placeholders) < len(self.placeholder_images):
+                placeholder = random.choice(self.placeholder_images)
+            selected_placeholders.append(placeholder)
+        return selected_placeholders
 
     def extract_urls_from_image_column(self, image_data: Union[str, float, int]) -> List[str]:
         logger.debug(f"Extracting URLs from image data: {image_data}")
@@ -1,32 +1,174 @@
 import logging
+import os
 from app.services.image_search import ImageSearchService
+from app.utils.cache import TTLCache
 from app.utils.data_loading import load_or_create_data
-from app.utils.recommendation_utils import get_top_recommendations
+from app.utils.image_backfill import load_backfilled_images
+from app.utils.image_cache import ImageUrlCache
+from app.utils.feature_engineering import QueryVectorBuilder
+from app.utils.scrapers.base_scraper import BaseScraper
+from app.utils.recommendation_utils import (rank_recommendations, build_recommendations,
+                                            get_top_recommendations_batch)
 
 logger = logging.getLogger(__name__)
 
+# The weights the precomputed catalog is built with
+DEFAULT_FEATURE_WEIGHTS = {
+    'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
+    'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10
+}
+
 class FlexibleRecipeRecommendationSystem:
-    def __init__(self, csv_file_path, precomputed_dir):
-        self.default_feature_weights = {
-            'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
-            'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10
-        }
-        self.image_search_service = ImageSearchService()
-        self.data = load_or_create_data(csv_file_path, precomputed_dir, self.default_feature_weights)
+    def __init__(self, csv_file_path, precomputed_dir, ann_mode='exact', ann_n_probe=8, use_inverted_index=True,
+                 weight_profiles=None, ingest_workers=None, ingest_memory_limit_mb=1024, verify_checksums=False,
+                 cache_size=1024, ranking_cache_ttl=3600, payload_cache_ttl=300,
+                 image_cache_ttl=7 * 24 * 3600, image_cache_negative_ttl=3600, http_connection_limit=100,
+                 http_connection_limit_per_host=8, http_keepalive_timeout=30, http_dns_cache_ttl=300,
+                 image_concurrency=6, image_time_budget=10, scraper_racing=True, scraper_race_width=2,
+                 scraper_timeout=60, image_verify_concurrency=4, image_verify_timeout=5,
+                 scraper_breaker_failure_rate=0.5, scraper_breaker_open_seconds=30, scraper_slow_call_seconds=10):
+        self.default_feature_weights = dict(DEFAULT_FEATURE_WEIGHTS)
+        image_cache = None
+        if image_cache_ttl > 0:
+            image_cache = ImageUrlCache(os.path.join(precomputed_dir, 'image_cache', 'image_urls.sqlite3'),
+                                        image_cache_ttl, image_cache_negative_ttl)
+        self.image_search_service = ImageSearchService(
+            image_cache=image_cache,
+            connection_limit=http_connection_limit,
+            connection_limit_per_host=http_connection_limit_per_host,
+            keepalive_timeout=http_keepalive_timeout,
+            dns_cache_ttl=http_dns_cache_ttl,
+            racing=scraper_racing,
+            race_width=scraper_race_width,
+            scraper_timeout=scraper_timeout,
+            verify_concurrency=image_verify_concurrency,
+            verify_timeout=image_verify_timeout,
+            breaker_failure_rate=scraper_breaker_failure_rate,
+            breaker_open_seconds=scraper_breaker_open_seconds,
+            slow_call_seconds=scraper_slow_call_seconds,
+            backfilled_images=load_backfilled_images(precomputed_dir)
+        )
+        # 'exact' scans the whole catalog, 'ann' serves from the ANN index and
+        # 'audit' serves the exact scan while logging the ANN recall@k against it
+        self.ann_mode = ann_mode
+        self.ann_n_probe = ann_n_probe
+        # Named weight profiles re-weight the catalog blocks at query time; missing blocks weigh zero
+        self.weight_profiles = {name: {**dict.fromkeys(self.default_feature_weights, 0.0), **weights}
+                                for name, weights in (weight_profiles or {}).items()}
+        self.data = load_or_create_data(csv_file_path, precomputed_dir, self.default_feature_weights,
+                                        build_ann_index=ann_mode != 'exact',
+                                        build_inverted_index=use_inverted_index,
+                                        build_feature_blocks=bool(self.weight_profiles),
+                                        ingest_workers=ingest_workers,
+                                        ingest_memory_limit_mb=ingest_memory_limit_mb,
+                                        verify_checksums=verify_checksums)
+        # The keyword vectorizers may still be loading; they are compiled on first use
+        self.query_builder = QueryVectorBuilder(
+            self.data['normalized_matrix'].shape[1],
+            self.data['tfidf_vectorizer_ingredients'],
+            lambda: self.data['tfidf_vectorizer_keywords'],
+            lambda: self.data['tfidf_vectorizer_keywords_name'],
+            self.data['category_dummies'], self.data['scaler']
+        )
+        # Image lookups of one request run concurrently, and any still running after
+        # image_time_budget seconds are answered with placeholders
+        self.image_concurrency = image_concurrency
+        self.image_time_budget = image_time_budget
+        # Ranked row ids only change with the catalog, so they are kept longer than
+        # the image-enriched recipes built from them
+        self.ranking_cache = TTLCache(cache_size, ranking_cache_ttl)
+        self.payload_cache = TTLCache(cache_size, payload_cache_ttl)
+
+    def profile_weights(self, profile):
+        """
+        Feature weights of a named weight profile. Raises ValueError for unknown profiles.
+        """
+        if profile not in self.weight_profiles:
+            raise ValueError(f"Unknown weight profile '{profile}'")
+        return self.weight_profiles[profile]
 
     async def get_recommendations(self, category=None, dietary_preference=None, ingredients=None,
                                   calories=None, time=None, keywords=None, keywords_name=None,
-                                  top_n=6, feature_weights=None):
+                                  top_n=6, feature_weights=None, profile=None):
         # Use the provided feature_weights, or fall back to the default if not provided
         weights = feature_weights or self.default_feature_weights
+        feature_blocks = None
+        if profile is not None:
+            # A profile weights both the query and the catalog
+            weights = self.profile_weights(profile)
+            feature_blocks = self.data['feature_blocks']
+
+        query = dict(category=category, dietary_preference=dietary_preference, ingredients=ingredients,
+                     calories=calories, time=time, keywords=keywords, keywords_name=keywords_name)
+        key = (profile, top_n, self.query_builder.canonical_query(weights, **query))
+        recommendations = self.payload_cache.get(key)
+        if recommendations is not None:
+            return list(recommendations)
+
+        ranking = self.ranking_cache.get(key)
+        if ranking is None:
+            ranking = rank_recommendations(
+                self.data['df'], self.data['normalized_matrix'],
+                self.data['tfidf_vectorizer_ingredients'],
+                self.data['tfidf_vectorizer_keywords'],
+                self.data['tfidf_vectorizer_keywords_name'],
+                self.data['category_dummies'], self.data['scaler'],
+                weights, **query, top_n=top_n,
+                ann_index=self.data.get('ann_index'), ann_mode=self.ann_mode, ann_n_probe=self.ann_n_probe,
+                category_partitions=self.data['category_partitions'],
+                inverted_index=self.data.get('inverted_index'), query_builder=self.query_builder,
+                feature_blocks=feature_blocks
+            )
+            self.ranking_cache.set(key, ranking)
+
+        recommendations = await build_recommendations(self.data['df'], self.image_search_service, *ranking, top_n,
+                                                      self.image_concurrency, self.image_time_budget)
+        # Placeholders may stand in for lookups that ran out of time, so only the ranking is kept
+        placeholders = set(self.image_search_service.placeholder_images)
+        if not any(url in placeholders for recipe in recommendations for url in recipe.Images):
+            self.payload_cache.set(key, recommendations)
+        return list(recommendations)
+
+    def close(self):
+        """
+        Release the pooled HTTP connections of the image search.
+        """
+        self.image_search_service.close()
+
+    def image_search_status(self):
+        """
+        Per-scraper statistics, circuit breaker states and timeouts of the image search.
+        """
+        return {'racing': self.image_search_service.racing, 'scrapers': self.image_search_service.scraper_stats(),
+                'url_checks': BaseScraper.url_checks.stats()}
+
+    def cache_stats(self):
+        """
+        Counters of the ranking and payload caches of get_recommendations.
+        """
+        return {'ranking': self.ranking_cache.stats(), 'payload': self.payload_cache.stats()}
+
+    async def get_recommendations_batch(self, queries, top_n=6, feature_weights=None, profile=None):
+        """
+        Recommendations for a list of queries, each a dict with the keyword arguments
+        of get_recommendations. Returns one list of recipes per query.
+        """
+        if not queries:
+            return []
+        weights = feature_weights or self.default_feature_weights
+        feature_blocks = None
+        if profile is not None:
+            weights = self.profile_weights(profile)
+            feature_blocks = self.data['feature_blocks']
 
-        return await get_top_recommendations(
-            self.data['df'], self.data['combined_matrix'], 
+        return await get_top_recommendations_batch(
+            self.data['df'], self.data['normalized_matrix'],
             self.data['tfidf_vectorizer_ingredients'],
-            self.data['tfidf_vectorizer_keywords'], 
+            self.data['tfidf_vectorizer_keywords'],
             self.data['tfidf_vectorizer_keywords_name'],
-            self.data['category_dummies'], self.data['scaler'], 
-            weights, self.image_search_service,
-            category, dietary_preference, ingredients, 
-            calories, time, keywords, keywords_name, top_n
-        )
\ No newline at end of file
+            self.data['category_dummies'], self.data['scaler'],
+            weights, self.image_search_service, queries, top_n,
+            category_partitions=self.data['category_partitions'], query_builder=self.query_builder,
+            feature_blocks=feature_blocks, image_concurrency=self.image_concurrency,
+            image_time_budget=self.image_time_budget
+        )
@@ -0,0 +1,104 @@
+import logging
+import time
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import normalize
+from app.utils.similarity_calculation import cosine_scores, query_entries, top_k
+
+logger = logging.getLogger(__name__)
+
+class ClusterPrunedIndex:
+    """
+    IVF-style approximate nearest-neighbour index over the combined feature matrix.
+
+    Rows are bucketed by their closest k-means centroid on the unit sphere. A query
+    only scores the rows of the `n_probe` clusters whose centroids are closest to it,
+    so `n_probe` trades recall for latency.
+    """
+
+    def __init__(self, n_clusters=None, n_probe=8, training_sample=100000, random_state=42):
+        self.n_clusters = n_clusters
+        self.n_probe = n_probe
+        self.training_sample = training_sample
+        self.random_state = random_state
+        self.centroids = None
+        self.order = None
+        self.offsets = None
+        self.n_rows = 0
+
+    def fit(self, matrix, chunk_size=20000):
+        """
+        Cluster the rows of the matrix and build the inverted cluster lists.
+        """
+        start = time.time()
+        matrix = normalize(matrix.tocsr())
+        self.n_rows = matrix.shape[0]
+        n_clusters = min(self.n_clusters or max(1, int(np.sqrt(self.n_rows))), self.n_rows)
+
+        sample = matrix
+        if self.n_rows > self.training_sample:
+            rng = np.random.RandomState(self.random_state)
+            sample = matrix[rng.choice(self.n_rows, self.training_sample, replace=False)]
+
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=4096, n_init=3,
+                                 random_state=self.random_state)
+        kmeans.fit(sample)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+        # Assign every row to its most similar centroid, in chunks to bound memory
+        labels = np.empty(self.n_rows, dtype=np.int32)
+        for begin in range(0, self.n_rows, chunk_size):
+            end = min(begin + chunk_size, self.n_rows)
+            labels[begin:end] = np.asarray(matrix[begin:end] @ self.centroids.T).argmax(axis=1)
+
+        self.order = np.argsort(labels, kind='stable').astype(np.int32)
+        counts = np.bincount(labels, minlength=n_clusters)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        logger.info(f"Built ANN index with {n_clusters} clusters over {self.n_rows} rows "
+                    f"in {time.time() - start:.1f}s")
+        return self
+
+    def search(self, query_vector, n_probe=None):
+        """
+        Return the row ids of the `n_probe` clusters closest to the query vector.
+        """
+        columns, values = query_entries(query_vector)
+        centroid_scores = self.centroids[:, columns] @ values.astype(np.float32)
+        n_probe = max(1, min(n_probe or self.n_probe, len(centroid_scores)))
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probed])
+
+def recall_at_k(exact_indices, approximate_indices):
+    """
+    Fraction of the exact top-k rows that the approximate search also returned.
+    """
+    exact = set(int(i) for i in exact_indices)
+    if not exact:
+        return 1.0
+    return len(exact.intersection(int(i) for i in approximate_indices)) / len(exact)
+
+def evaluate_recall(index, normalized_matrix, query_vectors, k=18, n_probe_values=(1, 2, 4, 8, 16, 32)):
+    """
+    Sweep `n_probe` and report mean recall@k against the exact scan and mean query latency.
+    """
+    exact_top = []
+    for query_vector in query_vectors:
+        exact_top.append(top_k(cosine_scores(query_vector, normalized_matrix), k))
+
+    report = []
+    for n_probe in n_probe_values:
+        recalls, latencies = [], []
+        for query_vector, exact in zip(query_vectors, exact_top):
+            start = time.perf_counter()
+            candidates = index.search(query_vector, n_probe)
+            scores = cosine_scores(query_vector, normalized_matrix[candidates])
+            approximate = candidates[top_k(scores, k)]
+            latencies.append(time.perf_counter() - start)
+            recalls.append(recall_at_k(exact, approximate))
+        report.append({
+            'n_probe': n_probe,
+            'recall_at_k': float(np.mean(recalls)),
+            'latency_ms': float(np.mean(latencies) * 1000)
+        })
+    return report
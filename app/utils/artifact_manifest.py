@@ -0,0 +1,102 @@
+"""
+Manifest of a precomputed artifact set: the on-disk schema version, a fingerprint of the
+source CSV it was built from, and the size and SHA-256 of every artifact file.
+
+Loading compares sizes and the source fingerprint, which costs a few stat calls; the
+checksums are only re-read when verification is asked for, since that reads every byte
+of the memory-mapped arrays.
+"""
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_FILE = 'manifest.json'
+# Bump whenever the layout or encoding of the artifact files changes
+SCHEMA_VERSION = 1
+# Files that are rebuilt or rewritten on their own and are not part of a build
+UNTRACKED_FILES = {MANIFEST_FILE, 'update_state.json', 'ann_index.joblib', 'inverted_index.joblib',
+                   'feature_blocks.joblib', 'build.lock'}
+# Directories of scratch and runtime state kept next to the artifacts
+UNTRACKED_DIRS = {'ingest_shards', 'image_cache', 'image_backfill', 'extraction_cache'}
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def csv_fingerprint(csv_file_path):
+    """
+    Size, modification time and SHA-256 of the source CSV; None if it does not exist.
+    """
+    if not os.path.exists(csv_file_path):
+        return None
+    stat = os.stat(csv_file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_checksum(csv_file_path)}
+
+def artifact_files(precomputed_dir):
+    """
+    Paths of the artifact files of a build, relative to the artifact directory.
+    """
+    paths = []
+    for root, dirs, files in os.walk(precomputed_dir):
+        dirs[:] = [d for d in dirs if d not in UNTRACKED_DIRS]
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), precomputed_dir)
+            if path not in UNTRACKED_FILES and not name.endswith('.tmp'):
+                paths.append(path)
+    return sorted(paths)
+
+def write_manifest(precomputed_dir, source):
+    """
+    Record the current artifact files, with `source` the fingerprint of the CSV they derive from.
+    """
+    manifest = {
+        'schema_version': SCHEMA_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'source': source,
+        'artifacts': {path: {'bytes': os.path.getsize(os.path.join(precomputed_dir, path)),
+                             'sha256': file_checksum(os.path.join(precomputed_dir, path))}
+                      for path in artifact_files(precomputed_dir)}
+    }
+    path = os.path.join(precomputed_dir, MANIFEST_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+    return manifest
+
+def load_manifest(precomputed_dir):
+    path = os.path.join(precomputed_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def manifest_problems(precomputed_dir, manifest, csv_file_path, verify_checksums=False):
+    """
+    Reasons the artifact set no longer matches its manifest or its source CSV; empty if it does.
+    A missing CSV is not a problem, so artifact sets can be deployed without it.
+    """
+    if manifest.get('schema_version') != SCHEMA_VERSION:
+        return [f"schema version {manifest.get('schema_version')} is not {SCHEMA_VERSION}"]
+
+    problems = []
+    for path, entry in manifest['artifacts'].items():
+        full_path = os.path.join(precomputed_dir, path)
+        if not os.path.exists(full_path):
+            problems.append(f"{path} is missing")
+        elif os.path.getsize(full_path) != entry['bytes']:
+            problems.append(f"{path} has {os.path.getsize(full_path)} bytes, expected {entry['bytes']}")
+        elif verify_checksums and file_checksum(full_path) != entry['sha256']:
+            problems.append(f"{path} does not match its checksum")
+
+    source = manifest.get('source')
+    if source is not None and os.path.exists(csv_file_path):
+        stat = os.stat(csv_file_path)
+        # Same size and mtime is taken as unchanged; otherwise only the content decides
+        if stat.st_size != source['size'] or (stat.st_mtime_ns != source['mtime_ns'] and
+                                              file_checksum(csv_file_path) != source['sha256']):
+            problems.append(f"{csv_file_path} changed since the artifacts were built")
+    return problems
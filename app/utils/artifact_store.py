@@ -0,0 +1,250 @@
+"""
+Flat on-disk format for the precomputed artifacts. Every array is a raw .npy file that
+serving processes open with np.load(mmap_mode='r'), so all gunicorn workers share one
+page-cache copy instead of each unpickling its own.
+
+A CSR matrix is a directory with data, indices, indptr and shape arrays. A frame is a
+directory with a schema.json and, per column, either a typed value array (numeric
+columns) or a UTF-8 byte buffer with offsets (text columns, plus a second offset level
+for list-of-string columns).
+
+Files are written beside their target and renamed into place, so a process that still
+has the previous version mapped keeps reading it intact.
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+LOCK_FILE = 'build.lock'
+# Rows whose byte ranges merge_frames slices per batch, bounding its per-row Python objects
+MERGE_CHUNK_ROWS = 65536
+# Directory -> [thread lock, nesting depth, open lock file] of the locks this process holds
+_directory_locks = {}
+_directory_locks_guard = threading.Lock()
+
+@contextmanager
+def directory_lock(directory):
+    """
+    Exclusive lock on an artifact directory across processes, held while the block runs.
+    Gunicorn workers start together, so whatever builds or rewrites artifacts takes it.
+    Nested use in the same thread is allowed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _directory_locks_guard:
+        entry = _directory_locks.setdefault(os.path.realpath(directory), [threading.RLock(), 0, None])
+    with entry[0]:
+        if entry[1] == 0:
+            entry[2] = open(os.path.join(directory, LOCK_FILE), 'a')
+            if fcntl is not None:
+                fcntl.flock(entry[2], fcntl.LOCK_EX)
+        entry[1] += 1
+        try:
+            yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                # Closing the file releases the flock
+                entry[2].close()
+                entry[2] = None
+
+def dump_joblib(path, obj):
+    """
+    joblib.dump beside the target and rename into place, so no reader sees a partial file.
+    """
+    joblib.dump(obj, f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+
+def save_array(directory, name, array):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.npy')
+    with open(f'{path}.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(f'{path}.tmp', path)
+
+def load_array(directory, name, mmap_mode='r'):
+    return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+
+def save_csr(directory, matrix):
+    """
+    Write a CSR matrix as raw data, indices, indptr and shape arrays.
+    """
+    matrix = matrix.tocsr()
+    save_array(directory, 'data', matrix.data)
+    save_array(directory, 'indices', matrix.indices)
+    save_array(directory, 'indptr', matrix.indptr)
+    save_array(directory, 'shape', np.array(matrix.shape, dtype=np.int64))
+
+def load_csr(directory, mmap_mode='r'):
+    """
+    CSR matrix whose arrays are memory-mapped from the files written by save_csr.
+    """
+    shape = tuple(int(n) for n in load_array(directory, 'shape', mmap_mode=None))
+    return csr_matrix((load_array(directory, 'data', mmap_mode), load_array(directory, 'indices', mmap_mode),
+                       load_array(directory, 'indptr', mmap_mode)), shape=shape, copy=False)
+
+def encode_strings(values):
+    """
+    UTF-8 byte buffer and (n + 1) offsets for a sequence of strings.
+    """
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def column_kind(series):
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return 'numeric'
+    if len(series) and all(isinstance(value, list) for value in series):
+        return 'list'
+    return 'text'
+
+def column_arrays(series, kind):
+    """
+    The arrays a column is stored as, keyed by file suffix ('' for numeric values).
+    """
+    if kind == 'numeric':
+        return {'': series.to_numpy()}
+    if kind == 'text':
+        nulls = series.isna().to_numpy()
+        buffer, offsets = encode_strings(['' if null else str(value) for value, null in zip(series, nulls)])
+        return {'.bytes': buffer, '.offsets': offsets, '.nulls': nulls}
+    lengths = np.fromiter((len(value) for value in series), dtype=np.int64, count=len(series))
+    row_offsets = np.zeros(len(series) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=row_offsets[1:])
+    buffer, offsets = encode_strings([str(item) for value in series for item in value])
+    return {'.bytes': buffer, '.offsets': offsets, '.rows': row_offsets}
+
+def save_frame(directory, df, kinds=None):
+    """
+    Write a dataframe column by column, replacing whatever the directory held;
+    list items are stored as strings. kinds fixes the kind of the columns it names
+    instead of inferring it from their values.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    schema = {'n_rows': len(df), 'columns': []}
+    for position, column in enumerate(df.columns):
+        kind = (kinds or {}).get(column) or column_kind(df[column])
+        stem = f'column_{position}'
+        for suffix, array in column_arrays(df[column], kind).items():
+            save_array(directory, f'{stem}{suffix}', array)
+        schema['columns'].append({'name': column, 'kind': kind, 'stem': stem})
+    with open(os.path.join(directory, 'schema.json'), 'w') as f:
+        json.dump(schema, f)
+
+def append_frame(directory, df):
+    """
+    Append the rows of a dataframe with the same columns to a frame written by save_frame.
+    Only the new rows are encoded; offset arrays are shifted past the existing buffers.
+    """
+    with open(os.path.join(directory, 'schema.json')) as f:
+        schema = json.load(f)
+    for column in schema['columns']:
+        stem = column['stem']
+        for suffix, array in column_arrays(df[column['name']], column['kind']).items():
+            existing = load_array(directory, f'{stem}{suffix}', mmap_mode=None)
+            if suffix in ('.offsets', '.rows'):
+                array = array[1:] + existing[-1]
+            save_array(directory, f'{stem}{suffix}', np.concatenate([existing, array]))
+    schema['n_rows'] += len(df)
+    with open(os.path.join(directory, 'schema.json.tmp'), 'w') as f:
+        json.dump(schema, f)
+    os.replace(os.path.join(directory, 'schema.json.tmp'), os.path.join(directory, 'schema.json'))
+
+def load_schema(directory):
+    with open(os.path.join(directory, 'schema.json')) as f:
+        return json.load(f)
+
+def merge_frames(sources, directory, order=None, fill=None):
+    """
+    Write the rows of the frames at sources, concatenated, as one frame: in the given
+    row order when there is one, with missing numeric values of the columns in fill
+    (column -> value) filled. Columns are merged one at a time, so only one column of
+    the result is ever in memory. The sources must have the same columns and kinds.
+
+    Raises:
+        ValueError: If the sources disagree on their columns or column kinds
+    """
+    schemas = [load_schema(source) for source in sources]
+    layout = [(column['name'], column['kind']) for column in schemas[0]['columns']]
+    for source, schema in zip(sources, schemas):
+        if [(column['name'], column['kind']) for column in schema['columns']] != layout:
+            raise ValueError(f"Frame {source} does not have the columns and kinds of {sources[0]}")
+    n_rows = sum(schema['n_rows'] for schema in schemas)
+    order = np.arange(n_rows) if order is None else np.asarray(order, dtype=np.int64)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    schema = {'n_rows': len(order), 'columns': []}
+    for position, (column, kind) in enumerate(layout):
+        stem = f'column_{position}'
+        parts = [(source, source_schema['columns'][position]['stem'])
+                 for source, source_schema in zip(sources, schemas)]
+        if kind == 'numeric':
+            values = np.concatenate([load_array(source, source_stem) for source, source_stem in parts])
+            if fill and column in fill and values.dtype.kind == 'f':
+                values = np.where(np.isnan(values), fill[column], values)
+            save_array(directory, stem, values[order])
+        else:
+            for suffix, array in merged_strings(parts, kind, order).items():
+                save_array(directory, f'{stem}{suffix}', array)
+        schema['columns'].append({'name': column, 'kind': kind, 'stem': stem})
+    with open(os.path.join(directory, 'schema.json'), 'w') as f:
+        json.dump(schema, f)
+
+def merged_strings(parts, kind, order):
+    """
+    The arrays of a text or list column concatenated from (frame, stem) parts and
+    reordered. A list row's strings are contiguous, so both kinds move whole byte ranges.
+    """
+    def concatenated(suffix):
+        arrays = [load_array(source, f'{stem}{suffix}') for source, stem in parts]
+        if suffix not in ('.offsets', '.rows'):
+            return np.concatenate(arrays)
+        shifted, base = [np.zeros(1, dtype=np.int64)], 0
+        for array in arrays:
+            shifted.append(array[1:] + base)
+            base += int(array[-1])
+        return np.concatenate(shifted)
+
+    buffer = memoryview(concatenated('.bytes'))
+    offsets = concatenated('.offsets')
+    if kind == 'text':
+        starts, ends = offsets[:-1][order], offsets[1:][order]
+        merged = {'.offsets': counts_to_offsets(ends - starts), '.nulls': concatenated('.nulls')[order]}
+    else:
+        rows = concatenated('.rows')
+        starts, ends = offsets[rows[:-1][order]], offsets[rows[1:][order]]
+        counts = np.diff(rows)[order]
+        row_offsets = counts_to_offsets(counts)
+        # Index of every string of the output rows, row after row
+        string_order = np.repeat(rows[:-1][order] - row_offsets[:-1], counts) + np.arange(row_offsets[-1])
+        merged = {'.offsets': counts_to_offsets(np.diff(offsets)[string_order]), '.rows': row_offsets}
+    pieces = [b''.join([buffer[start:end] for start, end in zip(starts[i:i + MERGE_CHUNK_ROWS].tolist(),
+                                                                ends[i:i + MERGE_CHUNK_ROWS].tolist())])
+              for i in range(0, len(order), MERGE_CHUNK_ROWS)]
+    merged['.bytes'] = np.frombuffer(b''.join(pieces), dtype=np.uint8)
+    return merged
+
+def counts_to_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+def replace_directory(source, target):
+    """
+    Move a directory written elsewhere on the same filesystem over target.
+    """
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(source, target)
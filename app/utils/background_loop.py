@@ -0,0 +1,65 @@
+"""
+An asyncio event loop running forever on a daemon thread.
+
+Flask runs every async view on a fresh event loop that is closed when the request ends,
+so anything bound to a loop (an aiohttp session and its connection pool) cannot outlive
+a request there. Coroutines submitted here all run on one long-lived loop instead.
+"""
+import asyncio
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+class BackgroundLoop:
+    def __init__(self, name='background-loop'):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            # A forked worker inherits the loop object but not its thread
+            if self.loop is not None and self._pid == os.getpid():
+                return self.loop
+            self.loop = asyncio.new_event_loop()
+            self._pid = os.getpid()
+            started = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self.loop, started), name=self.name, daemon=True)
+            self._thread.start()
+            started.wait()
+            logger.info(f"Started event loop thread {self.name}")
+            return self.loop
+
+    @staticmethod
+    def _run(loop, started):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedule the coroutine on the loop; returns a concurrent.futures.Future of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    async def run(self, coro):
+        """
+        Await the coroutine on the loop from any other event loop. Cancelling the
+        caller cancels the coroutine.
+        """
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self, timeout=5):
+        with self._lock:
+            if self.loop is None or self._pid != os.getpid():
+                return
+            loop, thread = self.loop, self._thread
+            self.loop = self._thread = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
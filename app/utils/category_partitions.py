@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+def sort_by_category(df):
+    """
+    Reorder the catalog so that every category occupies a contiguous block of rows.
+    """
+    return df.sort_values('RecipeCategory', kind='stable', na_position='last').reset_index(drop=True)
+
+def category_order(categories):
+    """
+    Row permutation that sort_by_category applies to a catalog with these categories.
+    """
+    return pd.Series(list(categories)).sort_values(kind='stable', na_position='last').index.values
+
+def build_category_partitions(categories):
+    """
+    Map each category to the [start, end) row range it occupies in a category-sorted catalog.
+
+    Raises:
+        ValueError: If a category is split across several row ranges
+    """
+    codes, uniques = pd.factorize(pd.Series(categories))
+    if len(codes) == 0:
+        return {}
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(codes)]])
+
+    partitions = {}
+    for start, end in zip(starts, ends):
+        if codes[start] < 0:
+            continue  # rows without a category
+        category = uniques[codes[start]]
+        if category in partitions:
+            raise ValueError(f"Catalog is not sorted by category: '{category}' is not contiguous")
+        partitions[category] = (int(start), int(end))
+    return partitions
+
+def category_rows(category_partitions, category):
+    """
+    Rows of a category: a slice for a single row range, an ascending index array for a
+    category that incremental updates have appended further ranges to.
+    """
+    ranges = category_partitions.get(category, (0, 0))
+    if isinstance(ranges, tuple):
+        return slice(*ranges)
+    return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+def extend_category_partitions(category_partitions, categories, offset):
+    """
+    Partitions after appending a category-sorted block of rows at row `offset`.
+    """
+    partitions = dict(category_partitions)
+    for category, (start, end) in build_category_partitions(categories).items():
+        ranges = partitions.get(category, [])
+        ranges = [ranges] if isinstance(ranges, tuple) else list(ranges)
+        partitions[category] = ranges + [(start + offset, end + offset)]
+    return partitions
@@ -0,0 +1,88 @@
+"""
+Circuit breaker for an unreliable upstream source.
+
+Closed: calls go through and their outcomes are kept over a sliding window. Once at
+least `min_calls` are in the window and the share of failed or slow calls reaches
+`failure_rate`, the breaker opens. Open: calls are refused for `open_seconds`. Half-open:
+a single trial call is let through; it closes the breaker if it succeeds and opens it
+again if it fails.
+"""
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitBreaker:
+    def __init__(self, failure_rate=0.5, window=20, min_calls=5, open_seconds=30, slow_call_seconds=10,
+                 clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.clock = clock
+        self.outcomes = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+
+    def allow(self):
+        """
+        Whether a call may go through now. In the half-open state only one trial call is
+        allowed; its outcome must be reported with record() or release().
+        """
+        if self.state == OPEN and self.clock() - self.opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, success, latency=0.0):
+        """
+        Report the outcome of an allowed call. Calls slower than slow_call_seconds count as failures.
+        """
+        failed = not success or latency > self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            self._trial_running = False
+            if failed:
+                self._open()
+            else:
+                self.state = CLOSED
+                self.outcomes.clear()
+            return
+        self.outcomes.append(failed)
+        if self.state == CLOSED and len(self.outcomes) >= self.min_calls and \
+                sum(self.outcomes) / len(self.outcomes) >= self.failure_rate:
+            self._open()
+
+    def release(self):
+        """
+        Report an allowed call that was cancelled before it had an outcome.
+        """
+        if self.state == HALF_OPEN:
+            self._trial_running = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = self.clock()
+        self.times_opened += 1
+        self.outcomes.clear()
+
+    def snapshot(self):
+        snapshot = {
+            'state': self.state,
+            'recent_calls': len(self.outcomes),
+            'recent_failure_rate': round(sum(self.outcomes) / len(self.outcomes), 3) if self.outcomes else 0.0,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected
+        }
+        if self.state == OPEN:
+            snapshot['retry_in_seconds'] = round(max(self.opened_at + self.open_seconds - self.clock(), 0.0), 1)
+        return snapshot
@@ -1,47 +1,401 @@
+import json
+import logging
 import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import joblib
+import numpy as np
 from scipy.sparse import save_npz, load_npz
 import pandas as pd
-from app.utils.data_preprocessing import preprocess_data
-from app.utils.feature_engineering import create_feature_matrices
-
-def load_or_create_data(csv_file_path, precomputed_dir, feature_weights):
-    files = ['df', 'tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
-             'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']
-    
-    if all(os.path.exists(os.path.join(precomputed_dir, f'{f}.joblib')) for f in files) and \
-       os.path.exists(os.path.join(precomputed_dir, 'combined_matrix.npz')):
-        return load_precomputed_data(precomputed_dir)
-    else:
-        return compute_and_save_data(csv_file_path, precomputed_dir, feature_weights)
-
-def load_precomputed_data(precomputed_dir):
-    data = {}
-    for f in ['df', 'tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
-              'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']:
-        data[f] = joblib.load(os.path.join(precomputed_dir, f'{f}.joblib'))
-    data['combined_matrix'] = load_npz(os.path.join(precomputed_dir, 'combined_matrix.npz'))
+from app.utils.feature_engineering import create_feature_matrices, feature_block_layout, fit_column_scalers
+from app.utils.ingestion import ingest_csv
+from app.utils.similarity_calculation import normalize_matrix
+from app.utils.category_partitions import category_order, build_category_partitions
+from app.utils.ann_index import ClusterPrunedIndex
+from app.utils.inverted_index import BlockMaxInvertedIndex
+from app.utils.feature_blocks import FeatureBlocks
+from app.utils.artifact_store import (save_array, save_frame, save_csr, load_csr, directory_lock,
+                                      dump_joblib, merge_frames, replace_directory)
+from app.utils.recipe_store import RecipeStore
+from app.utils.artifact_manifest import load_manifest, write_manifest, manifest_problems, csv_fingerprint
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FILES = [
+    'tfidf_vectorizer_ingredients.joblib', 'tfidf_vectorizer_keywords.joblib',
+    'tfidf_vectorizer_keywords_name.joblib', 'scaler.joblib', 'categories.joblib',
+    'category_partitions.joblib', 'row_norms.npy',
+    os.path.join('df', 'schema.json'), os.path.join('normalized_matrix', 'shape.npy')
+]
+UPDATE_STATE_FILE = 'update_state.json'
+# Not needed to build the first query vector; they finish loading in the background
+DEFERRED_ARTIFACTS = ['tfidf_vectorizer_keywords', 'tfidf_vectorizer_keywords_name']
+
+def load_or_create_data(csv_file_path, precomputed_dir, feature_weights, build_ann_index=False,
+                        build_inverted_index=False, build_feature_blocks=False, ingest_workers=None,
+                        ingest_memory_limit_mb=1024, verify_checksums=False):
+    """
+    Open the artifact set, rebuilding it if it is missing, was built by another schema
+    version or from another CSV, or no longer matches its manifest.
+
+    The returned dict holds a 'startup_report' with the time of every phase and the
+    load time and size of every artifact, which is also logged as JSON.
+    """
+    start = time.time()
+    report = {'phases': {}, 'artifacts': {}}
+    with timed_phase(report, 'upgrade'):
+        upgrade_legacy_artifacts(precomputed_dir)
+    with timed_phase(report, 'manifest'):
+        problems = artifact_set_problems(csv_file_path, precomputed_dir, verify_checksums)
+
+    data = None
+    if problems:
+        with timed_phase(report, 'build'), directory_lock(precomputed_dir):
+            # Workers starting together all find the set missing; the first to get the lock
+            # builds it and the others load what it wrote
+            problems = artifact_set_problems(csv_file_path, precomputed_dir, verify_checksums)
+            if problems:
+                logger.info(f"Building artifacts: {'; '.join(problems)}")
+                data = compute_and_save_data(csv_file_path, precomputed_dir, feature_weights, ingest_workers,
+                                             ingest_memory_limit_mb)
+    if data is None and load_update_state(precomputed_dir).get('refit_scheduled'):
+        with timed_phase(report, 'refit'), directory_lock(precomputed_dir):
+            # Another worker may have refit the catalog while this one waited for the lock
+            if load_update_state(precomputed_dir).get('refit_scheduled'):
+                data = refit_catalog(precomputed_dir, feature_weights)
+    if data is None:
+        # apply_delta rewrites the matrix and store under the lock, so the set is opened under it too
+        with timed_phase(report, 'load'), directory_lock(precomputed_dir):
+            data = load_precomputed_data(precomputed_dir, defer=DEFERRED_ARTIFACTS, report=report)
+
+    if build_ann_index:
+        with timed_phase(report, 'ann_index'):
+            data['ann_index'] = load_or_create_ann_index(precomputed_dir, data['normalized_matrix'])
+    if build_inverted_index:
+        with timed_phase(report, 'inverted_index'):
+            data['inverted_index'] = load_or_create_inverted_index(precomputed_dir, data)
+    if build_feature_blocks:
+        with timed_phase(report, 'feature_blocks'):
+            data['feature_blocks'] = load_or_create_feature_blocks(precomputed_dir, data, feature_weights)
+
+    report['total_seconds'] = round(time.time() - start, 4)
+    data['startup_report'] = report
+    logger.info(f"Startup report: {json.dumps(report)}")
     return data
 
-def compute_and_save_data(csv_file_path, precomputed_dir, feature_weights):
-    df = preprocess_data(pd.read_csv(csv_file_path))
-    results = create_feature_matrices(df, feature_weights)
+@contextmanager
+def timed_phase(report, phase):
+    start = time.time()
+    yield
+    report['phases'][phase] = round(time.time() - start, 4)
+
+def artifact_set_problems(csv_file_path, precomputed_dir, verify_checksums=False):
+    """
+    Reasons the artifact set has to be rebuilt; empty if it can be loaded.
+    """
+    missing = [f for f in ARTIFACT_FILES if not os.path.exists(os.path.join(precomputed_dir, f))]
+    if missing:
+        return [f"{f} is missing" for f in missing]
+    manifest = load_manifest(precomputed_dir)
+    if manifest is None:
+        # Artifact sets from before manifests were written are adopted as they are
+        with directory_lock(precomputed_dir):
+            if load_manifest(precomputed_dir) is None:
+                write_manifest(precomputed_dir, csv_fingerprint(csv_file_path))
+        return []
+    return manifest_problems(precomputed_dir, manifest, csv_file_path, verify_checksums)
+
+def upgrade_legacy_artifacts(precomputed_dir):
+    """
+    Bring an artifact set of pickled joblib files up to the current on-disk format.
+    """
+    if not is_legacy_artifact_set(precomputed_dir):
+        return
+    with directory_lock(precomputed_dir):
+        # Every worker of a fresh deploy finds the legacy set; the first to get the lock upgrades it
+        if not is_legacy_artifact_set(precomputed_dir):
+            return
+        logger.info("Upgrading legacy artifact set")
+        upgrade_combined_matrix(precomputed_dir)
+        upgrade_category_order(precomputed_dir)
+        upgrade_artifact_format(precomputed_dir)
+
+def is_legacy_artifact_set(precomputed_dir):
+    legacy_files = ['df', 'tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
+                    'tfidf_vectorizer_keywords_name', 'category_dummies', 'scaler']
+    return all(os.path.exists(os.path.join(precomputed_dir, f'{f}.joblib')) for f in legacy_files)
+
+def save_npz_atomic(path, matrix):
+    with open(f'{path}.tmp', 'wb') as f:
+        save_npz(f, matrix)
+    os.replace(f'{path}.tmp', path)
+
+def upgrade_combined_matrix(precomputed_dir):
+    """
+    Convert an older artifact set that only has combined_matrix.npz into the
+    normalized CSR matrix and row norms used for scoring.
+    """
+    combined_path = os.path.join(precomputed_dir, 'combined_matrix.npz')
+    normalized_path = os.path.join(precomputed_dir, 'normalized_matrix.npz')
+    if os.path.exists(normalized_path) or not os.path.exists(combined_path):
+        return
+    normalized_matrix, row_norms = normalize_matrix(load_npz(combined_path))
+    save_npz_atomic(normalized_path, normalized_matrix)
+    save_array(precomputed_dir, 'row_norms', row_norms)
+
+def upgrade_category_order(precomputed_dir):
+    """
+    Reorder an artifact set built before category partitions so that every
+    category occupies a contiguous block of rows.
+    """
+    normalized_path = os.path.join(precomputed_dir, 'normalized_matrix.npz')
+    partitions_path = os.path.join(precomputed_dir, 'category_partitions.joblib')
+    if os.path.exists(partitions_path) or not os.path.exists(normalized_path):
+        return
+    df = joblib.load(os.path.join(precomputed_dir, 'df.joblib'))
+    order = category_order(df['RecipeCategory'])
+    df = df.iloc[order].reset_index(drop=True)
+    norms_path = os.path.join(precomputed_dir, 'row_norms.npy')
+    save_npz_atomic(normalized_path, load_npz(normalized_path).tocsr()[order])
+    save_array(precomputed_dir, 'row_norms', np.load(norms_path)[order])
+    dump_joblib(os.path.join(precomputed_dir, 'df.joblib'), df)
+    remove_derived_indexes(precomputed_dir)
+    dump_joblib(partitions_path, build_category_partitions(df['RecipeCategory']))
+
+def upgrade_artifact_format(precomputed_dir):
+    """
+    Rewrite the pickled dataframe and the npz matrix as memory-mappable flat arrays, and
+    drop the unnormalized combined matrix nothing reads any more.
+    """
+    df_path = os.path.join(precomputed_dir, 'df.joblib')
+    normalized_path = os.path.join(precomputed_dir, 'normalized_matrix.npz')
+    dummies_path = os.path.join(precomputed_dir, 'category_dummies.joblib')
+    combined_path = os.path.join(precomputed_dir, 'combined_matrix.npz')
+    if not os.path.exists(normalized_path):
+        return
+    save_frame(os.path.join(precomputed_dir, 'df'), joblib.load(df_path))
+    save_csr(os.path.join(precomputed_dir, 'normalized_matrix'), load_npz(normalized_path))
+    dump_joblib(os.path.join(precomputed_dir, 'categories.joblib'), list(joblib.load(dummies_path).columns))
+    for path in [df_path, normalized_path, dummies_path, combined_path]:
+        if os.path.exists(path):
+            os.remove(path)
+
+def remove_derived_indexes(precomputed_dir):
+    """
+    Drop persisted search indexes that were built over a previous matrix or row order.
+    """
+    for name in ['ann_index', 'inverted_index', 'feature_blocks']:
+        path = os.path.join(precomputed_dir, f'{name}.joblib')
+        if os.path.exists(path):
+            os.remove(path)
+
+def load_current_index(path, n_rows):
+    """
+    The persisted index at path if it was built over n_rows rows, else None. Indexes are
+    only written under the directory lock, so one that is found is complete.
+    """
+    if not os.path.exists(path):
+        return None
+    index = joblib.load(path, mmap_mode='r')
+    return index if index.n_rows == n_rows else None
+
+def load_or_create_ann_index(precomputed_dir, normalized_matrix):
+    """
+    Load the persisted ANN index, rebuilding it if it is missing or stale.
+    """
+    path = os.path.join(precomputed_dir, 'ann_index.joblib')
+    index = load_current_index(path, normalized_matrix.shape[0])
+    if index is not None:
+        return index
+    with directory_lock(precomputed_dir):
+        index = load_current_index(path, normalized_matrix.shape[0])
+        if index is None:
+            index = ClusterPrunedIndex().fit(normalized_matrix)
+            dump_joblib(path, index)
+    return index
+
+def load_or_create_inverted_index(precomputed_dir, data):
+    """
+    Load the persisted inverted index over the ingredient, keyword and keyword_name
+    TF-IDF columns, rebuilding it if it is missing or stale.
+    """
+    path = os.path.join(precomputed_dir, 'inverted_index.joblib')
+    index = load_current_index(path, data['normalized_matrix'].shape[0])
+    if index is not None:
+        return index
+    with directory_lock(precomputed_dir):
+        index = load_current_index(path, data['normalized_matrix'].shape[0])
+        if index is None:
+            layout = feature_block_layout(data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                                          data['tfidf_vectorizer_keywords_name'], data['category_dummies'])
+            columns = np.concatenate([np.arange(*layout[block])
+                                      for block in ['ingredients', 'keywords', 'keywords_name']])
+            index = BlockMaxInvertedIndex().fit(data['normalized_matrix'], columns)
+            dump_joblib(path, index)
+    return index
+
+def load_or_create_feature_blocks(precomputed_dir, data, feature_weights):
+    """
+    Load the persisted per-block feature matrix and block norms used by weight profiles,
+    rebuilding them if they are missing or stale.
+    """
+    path = os.path.join(precomputed_dir, 'feature_blocks.joblib')
+    blocks = load_current_index(path, data['normalized_matrix'].shape[0])
+    if blocks is not None:
+        return blocks
+    with directory_lock(precomputed_dir):
+        blocks = load_current_index(path, data['normalized_matrix'].shape[0])
+        if blocks is None:
+            layout = feature_block_layout(data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                                          data['tfidf_vectorizer_keywords_name'], data['category_dummies'])
+            blocks = FeatureBlocks().fit(data['normalized_matrix'], data['row_norms'], layout, feature_weights)
+            dump_joblib(path, blocks)
+    return blocks
+
+class DeferredArtifacts(dict):
+    """
+    Artifact dict whose deferred entries keep loading in the background and are only
+    waited for on first access.
+    """
+
+    def __init__(self, loaded, deferred):
+        super().__init__(loaded)
+        self.deferred = deferred
+
+    def __missing__(self, key):
+        if key not in self.deferred:
+            raise KeyError(key)
+        value = self.deferred[key].result()
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.deferred
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+def load_precomputed_data(precomputed_dir, defer=(), report=None):
+    """
+    Open an artifact set. Arrays are memory-mapped read-only, so worker processes share
+    the page cache instead of holding private copies.
+
+    Independent artifacts load in a thread pool. Those named in defer are not waited for;
+    they finish in the background and block only the first access that needs them. The
+    load time and size of each artifact are recorded in report['artifacts'].
+    """
+    def path(name):
+        return os.path.join(precomputed_dir, name)
+
+    def joblib_artifact(name):
+        return lambda: joblib.load(path(f'{name}.joblib'))
+
+    loaders = {name: (joblib_artifact(name), [f'{name}.joblib'])
+               for name in ['tfidf_vectorizer_ingredients', 'tfidf_vectorizer_keywords',
+                            'tfidf_vectorizer_keywords_name', 'scaler', 'category_partitions']}
+    loaders['df'] = (lambda: RecipeStore(path('df')), ['df'])
+    # Only the dummy column names are needed once the matrix is built
+    loaders['category_dummies'] = (lambda: pd.DataFrame(columns=pd.Index(joblib.load(path('categories.joblib')))),
+                                   ['categories.joblib'])
+    loaders['normalized_matrix'] = (lambda: load_csr(path('normalized_matrix')), ['normalized_matrix'])
+    loaders['row_norms'] = (lambda: np.load(path('row_norms.npy'), mmap_mode='r'), ['row_norms.npy'])
+
+    artifacts = {} if report is None else report.setdefault('artifacts', {})
+    executor = ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix='artifact-loader')
+    futures = {name: executor.submit(load_artifact, name, loader, [path(p) for p in paths], name in defer,
+                                     artifacts)
+               for name, (loader, paths) in loaders.items()}
+    executor.shutdown(wait=False)
+    return DeferredArtifacts({name: future.result() for name, future in futures.items() if name not in defer},
+                             {name: futures[name] for name in defer})
+
+def load_artifact(name, loader, paths, deferred, artifacts):
+    start = time.time()
+    value = loader()
+    artifacts[name] = {'seconds': round(time.time() - start, 4), 'bytes': sum(map(disk_bytes, paths)),
+                       'deferred': deferred}
+    if deferred:
+        logger.info(f"Deferred artifact {name} loaded in {artifacts[name]['seconds']:.2f}s")
+    return value
+
+def disk_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+def load_update_state(precomputed_dir):
+    """
+    Bookkeeping of the incremental updates applied since the last full fit; empty if none.
+    """
+    path = os.path.join(precomputed_dir, UPDATE_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_update_state(precomputed_dir, state):
+    path = os.path.join(precomputed_dir, UPDATE_STATE_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+def compute_and_save_data(csv_file_path, precomputed_dir, feature_weights, ingest_workers=None,
+                          ingest_memory_limit_mb=1024):
+    source = csv_fingerprint(csv_file_path)
+    store = ingest_csv(csv_file_path, os.path.join(precomputed_dir, 'df'),
+                       os.path.join(precomputed_dir, 'ingest_shards'), ingest_memory_limit_mb, ingest_workers)
+    return save_catalog(store, precomputed_dir, feature_weights, source)
+
+def refit_catalog(precomputed_dir, feature_weights):
+    """
+    Refit the vectorizers and scalers on the live rows of an incrementally updated catalog.
+    The catalog is refit from its own rows, since updates are not in the CSV it was built from.
+    """
+    df_dir = os.path.join(precomputed_dir, 'df')
+    store = RecipeStore(df_dir)
+    live = np.arange(len(store)) if store.tombstones is None else np.flatnonzero(~np.asarray(store.tombstones))
+    logger.info(f"Refitting the catalog on {len(live)} live rows")
+    order = live[category_order(np.array(store['RecipeCategory'], dtype=object)[live])]
+    scratch_dir = os.path.join(precomputed_dir, 'ingest_shards')
+    os.makedirs(scratch_dir, exist_ok=True)
+    merged_dir = tempfile.mkdtemp(prefix=f'refit_{os.getpid()}_', dir=scratch_dir)
+    merge_frames([df_dir], merged_dir, order=order)
+    replace_directory(merged_dir, df_dir)
+    source = (load_manifest(precomputed_dir) or {}).get('source')
+    return save_catalog(RecipeStore(df_dir), precomputed_dir, feature_weights, source)
+
+def save_catalog(store, precomputed_dir, feature_weights, source=None):
+    """
+    Fit the feature matrices on the preprocessed, category-sorted catalog already written
+    to precomputed_dir/df and write the rest of the artifact set with a manifest; source
+    is the fingerprint of the CSV it derives from.
+    """
+    results = create_feature_matrices(store, feature_weights)
     combined_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, \
-    tfidf_vectorizer_keywords_name, category_dummies, scaler = results
+    tfidf_vectorizer_keywords_name, categories, scaler = results
+    normalized_matrix, row_norms = normalize_matrix(combined_matrix)
 
     os.makedirs(precomputed_dir, exist_ok=True)
-    data = {
-        'df': df,
+    remove_derived_indexes(precomputed_dir)
+    if os.path.exists(os.path.join(precomputed_dir, UPDATE_STATE_FILE)):
+        os.remove(os.path.join(precomputed_dir, UPDATE_STATE_FILE))
+
+    objects = {
         'tfidf_vectorizer_ingredients': tfidf_vectorizer_ingredients,
         'tfidf_vectorizer_keywords': tfidf_vectorizer_keywords,
         'tfidf_vectorizer_keywords_name': tfidf_vectorizer_keywords_name,
-        'category_dummies': category_dummies,
         'scaler': scaler,
-        'combined_matrix': combined_matrix
+        'column_scalers': fit_column_scalers(store),
+        'categories': categories,
+        'category_partitions': build_category_partitions(store['RecipeCategory'])
     }
-    for name, obj in data.items():
-        if name == 'combined_matrix':
-            save_npz(os.path.join(precomputed_dir, f'{name}.npz'), obj)
-        else:
-            joblib.dump(obj, os.path.join(precomputed_dir, f'{name}.joblib'))
-    return data
\ No newline at end of file
+    for name, obj in objects.items():
+        dump_joblib(os.path.join(precomputed_dir, f'{name}.joblib'), obj)
+    save_csr(os.path.join(precomputed_dir, 'normalized_matrix'), normalized_matrix)
+    save_array(precomputed_dir, 'row_norms', row_norms)
+    write_manifest(precomputed_dir, source)
+
+    # Serve from the files just written so a fresh build shares memory like a restart would
+    return load_precomputed_data(precomputed_dir)
@@ -40,33 +40,108 @@ def parse_r_vector(s):
         logger.warning(f"Error parsing R vector: {s}, Error: {str(e)}")
         return []
 
+NUMERICAL_COLUMNS = ['Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount']
+BOOL_COLUMNS = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free',
+                'is_low carb', 'is_keto', 'is_paleo']
+R_VECTOR_COLUMNS = ['RecipeIngredientParts', 'RecipeInstructions', 'RecipeIngredientQuantities']
+LIST_COLUMNS = ['Keywords', 'keywords_name']
+TEXT_COLUMNS = ['Name', 'RecipeCategory', 'Description', 'Images']
+# How preprocess_chunk's output is stored, whatever the values of a single chunk look like
+COLUMN_KINDS = {**dict.fromkeys(NUMERICAL_COLUMNS + BOOL_COLUMNS, 'numeric'),
+                **dict.fromkeys(R_VECTOR_COLUMNS + LIST_COLUMNS, 'list'),
+                **dict.fromkeys(TEXT_COLUMNS, 'text')}
+
+LIST_ITEM = r'(?:\'[^\'\\\r\n\x00]*\'|"[^"\\\r\n\x00]*")'
+# Only the whitespace Python's tokenizer accepts between list items
+LIST_SPACE = r'[ \t\f\r\n]*'
+SIMPLE_LIST = re.compile(rf'\[{LIST_SPACE}(?:{LIST_ITEM}{LIST_SPACE},{LIST_SPACE})*(?:{LIST_ITEM}{LIST_SPACE})?\]')
+LIST_SCAN = re.compile(r'([\'"])([^\x00]*?)\1|(\x00)')
+# A name applied to arguments, such as c(...) or character(0), is never a Python literal
+CALL_EXPRESSION = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\(.*\)', re.DOTALL)
+
+def parse_list_string_column(values):
+    """
+    parse_list_string over a whole column. Lists of plain quoted strings are read in one
+    regex pass, call-like R strings are kept whole as literal_eval would leave them, and
+    only the remaining cells go through ast.literal_eval.
+
+    Returns:
+        One list of tokens per cell
+    """
+    cells = list(values)
+    simple = [isinstance(cell, str) and SIMPLE_LIST.fullmatch(cell) is not None for cell in cells]
+    simple_cells = [cell for cell, is_simple in zip(cells, simple) if is_simple]
+    matches = np.array(LIST_SCAN.findall('\x00'.join(simple_cells)), dtype=object).reshape(-1, 3)
+    separators = matches[:, 2] != ''
+    scanned = iter(split_tokens(*collect_tokens(matches[:, 1], separators, ~separators, len(simple_cells))))
+
+    rows = []
+    for cell, is_simple in zip(cells, simple):
+        if is_simple:
+            rows.append(next(scanned))
+        elif isinstance(cell, str) and CALL_EXPRESSION.fullmatch(cell):
+            rows.append([cell])
+        else:
+            rows.append(parse_list_string(cell))
+    return rows
+
+def collect_tokens(tokens, separators, keep, n_rows):
+    """
+    Flat tokens and offsets from a scan over NUL-joined cells, where separators marks
+    the cell boundaries and keep the matches that are tokens of their cell.
+    """
+    rows = np.cumsum(separators)
+    counts = np.bincount(rows[keep], minlength=n_rows)
+    return tokens[keep].tolist(), counts_to_offsets(counts)
+
+def counts_to_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+def split_tokens(tokens, offsets):
+    """
+    Per-row token lists from flat tokens and offsets.
+    """
+    offsets = offsets.tolist()
+    return [tokens[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
 def preprocess_data(df):
     """
     Preprocess the dataframe by handling boolean, numerical, and list-like columns.
     """
-    bool_columns = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free', 
-                    'is_low carb', 'is_keto', 'is_paleo']
-    for col in bool_columns:
+    df = preprocess_chunk(df)
+    return fill_numerical_medians(df, {col: df[col].median() for col in NUMERICAL_COLUMNS})
+
+def preprocess_chunk(df):
+    """
+    The row-local part of preprocess_data. Missing numerical values are left as NaN,
+    since their median has to be taken over the whole dataset.
+    """
+    for col in BOOL_COLUMNS:
         df[col] = df[col].map({'TRUE': 1, 'FALSE': 0, True: 1, False: 0}).fillna(0).astype(int)
     
-    numerical_columns = ['Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount']
-    for col in numerical_columns:
+    for col in NUMERICAL_COLUMNS:
         df[col] = pd.to_numeric(df[col], errors='coerce')
-        median_value = df[col].median()
-        df[col] = df[col].fillna(median_value)
     
     # Handle R vector format columns
-    r_vector_columns = ['RecipeIngredientParts', 'RecipeInstructions', 'RecipeIngredientQuantities']
-    for col in r_vector_columns:
+    for col in R_VECTOR_COLUMNS:
         df[col] = df[col].apply(parse_r_vector)
     
     # Handle regular list columns
-    list_columns = ['Keywords', 'keywords_name']
-    for col in list_columns:
-        df[col] = df[col].apply(parse_list_string)
+    for col in LIST_COLUMNS:
+        df[col] = pd.Series(parse_list_string_column(df[col]), index=df.index, dtype=object)
     
     return df
 
+def fill_numerical_medians(df, medians):
+    """
+    Fill missing numerical values with the given per-column medians.
+    """
+    for col in NUMERICAL_COLUMNS:
+        df[col] = df[col].fillna(medians[col])
+    return df
+
 def parse_list_string(s):
     """
     Safely parse list-like strings.
@@ -0,0 +1,106 @@
+import logging
+import time
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from app.utils.similarity_calculation import query_entries, row_block
+
+logger = logging.getLogger(__name__)
+
+# create_feature_matrices always stacks the rating block with this weight
+RATING_WEIGHT = 0.05
+
+class FeatureBlocks:
+    """
+    Unweighted per-block feature columns of the catalog with the squared norm of every
+    block of every row.
+
+    A weight profile scales the blocks at query time: the cosine against the catalog
+    re-weighted by `weights` is (U @ (q * w)) / |q| / sqrt(block_norms @ w**2), so any
+    number of profiles can be served without materializing a matrix per profile.
+    """
+
+    def __init__(self):
+        self.n_rows = 0
+        self.blocks = []
+        self.block_sizes = None
+        self.matrix = None
+        self.block_norms = None
+        self._profile_cache = {}
+
+    def fit(self, normalized_matrix, row_norms, layout, feature_weights):
+        """
+        Recover the unweighted blocks from the normalized matrix, its row norms and the
+        feature weights it was built with.
+        """
+        start = time.time()
+        self.blocks = list(layout)
+        self.block_sizes = np.array([layout[block][1] - layout[block][0] for block in self.blocks])
+        build_weights = self.block_weights(feature_weights)
+        if np.any(build_weights == 0):
+            raise ValueError("Feature blocks cannot be recovered from a matrix built with a zero block weight")
+
+        combined_matrix = diags(row_norms) @ normalized_matrix
+        self.matrix = csr_matrix(combined_matrix @ diags(1 / np.repeat(build_weights, self.block_sizes)))
+        self.n_rows = self.matrix.shape[0]
+
+        block_of_column = np.repeat(np.arange(len(self.blocks)), self.block_sizes)
+        indicator = csr_matrix((np.ones(len(block_of_column)), (np.arange(len(block_of_column)), block_of_column)),
+                               shape=(len(block_of_column), len(self.blocks)))
+        self.block_norms = np.asarray((self.matrix.multiply(self.matrix) @ indicator).todense())
+        self._profile_cache = {}
+
+        logger.info(f"Built {len(self.blocks)} feature blocks over {self.n_rows} rows in {time.time() - start:.1f}s")
+        return self
+
+    def block_weights(self, feature_weights):
+        """
+        Weight of every block in layout order; blocks missing from the dict weigh zero,
+        except the rating block which keeps its build-time weight.
+        """
+        weights = {'rating': RATING_WEIGHT, **feature_weights}
+        return np.array([float(weights.get(block, 0.0)) for block in self.blocks])
+
+    def profile(self, feature_weights):
+        """
+        Column scalings and catalog row norms for a weight profile, cached per profile.
+        """
+        weights = self.block_weights(feature_weights)
+        key = tuple(weights)
+        if key not in self._profile_cache:
+            self._profile_cache[key] = (np.repeat(weights, self.block_sizes),
+                                        np.sqrt(self.block_norms @ (weights * weights)))
+        return self._profile_cache[key]
+
+    def cosine_scores(self, query_vector, feature_weights, rows=None):
+        """
+        Cosine similarity of the query against the catalog re-weighted by the profile.
+        If rows is given (an index array or a slice), only those rows are scored.
+        """
+        column_weights, norms = self.profile(feature_weights)
+        matrix = self.matrix
+        if isinstance(rows, slice):
+            matrix = row_block(matrix, rows.start, rows.stop)
+            norms = norms[rows]
+        elif rows is not None:
+            matrix = matrix[rows]
+            norms = norms[rows]
+
+        columns, values = query_entries(query_vector)
+        query_norm = np.sqrt(np.dot(values, values))
+        if query_norm == 0:
+            return np.zeros(matrix.shape[0])
+        query = np.zeros(matrix.shape[1])
+        query[columns] = values / query_norm * column_weights[columns]
+        scores = matrix @ query
+        return np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
+
+    def batch_cosine_scores(self, query_matrix, feature_weights):
+        """
+        (n_queries, n_rows) cosine scores of stacked queries against the re-weighted catalog.
+        """
+        column_weights, norms = self.profile(feature_weights)
+        queries = query_matrix.toarray()
+        query_norms = np.sqrt(np.einsum('ij,ij->i', queries, queries))
+        query_norms[query_norms == 0] = 1
+        scores = np.ascontiguousarray((self.matrix @ (queries / query_norms[:, None] * column_weights).T).T)
+        return np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
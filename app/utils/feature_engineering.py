@@ -1,12 +1,20 @@
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import MinMaxScaler
-from scipy.sparse import hstack
+from scipy.sparse import hstack, csr_matrix
 import pandas as pd
 import numpy as np
+import math
+import re
 
-def create_feature_matrices(df, feature_weights):
+DIETARY_COLUMNS = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free',
+                   'is_low carb', 'is_keto', 'is_paleo']
+SCALED_COLUMNS = ['Calories', 'TotalTime_minutes', 'AggregatedRating']
+
+def create_feature_matrices(store, feature_weights):
     """
-    Create feature matrices for the recommendation system.
+    Create feature matrices for the recommendation system from a RecipeStore. Text
+    columns are streamed into the vectorizers, so only their vocabularies and the
+    resulting sparse matrices are held in memory.
     """
     tfidf_vectorizer_ingredients = TfidfVectorizer(
         stop_words='english',
@@ -15,43 +23,88 @@ def create_feature_matrices(df, feature_weights):
         min_df=1
     )
     
-    ingredients_text = df['RecipeIngredientParts'].apply(lambda x: ' '.join(x) if x else '')
-    tfidf_matrix_ingredients = tfidf_vectorizer_ingredients.fit_transform(ingredients_text)
+    tfidf_matrix_ingredients = tfidf_vectorizer_ingredients.fit_transform(joined_lists(store, 'RecipeIngredientParts'))
 
     tfidf_vectorizer_keywords = TfidfVectorizer(stop_words='english', max_features=3000)
     tfidf_vectorizer_keywords_name = TfidfVectorizer(stop_words='english', max_features=3000)
     
-    keywords_text = df['Keywords'].apply(lambda x: ' '.join(x) if x else '')
-    keywords_name_text = df['keywords_name'].apply(lambda x: ' '.join(x) if x else '')
-    
-    tfidf_matrix_keywords = tfidf_vectorizer_keywords.fit_transform(keywords_text)
-    tfidf_matrix_keywords_name = tfidf_vectorizer_keywords_name.fit_transform(keywords_name_text)
+    tfidf_matrix_keywords = tfidf_vectorizer_keywords.fit_transform(joined_lists(store, 'Keywords'))
+    tfidf_matrix_keywords_name = tfidf_vectorizer_keywords_name.fit_transform(joined_lists(store, 'keywords_name'))
 
-    category_dummies = pd.get_dummies(df['RecipeCategory'])
-    category_matrix = category_dummies.values
+    # The columns pd.get_dummies would give, as a sparse matrix
+    codes, categories = pd.factorize(pd.Series(store['RecipeCategory']), sort=True)
+    rows = np.flatnonzero(codes >= 0)
+    category_matrix = csr_matrix((np.ones(len(rows), dtype=bool), (rows, codes[rows])),
+                                 shape=(len(store), len(categories)))
 
-    dietary_columns = ['is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free', 
-                     'is_low carb', 'is_keto', 'is_paleo']
-    dietary_matrix = df[dietary_columns].values
+    dietary_matrix = np.column_stack([np.asarray(store[col]) for col in DIETARY_COLUMNS])
 
     scaler = MinMaxScaler()
-    calories_matrix = scaler.fit_transform(df[['Calories']].values)
-    time_matrix = scaler.fit_transform(df[['TotalTime_minutes']].values)
-    rating_matrix = scaler.fit_transform(df[['AggregatedRating']].values)
-
-    combined_matrix = hstack([
-        tfidf_matrix_ingredients * feature_weights['ingredients'],
-        category_matrix * feature_weights['category'],
-        dietary_matrix * feature_weights['dietary'],
-        calories_matrix * feature_weights['calories'],
-        time_matrix * feature_weights['time'],
-        tfidf_matrix_keywords * feature_weights['keywords'],
-        tfidf_matrix_keywords_name * feature_weights['keywords_name'],
-        rating_matrix * 0.05  # Small weight for ratings in base similarity
-    ])
+    calories_matrix = scaler.fit_transform(column_vector(store, 'Calories'))
+    time_matrix = scaler.fit_transform(column_vector(store, 'TotalTime_minutes'))
+    rating_matrix = scaler.fit_transform(column_vector(store, 'AggregatedRating'))
+
+    combined_matrix = stack_feature_blocks(tfidf_matrix_ingredients, category_matrix, dietary_matrix,
+                                           calories_matrix, time_matrix, tfidf_matrix_keywords,
+                                           tfidf_matrix_keywords_name, rating_matrix, feature_weights)
 
     return (combined_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, 
-            tfidf_vectorizer_keywords_name, category_dummies, scaler)
+            tfidf_vectorizer_keywords_name, list(categories), scaler)
+
+def joined_lists(store, column):
+    """
+    The documents of a list column, one space-joined string per row, decoded as they are read.
+    """
+    return (' '.join(x) if x else '' for x in store.iter_column(column))
+
+def column_vector(frame, column):
+    """
+    A numerical column of a dataframe or RecipeStore as the (n, 1) array scalers expect.
+    """
+    return np.asarray(frame[column]).reshape(-1, 1)
+
+def stack_feature_blocks(ingredients, category, dietary, calories, time, keywords, keywords_name, rating,
+                         feature_weights):
+    """
+    Weight the per-block feature matrices and stack them in feature_block_layout order.
+    """
+    return hstack([
+        ingredients * feature_weights['ingredients'],
+        category * feature_weights['category'],
+        dietary * feature_weights['dietary'],
+        calories * feature_weights['calories'],
+        time * feature_weights['time'],
+        keywords * feature_weights['keywords'],
+        keywords_name * feature_weights['keywords_name'],
+        rating * 0.05  # Small weight for ratings in base similarity
+    ])
+
+def fit_column_scalers(df):
+    """
+    The MinMaxScaler that create_feature_matrices fits for each scaled numerical column.
+    It only keeps the last one, which query vectors use for calories and time.
+    """
+    return {col: MinMaxScaler().fit(column_vector(df, col)) for col in SCALED_COLUMNS}
+
+def transform_feature_matrix(df, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
+                             tfidf_vectorizer_keywords_name, categories, column_scalers, feature_weights):
+    """
+    Combined feature rows for new recipes with the vocabularies, categories and scalers of
+    an existing build frozen, so the rows line up with its matrix. Categories the build
+    did not see get an all-zero category block.
+    """
+    category_matrix = df['RecipeCategory'].to_numpy(dtype=object)[:, None] == np.array(categories, dtype=object)
+    return stack_feature_blocks(
+        tfidf_vectorizer_ingredients.transform(df['RecipeIngredientParts'].apply(lambda x: ' '.join(x) if x else '')),
+        category_matrix,
+        df[DIETARY_COLUMNS].values,
+        column_scalers['Calories'].transform(df[['Calories']].values),
+        column_scalers['TotalTime_minutes'].transform(df[['TotalTime_minutes']].values),
+        tfidf_vectorizer_keywords.transform(df['Keywords'].apply(lambda x: ' '.join(x) if x else '')),
+        tfidf_vectorizer_keywords_name.transform(df['keywords_name'].apply(lambda x: ' '.join(x) if x else '')),
+        column_scalers['AggregatedRating'].transform(df[['AggregatedRating']].values),
+        feature_weights
+    )
 
 def create_query_vector(combined_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
                         tfidf_vectorizer_keywords_name, category_dummies, scaler, feature_weights, **kwargs):
@@ -115,4 +168,197 @@ def create_query_vector(combined_matrix, tfidf_vectorizer_ingredients, tfidf_vec
             keywords_name_query.toarray() * feature_weights['keywords_name']
         )
 
-    return query_vector
\ No newline at end of file
+    return query_vector
+
+def feature_block_layout(tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                         category_dummies):
+    """
+    Column range of each feature block in the combined matrix, in the order create_feature_matrices stacks them.
+    """
+    sizes = [
+        ('ingredients', len(tfidf_vectorizer_ingredients.vocabulary_)),
+        ('category', category_dummies.shape[1]),
+        ('dietary', 7),
+        ('calories', 1),
+        ('time', 1),
+        ('keywords', len(tfidf_vectorizer_keywords.vocabulary_)),
+        ('keywords_name', len(tfidf_vectorizer_keywords_name.vocabulary_)),
+        ('rating', 1)
+    ]
+    layout = {}
+    position = 0
+    for name, size in sizes:
+        layout[name] = (position, position + size)
+        position += size
+    return layout
+
+
+class CompiledTfidf:
+    """
+    Token -> (column, idf) lookup compiled from a fitted TfidfVectorizer.
+
+    Reproduces the vectorizer's word analyzer (lowercasing, token pattern, stop words,
+    word n-grams) and its l2-normalized tf-idf arithmetic for a single short document.
+    Vectorizers configured any other way fall back to their own transform.
+    """
+
+    def __init__(self, vectorizer):
+        self.vectorizer = vectorizer
+        self.size = len(vectorizer.vocabulary_)
+        self.supported = (vectorizer.analyzer == 'word' and vectorizer.tokenizer is None and
+                          vectorizer.preprocessor is None and vectorizer.strip_accents is None and
+                          vectorizer.input == 'content' and not vectorizer.binary and vectorizer.use_idf and
+                          not vectorizer.sublinear_tf and vectorizer.norm == 'l2')
+        self.lowercase = vectorizer.lowercase
+        self.token_pattern = re.compile(vectorizer.token_pattern)
+        self.stop_words = vectorizer.get_stop_words() or frozenset()
+        self.ngram_range = vectorizer.ngram_range
+        idf = vectorizer.idf_
+        self.lookup = {term: (int(column), float(idf[column])) for term, column in vectorizer.vocabulary_.items()}
+
+    def terms(self, text):
+        """
+        The analyzed terms of the text, n-grams included. The tf-idf row depends on nothing else.
+        """
+        if not self.supported:
+            return self.vectorizer.build_analyzer()(text)
+
+        if self.lowercase:
+            text = text.lower()
+        tokens = [token for token in self.token_pattern.findall(text) if token not in self.stop_words]
+        min_n, max_n = self.ngram_range
+        terms = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            terms.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    def transform(self, text):
+        """
+        Column ids (ascending) and values of the tf-idf row for the text.
+        """
+        if not self.supported:
+            row = self.vectorizer.transform([text])
+            row.sort_indices()
+            return list(row.indices), list(row.data)
+
+        counts = {}
+        for term in self.terms(text):
+            entry = self.lookup.get(term)
+            if entry is not None:
+                counts[entry] = counts.get(entry, 0) + 1
+
+        entries = sorted(counts.items())
+        columns = [column for (column, _), _ in entries]
+        values = [float(count) * idf for (_, idf), count in entries]
+
+        # Same order of operations as sklearn's in-place l2 row normalization
+        squares = 0.0
+        for value in values:
+            squares += value * value
+        if squares != 0.0:
+            norm = math.sqrt(squares)
+            values = [value / norm for value in values]
+        return columns, values
+
+class QueryVectorBuilder:
+    """
+    Builds query vectors as 1-row CSR matrices from lookup tables compiled from the fitted
+    vectorizers, category dummies and scaler. The result has the same values as
+    create_query_vector without allocating a dense row or running the sklearn transform pipeline.
+
+    A vectorizer may also be given as a zero-argument callable returning it, in which case
+    it is only fetched and compiled the first time a query uses its block.
+    """
+
+    def __init__(self, n_features, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
+                 tfidf_vectorizer_keywords_name, category_dummies, scaler):
+        self.n_features = n_features
+        self._vectorizers = {'ingredients': tfidf_vectorizer_ingredients, 'keywords': tfidf_vectorizer_keywords,
+                             'keywords_name': tfidf_vectorizer_keywords_name}
+        self._compiled = {}
+        self.category_index = {category: i for i, category in enumerate(category_dummies.columns)}
+        self.n_categories = category_dummies.shape[1]
+        self.scale = float(scaler.scale_[0])
+        self.offset = float(scaler.min_[0])
+        self.clip = scaler.feature_range if getattr(scaler, 'clip', False) else None
+
+    def compiled(self, block):
+        """
+        The CompiledTfidf of a text block, compiled on first use.
+        """
+        if block not in self._compiled:
+            vectorizer = self._vectorizers[block]
+            self._compiled[block] = CompiledTfidf(vectorizer() if callable(vectorizer) else vectorizer)
+        return self._compiled[block]
+
+    def _scale(self, value):
+        scaled = float(value) * self.scale + self.offset
+        if self.clip is not None:
+            scaled = min(max(scaled, self.clip[0]), self.clip[1])
+        return scaled
+
+    def build(self, feature_weights, **kwargs):
+        """
+        Create a query vector based on user input, as a (1, n_features) CSR matrix.
+        """
+        columns, values = [], []
+
+        def add(position, block_columns, block_values, weight):
+            for column, value in zip(block_columns, block_values):
+                weighted = value * weight
+                if weighted != 0:
+                    columns.append(position + column)
+                    values.append(weighted)
+
+        # Block offsets follow create_query_vector, which only advances past a
+        # TF-IDF block when that field is present in the query
+        position = 0
+        if kwargs.get('ingredients'):
+            ingredients = self.compiled('ingredients')
+            add(0, *ingredients.transform(' '.join(kwargs['ingredients'])), feature_weights['ingredients'])
+            position += ingredients.size
+
+        category = kwargs.get('category')
+        if category and category in self.category_index:
+            add(position, [self.category_index[category]], [1.0], feature_weights['category'])
+        position += self.n_categories
+
+        if kwargs.get('dietary_preference') in DIETARY_COLUMNS:
+            add(position, [DIETARY_COLUMNS.index(kwargs['dietary_preference'])], [1.0], feature_weights['dietary'])
+        position += len(DIETARY_COLUMNS)
+
+        add(position, [0], [self._scale(kwargs.get('calories') or 0)], feature_weights['calories'])
+        position += 1
+        add(position, [0], [self._scale(kwargs.get('time') or 0)], feature_weights['time'])
+        position += 1
+
+        if kwargs.get('keywords'):
+            keywords = self.compiled('keywords')
+            add(position, *keywords.transform(' '.join(kwargs['keywords'])), feature_weights['keywords'])
+            position += keywords.size
+
+        if kwargs.get('keywords_name'):
+            add(position, *self.compiled('keywords_name').transform(' '.join(kwargs['keywords_name'])),
+                feature_weights['keywords_name'])
+
+        return csr_matrix((np.array(values, dtype=np.float64), np.array(columns, dtype=np.int32),
+                           np.array([0, len(values)], dtype=np.int32)), shape=(1, self.n_features))
+
+    def canonical_query(self, feature_weights, **kwargs):
+        """
+        A hashable key that is equal for queries ranked the same way: the text fields are
+        reduced to their sorted analyzed terms, so case, list order and stop words do not
+        matter. Calories and time stay as given, since the ranking penalizes by them.
+        """
+        def text_key(block):
+            # Whether the field is present shifts the following blocks, so it is part of the key
+            if not kwargs.get(block):
+                return None
+            return tuple(sorted(self.compiled(block).terms(' '.join(kwargs[block]))))
+
+        dietary_preference = kwargs.get('dietary_preference')
+        return (kwargs.get('category') or None,
+                dietary_preference if dietary_preference in DIETARY_COLUMNS else None,
+                kwargs.get('calories'), kwargs.get('time'),
+                text_key('ingredients'), text_key('keywords'), text_key('keywords_name'),
+                tuple(sorted(feature_weights.items())))
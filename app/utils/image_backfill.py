@@ -0,0 +1,170 @@
+"""
+Offline backfill of image URLs for the catalog recipes whose Images column holds none,
+so that serving them does not need live scraping.
+
+The job runs the scrapers of ImageSearchService with a bounded number of lookups in
+flight and a per-host request rate, and appends every finished lookup to a progress
+log. An interrupted run resumes from that log. The found URLs are compacted into
+image_backfill/images.json in the artifact directory, keyed like the image cache by the
+normalized recipe name, which the service loads at startup.
+
+    python -m app.utils.image_backfill [--concurrency 8] [--host-rate 2] [--limit N] [--retry-misses]
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from app.services.image_search import ImageSearchService
+from app.utils.circuit_breaker import CLOSED
+from app.utils.image_cache import recipe_key
+from app.utils.rate_limit import HostRateLimiter
+from app.utils.recipe_store import RecipeStore
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_DIR = 'image_backfill'
+PROGRESS_FILE = 'progress.jsonl'
+IMAGES_FILE = 'images.json'
+REPORT_FILE = 'report.json'
+
+def load_backfilled_images(precomputed_dir):
+    """
+    recipe_key -> image URLs found by the backfill job; empty if it never ran.
+    """
+    path = os.path.join(precomputed_dir, BACKFILL_DIR, IMAGES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def load_progress(path):
+    """
+    recipe_key -> URLs of every finished lookup in the progress log ([] for a miss).
+    A torn last line from an interrupted run is ignored.
+    """
+    progress = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                progress[entry['key']] = entry['urls']
+    return progress
+
+def write_images(directory, progress):
+    path = os.path.join(directory, IMAGES_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({key: urls for key, urls in progress.items() if urls}, f)
+    os.replace(f'{path}.tmp', path)
+
+def catalog_image_needs(store, service):
+    """
+    The number of live rows with stored image URLs, and the recipe_key of every live
+    row without any (with one recipe name per key, for the lookup).
+    """
+    stored = 0
+    missing_keys = []
+    names = {}
+    for i in range(len(store)):
+        if store.tombstones is not None and store.tombstones[i]:
+            continue
+        if service.extract_urls_from_image_column(store.value('Images', i)):
+            stored += 1
+            continue
+        name = store.value('Name', i)
+        key = recipe_key(name)
+        missing_keys.append(key)
+        names.setdefault(key, name)
+    return stored, missing_keys, names
+
+async def backfill_images(precomputed_dir, concurrency=8, host_rate=2.0, num_images=3, limit=None,
+                          retry_misses=False, checkpoint_every=100):
+    """
+    Look up images for the recipes without stored ones that no earlier run finished
+    (or missed, with retry_misses), at most `limit` of them. Returns the run report.
+    """
+    start = time.time()
+    directory = os.path.join(precomputed_dir, BACKFILL_DIR)
+    os.makedirs(directory, exist_ok=True)
+    progress_path = os.path.join(directory, PROGRESS_FILE)
+
+    service = ImageSearchService(trace_configs=[HostRateLimiter(host_rate).trace_config()])
+    store = RecipeStore(os.path.join(precomputed_dir, 'df'))
+    stored, missing_keys, names = catalog_image_needs(store, service)
+    progress = load_progress(progress_path)
+    pending = [key for key in names if key not in progress or (retry_misses and not progress[key])]
+    if limit is not None:
+        pending = pending[:limit]
+    logger.info(f"{len(names)} recipes without stored images, {len(pending)} to look up")
+
+    counts = {'looked_up': 0, 'found': 0, 'missed': 0, 'deferred': 0}
+    queue = iter(pending)
+
+    async def worker(progress_file):
+        for key in queue:
+            try:
+                urls = await service.scrape_images(names[key], num_images)
+            except Exception as e:
+                logger.error(f"Error looking up images for {names[key]}: {str(e)}")
+                urls = []
+            # A miss while some source was skipped by its breaker is left for the next run
+            if not urls and any(breaker.state != CLOSED for breaker in service.breakers.values()):
+                counts['deferred'] += 1
+                continue
+            progress[key] = urls
+            progress_file.write(json.dumps({'key': key, 'urls': urls}) + '\n')
+            counts['looked_up'] += 1
+            counts['found' if urls else 'missed'] += 1
+            if counts['looked_up'] % checkpoint_every == 0:
+                progress_file.flush()
+                write_images(directory, progress)
+                elapsed = time.time() - start
+                logger.info(f"Looked up {counts['looked_up']}/{len(pending)} recipes "
+                            f"({counts['looked_up'] / elapsed:.2f}/s), {counts['found']} with images")
+
+    try:
+        with open(progress_path, 'a') as progress_file:
+            await asyncio.gather(*(worker(progress_file) for _ in range(concurrency)))
+    finally:
+        await service._close_session()
+        write_images(directory, progress)
+
+    elapsed = time.time() - start
+    live_rows = stored + len(missing_keys)
+    backfilled_rows = sum(1 for key in missing_keys if progress.get(key))
+    report = {
+        **counts,
+        'seconds': round(elapsed, 1),
+        'lookups_per_second': round(counts['looked_up'] / elapsed, 3) if elapsed else 0.0,
+        'live_rows': live_rows,
+        'rows_with_stored_images': stored,
+        'rows_backfilled': backfilled_rows,
+        'recipes_remaining': sum(1 for key in names if key not in progress),
+        'coverage_before': round(stored / live_rows, 4) if live_rows else 0.0,
+        'coverage_after': round((stored + backfilled_rows) / live_rows, 4) if live_rows else 0.0,
+        'scrapers': service.scraper_stats()
+    }
+    with open(os.path.join(directory, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Image backfill: {json.dumps({k: v for k, v in report.items() if k != 'scrapers'})}")
+    return report
+
+if __name__ == '__main__':
+    import argparse
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Look up images offline for recipes without stored images')
+    parser.add_argument('--concurrency', type=int, default=8, help='Recipe lookups in flight at once')
+    parser.add_argument('--host-rate', type=float, default=2.0, help='Requests per second to any one host')
+    parser.add_argument('--limit', type=int, help='Look up at most this many recipes in this run')
+    parser.add_argument('--retry-misses', action='store_true', help='Look up again recipes that found no images')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # The per-lookup logging of the service and scrapers would drown the progress reports
+    logging.getLogger('app.services.image_search').setLevel(logging.WARNING)
+    logging.getLogger('app.utils.scrapers').setLevel(logging.CRITICAL)
+    asyncio.run(backfill_images(Config.PRECOMPUTED_DIR, args.concurrency, args.host_rate, limit=args.limit,
+                                retry_misses=args.retry_misses))
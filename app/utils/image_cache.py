@@ -0,0 +1,106 @@
+"""
+Disk-backed cache of the image URLs found by the scrapers, shared by every worker
+process serving from the same artifact directory.
+
+Lookups that found images are kept for `ttl` seconds; lookups that found none are
+cached negatively for the shorter `negative_ttl`, so a recipe the scrapers know nothing
+about is not scraped again on every request but is retried once in a while.
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def recipe_key(recipe_name):
+    """
+    Cache key of a recipe: its name, lowercased with whitespace collapsed.
+    """
+    return re.sub(r'\s+', ' ', str(recipe_name)).strip().lower()
+
+class ImageUrlCache:
+    def __init__(self, path, ttl=7 * 24 * 3600, negative_ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS image_urls (key TEXT PRIMARY KEY, urls TEXT NOT NULL, '
+                               'requested INTEGER NOT NULL, expires_at REAL NOT NULL)')
+
+    def _connect(self):
+        # One short-lived connection per call, so the cache can be used from any thread
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, recipe_name, num_images):
+        """
+        The cached URLs of the recipe ([] for a negative entry), or None if there is no
+        live entry from a lookup for at least num_images images.
+        """
+        try:
+            with self._connect() as connection:
+                row = connection.execute('SELECT urls, requested FROM image_urls WHERE key = ? AND expires_at > ?',
+                                         (recipe_key(recipe_name), time.time())).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading image cache: {str(e)}")
+            return None
+        if row is None:
+            return None
+        urls = json.loads(row[0])
+        # A lookup for fewer images says nothing about whether more exist
+        if row[1] < num_images and len(urls) < num_images:
+            return None
+        return urls[:num_images]
+
+    def set(self, recipe_name, num_images, urls):
+        ttl = self.ttl if urls else self.negative_ttl
+        try:
+            with self._connect() as connection:
+                connection.execute('INSERT OR REPLACE INTO image_urls VALUES (?, ?, ?, ?)',
+                                   (recipe_key(recipe_name), json.dumps(urls), num_images, time.time() + ttl))
+        except sqlite3.Error as e:
+            logger.error(f"Error writing image cache: {str(e)}")
+
+    def purge_expired(self):
+        """
+        Delete the expired entries; returns how many there were.
+        """
+        with self._connect() as connection:
+            return connection.execute('DELETE FROM image_urls WHERE expires_at <= ?', (time.time(),)).rowcount
+
+class InFlightLookups:
+    """
+    Coalesces concurrent lookups of the same key into a single fetch. Requests are served
+    on separate threads and event loops, so the shared result is a concurrent.futures.Future.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """
+        (future, owner): the future of the key's in-flight lookup, and whether the caller
+        created it and must resolve it with finish().
+        """
+        with self._lock:
+            if key in self._futures:
+                return self._futures[key], False
+            future = self._futures[key] = concurrent.futures.Future()
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            future = self._futures.pop(key)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
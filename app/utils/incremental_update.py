@@ -0,0 +1,185 @@
+import logging
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from app.utils.artifact_manifest import load_manifest, write_manifest
+from app.utils.artifact_store import append_frame, directory_lock, dump_joblib, save_array, save_csr
+from app.utils.category_partitions import sort_by_category, extend_category_partitions
+from app.utils.data_loading import (load_precomputed_data, load_update_state, save_update_state,
+                                    remove_derived_indexes, upgrade_legacy_artifacts)
+from app.utils.data_preprocessing import preprocess_chunk, fill_numerical_medians, NUMERICAL_COLUMNS
+from app.utils.feature_engineering import transform_feature_matrix, fit_column_scalers
+from app.utils.similarity_calculation import normalize_matrix
+
+logger = logging.getLogger(__name__)
+
+# Text blocks whose vocabulary is frozen between full fits, with their vectorizer and source column
+TEXT_BLOCKS = {
+    'ingredients': ('tfidf_vectorizer_ingredients', 'RecipeIngredientParts'),
+    'keywords': ('tfidf_vectorizer_keywords', 'Keywords'),
+    'keywords_name': ('tfidf_vectorizer_keywords_name', 'keywords_name')
+}
+BASELINE_SAMPLE_ROWS = 5000
+
+def apply_delta(delta_csv_path, precomputed_dir, feature_weights, refit_drift_threshold=0.1):
+    """
+    Apply a delta CSV of new, changed and deleted recipes to an artifact set without refitting.
+
+    The delta has the columns of the recipe CSV plus an optional boolean `deleted` column,
+    and its rows are matched to the catalog by RecipeId. Catalog rows of changed or deleted
+    recipes are tombstoned; new and changed recipes are transformed with the frozen
+    vectorizers and scalers and appended. Once the out-of-vocabulary share of the rows
+    appended since the last fit exceeds the fitted catalog's own by refit_drift_threshold
+    (or that share of them has a category the fit never saw), a full refit is scheduled
+    for the next load. The derived indexes are dropped and rebuilt on that load.
+
+    Returns:
+        The update state: cumulative row counts, drift per block and whether a refit is scheduled
+    """
+    start = time.time()
+    # Workers load, refit and rebuild indexes under the same lock, so none of them maps a
+    # matrix or store that is only partly rewritten
+    with directory_lock(precomputed_dir):
+        upgrade_legacy_artifacts(precomputed_dir)
+        data = load_precomputed_data(precomputed_dir)
+        store = data['df']
+        n_rows = len(store)
+
+        delta = pd.read_csv(delta_csv_path).drop_duplicates('RecipeId', keep='last').reset_index(drop=True)
+        deleted = pd.Series(False, index=delta.index)
+        if 'deleted' in delta:
+            deleted = delta.pop('deleted').map({'TRUE': True, 'FALSE': False, True: True, False: False})
+            deleted = deleted.fillna(False).astype(bool)
+        upserts = delta[~deleted].reset_index(drop=True)
+        missing = [column for column in store.columns if column not in upserts.columns]
+        if len(upserts) and missing:
+            raise ValueError(f"Delta CSV is missing columns: {', '.join(missing)}")
+
+        tombstones = np.zeros(n_rows, dtype=bool) if store.tombstones is None else np.array(store.tombstones)
+        column_scalers = load_or_fit_column_scalers(precomputed_dir, store, tombstones)
+        medians = {col: float(np.median(np.asarray(store[col])[~tombstones])) for col in NUMERICAL_COLUMNS}
+        removed = np.isin(np.asarray(store['RecipeId']), delta['RecipeId'].to_numpy()) & ~tombstones
+        tombstones |= removed
+
+        rows = sort_by_category(fill_numerical_medians(preprocess_chunk(upserts.reindex(columns=store.columns)),
+                                                       medians))
+        categories = list(data['category_dummies'].columns)
+        new_matrix, new_norms = csr_matrix((0, data['normalized_matrix'].shape[1])), np.zeros(0)
+        if len(rows):
+            new_matrix, new_norms = normalize_matrix(transform_feature_matrix(
+                rows, data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                data['tfidf_vectorizer_keywords_name'], categories, column_scalers, feature_weights))
+
+        matrix = drop_rows(data['normalized_matrix'], tombstones)
+        save_csr(os.path.join(precomputed_dir, 'normalized_matrix'), csr_matrix(
+            (np.concatenate([matrix.data, new_matrix.data]), np.concatenate([matrix.indices, new_matrix.indices]),
+             np.concatenate([matrix.indptr, new_matrix.indptr[1:] + matrix.indptr[-1]])),
+            shape=(n_rows + len(rows), matrix.shape[1])))
+        row_norms = np.where(tombstones, 0.0, data['row_norms'])
+        save_array(precomputed_dir, 'row_norms', np.concatenate([row_norms, new_norms]))
+        dump_joblib(os.path.join(precomputed_dir, 'category_partitions.joblib'),
+                    extend_category_partitions(data['category_partitions'], rows['RecipeCategory'], n_rows))
+        if len(rows):
+            append_frame(os.path.join(precomputed_dir, 'df'), rows)
+        save_array(os.path.join(precomputed_dir, 'df'), 'tombstones',
+                   np.concatenate([tombstones, np.zeros(len(rows), dtype=bool)]))
+        remove_derived_indexes(precomputed_dir)
+        write_manifest(precomputed_dir, (load_manifest(precomputed_dir) or {}).get('source'))
+
+        state = update_drift(load_update_state(precomputed_dir), data, rows, categories, int(removed.sum()))
+        state['refit_scheduled'] = max(state['drift'].values()) > refit_drift_threshold
+        save_update_state(precomputed_dir, state)
+
+        logger.info(f"Applied delta of {len(delta)} recipes in {time.time() - start:.1f}s: {len(rows)} rows appended, "
+                    f"{int(removed.sum())} tombstoned, drift {state['drift']}, "
+                    f"refit {'scheduled' if state['refit_scheduled'] else 'not needed'}")
+    return state
+
+def load_or_fit_column_scalers(precomputed_dir, store, tombstones):
+    """
+    The per-column scalers of the last full fit. Artifact sets built before they were
+    saved have never been updated, so refitting on their rows reproduces them.
+    """
+    path = os.path.join(precomputed_dir, 'column_scalers.joblib')
+    if os.path.exists(path):
+        return joblib.load(path)
+    if tombstones.any():
+        raise ValueError("Cannot recover the column scalers of an already updated catalog; rebuild it")
+    column_scalers = fit_column_scalers(store)
+    dump_joblib(path, column_scalers)
+    return column_scalers
+
+def drop_rows(matrix, tombstones):
+    """
+    The CSR matrix with the entries of tombstoned rows removed; the rows stay, empty.
+    """
+    if not tombstones.any():
+        return matrix
+    entry_rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    keep = ~tombstones[entry_rows]
+    indptr = np.zeros(matrix.shape[0] + 1, dtype=matrix.indptr.dtype)
+    np.cumsum(np.bincount(entry_rows[keep], minlength=matrix.shape[0]), out=indptr[1:])
+    return csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+def out_of_vocabulary(vectorizer, token_lists):
+    """
+    Occurrences of analyzed terms outside the vectorizer's vocabulary, and of all terms.
+    """
+    analyzer = vectorizer.build_analyzer()
+    vocabulary = vectorizer.vocabulary_
+    missing = total = 0
+    for tokens in token_lists:
+        terms = analyzer(' '.join(tokens) if tokens else '')
+        total += len(terms)
+        missing += sum(1 for term in terms if term not in vocabulary)
+    return missing, total
+
+def vocabulary_baseline(data):
+    """
+    Out-of-vocabulary share of each text block over a sample of the fitted catalog. With
+    max_features, part of the catalog's own terms fall outside the vocabulary already.
+    """
+    store = data['df']
+    sample = np.unique(np.linspace(0, len(store) - 1, min(len(store), BASELINE_SAMPLE_ROWS)).astype(int))
+    baseline = {}
+    for block, (vectorizer, column) in TEXT_BLOCKS.items():
+        missing, total = out_of_vocabulary(data[vectorizer], (store.value(column, i) for i in sample))
+        baseline[block] = missing / total if total else 0.0
+    return baseline
+
+def update_drift(state, data, rows, categories, tombstoned):
+    """
+    Add the appended rows to the counts kept since the last fit and recompute the drift of
+    every block: how far the out-of-vocabulary share of the appended rows exceeds that of
+    the fitted catalog, or for categories the share of appended rows with a new category.
+    """
+    if 'baseline' not in state:
+        state = {'appended_rows': 0, 'tombstoned_rows': 0, 'out_of_vocabulary': {},
+                 'baseline': vocabulary_baseline(data), **state}
+    state['appended_rows'] += len(rows)
+    state['tombstoned_rows'] += tombstoned
+    counts = state['out_of_vocabulary']
+    for block, (vectorizer, column) in TEXT_BLOCKS.items():
+        missing, total = out_of_vocabulary(data[vectorizer], rows[column])
+        previous_missing, previous_total = counts.get(block, (0, 0))
+        counts[block] = (previous_missing + missing, previous_total + total)
+    unknown = int((rows['RecipeCategory'].notna() & ~rows['RecipeCategory'].isin(categories)).sum())
+    counts['category'] = (counts.get('category', (0, 0))[0] + unknown, state['appended_rows'])
+    state['drift'] = {block: max(0.0, missing / total - state['baseline'].get(block, 0.0)) if total else 0.0
+                      for block, (missing, total) in counts.items()}
+    return state
+
+if __name__ == '__main__':
+    import argparse
+    from config import Config
+    from app.services.recommendation import DEFAULT_FEATURE_WEIGHTS
+
+    parser = argparse.ArgumentParser(description='Apply a delta CSV of new, changed and deleted recipes '
+                                                 'to the precomputed artifacts')
+    parser.add_argument('delta_csv')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    apply_delta(args.delta_csv, Config.PRECOMPUTED_DIR, DEFAULT_FEATURE_WEIGHTS, Config.REFIT_DRIFT_THRESHOLD)
@@ -0,0 +1,112 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from app.utils.artifact_store import save_frame, merge_frames, replace_directory, column_kind
+from app.utils.recipe_store import RecipeStore
+from app.utils.category_partitions import category_order
+from app.utils.data_preprocessing import preprocess_chunk, NUMERICAL_COLUMNS, COLUMN_KINDS
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Parsed chunks hold Python lists and strings, a few times the size of the raw rows
+PARSED_EXPANSION = 4
+SAMPLE_ROWS = 2000
+
+def ingest_csv(csv_file_path, frame_dir, scratch_dir, memory_limit_mb=1024, workers=None):
+    """
+    Read and preprocess the raw recipe CSV in bounded chunks into a category-sorted frame.
+
+    Chunks are preprocessed in a process pool and written as columnar shards to a
+    directory of this process under scratch_dir. The chunk size is derived from
+    memory_limit_mb so that the chunks in flight stay under it. The shards are then merged
+    column by column into frame_dir, so no dataframe of the whole catalog is ever built.
+    The frame holds the rows of sort_by_category(preprocess_data(pd.read_csv(...))).
+    """
+    start = time.time()
+    workers = workers or os.cpu_count() or 1
+    sample = pd.read_csv(csv_file_path, nrows=SAMPLE_ROWS)
+    chunk_rows = estimate_chunk_rows(sample, memory_limit_mb, workers)
+    # Column kinds are fixed once, since a single chunk can be all NaN in a text column
+    kinds = {column: COLUMN_KINDS.get(column) or column_kind(sample[column]) for column in sample.columns}
+    os.makedirs(scratch_dir, exist_ok=True)
+    shard_dir = tempfile.mkdtemp(prefix=f'ingest_{os.getpid()}_', dir=scratch_dir)
+    try:
+        shards = ingest_shards(csv_file_path, shard_dir, chunk_rows, workers, kinds)
+        merged_dir = os.path.join(shard_dir, 'merged')
+        merge_shards(shards, merged_dir)
+        replace_directory(merged_dir, frame_dir)
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    store = RecipeStore(frame_dir)
+    elapsed = time.time() - start
+    logger.info(f"Ingested {len(store)} rows from {len(shards)} chunks of {chunk_rows} rows with {workers} workers "
+                f"in {elapsed:.1f}s ({len(store) / max(elapsed, 1e-9):.0f} rows/s), {peak_rss_report()}")
+    return store
+
+def ingest_shards(csv_file_path, shard_dir, chunk_rows, workers, kinds):
+    """
+    The directories of the shards the CSV was preprocessed into, in file order.
+    """
+    shards = []
+    chunks = pd.read_csv(csv_file_path, chunksize=chunk_rows)
+    if workers == 1:
+        for i, chunk in enumerate(chunks):
+            shards.append(preprocess_shard(chunk, os.path.join(shard_dir, f'shard_{i:05d}'), kinds))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Two chunks per worker in flight (one running, one queued) bounds what the reader buffers
+            pending = deque()
+            for i, chunk in enumerate(chunks):
+                if len(pending) >= 2 * workers:
+                    shards.append(pending.popleft().result())
+                pending.append(pool.submit(preprocess_shard, chunk, os.path.join(shard_dir, f'shard_{i:05d}'), kinds))
+            shards.extend(future.result() for future in pending)
+    if not shards:
+        shards.append(preprocess_shard(pd.read_csv(csv_file_path), os.path.join(shard_dir, 'shard_00000'), kinds))
+    return shards
+
+def merge_shards(shards, frame_dir):
+    """
+    Merge the shards into one category-sorted frame. Missing numerical values are filled
+    with their median over every shard, as preprocess_data does over the whole dataset.
+    """
+    stores = [RecipeStore(shard) for shard in shards]
+    medians = {col: pd.Series(np.concatenate([store[col] for store in stores])).median()
+               for col in NUMERICAL_COLUMNS}
+    categories = [category for store in stores for category in store['RecipeCategory']]
+    merge_frames(shards, frame_dir, order=category_order(categories), fill=medians)
+
+def preprocess_shard(chunk, shard_path, kinds):
+    """
+    Preprocess one chunk and write it as a columnar shard. Runs in a worker process.
+    """
+    save_frame(shard_path, preprocess_chunk(chunk), kinds)
+    return shard_path
+
+def estimate_chunk_rows(sample, memory_limit_mb, workers):
+    """
+    Rows per chunk such that every chunk in flight, parsed, fits in memory_limit_mb.
+    """
+    bytes_per_row = max(1, sample.memory_usage(deep=True).sum() / max(1, len(sample))) * PARSED_EXPANSION
+    in_flight = 2 * workers + 1
+    return max(100, int(memory_limit_mb * 2**20 / (bytes_per_row * in_flight)))
+
+def peak_rss_report():
+    if resource is None:
+        return "peak RSS unavailable"
+    # ru_maxrss is in kilobytes on Linux
+    parent = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return f"peak RSS {parent:.0f} MB (largest worker {children:.0f} MB)"
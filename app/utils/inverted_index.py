@@ -0,0 +1,185 @@
+import logging
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+from app.utils.similarity_calculation import cosine_scores, query_entries, row_block
+
+logger = logging.getLogger(__name__)
+
+class BlockMaxInvertedIndex:
+    """
+    Term -> posting list index over the TF-IDF columns of the normalized matrix.
+
+    Rows are grouped into blocks of `block_size` consecutive ids and every posting list
+    keeps its maximum weight per block. A query visits blocks in order of their score
+    upper bound and stops once no unvisited block can beat the current top-k (block-max
+    MaxScore pruning). Candidates are rescored with the same row dot product as the
+    brute-force scan, so the returned ranking is identical to it.
+
+    The other columns (categories, dietary flags, calories, time) keep their minimum and
+    maximum per block. Query entries on them, or negative ones, add to the block bounds,
+    and every row of a visited block is scored, since rows without postings no longer
+    score zero.
+    """
+
+    # Indexes persisted before the bounds were kept load without them and only serve
+    # queries that lie entirely on the posting lists
+    dense_ids = None
+
+    def __init__(self, block_size=2048):
+        self.block_size = block_size
+        self.n_rows = 0
+        self.n_blocks = 0
+        self.term_ids = None
+        self.posting_offsets = None
+        self.posting_rows = None
+        self.block_max = None
+        self.dense_ids = None
+        self.dense_min = None
+        self.dense_max = None
+
+    def fit(self, normalized_matrix, columns):
+        """
+        Build posting lists and per-block maxima for the given matrix columns.
+        """
+        start = time.time()
+        columns = np.asarray(columns, dtype=np.int64)
+        self.n_rows, n_columns = normalized_matrix.shape
+        self.n_blocks = max(1, -(-self.n_rows // self.block_size))
+
+        csc = normalized_matrix.tocsc()
+        postings = csc[:, columns]
+        postings.sort_indices()
+        self.term_ids = np.full(n_columns, -1, dtype=np.int64)
+        self.term_ids[columns] = np.arange(len(columns))
+        self.posting_offsets = postings.indptr.astype(np.int64)
+        self.posting_rows = postings.indices.astype(np.int32)
+
+        # Postings are sorted by term and then row, so (term, block) runs are contiguous
+        posting_terms = np.repeat(np.arange(len(columns)), np.diff(postings.indptr))
+        posting_blocks = postings.indices // self.block_size
+        keys = posting_terms * self.n_blocks + posting_blocks
+        if len(keys):
+            run_starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+            maxima = np.maximum.reduceat(postings.data, run_starts)
+            self.block_max = csr_matrix((maxima, (posting_terms[run_starts], posting_blocks[run_starts])),
+                                        shape=(len(columns), self.n_blocks))
+        else:
+            self.block_max = csr_matrix((len(columns), self.n_blocks))
+
+        dense_columns = np.setdiff1d(np.arange(n_columns), columns)
+        self.dense_ids = np.full(n_columns, -1, dtype=np.int64)
+        self.dense_ids[dense_columns] = np.arange(len(dense_columns))
+        self.dense_min, self.dense_max = _block_bounds(csc[:, dense_columns], self.block_size, self.n_blocks)
+
+        logger.info(f"Built inverted index over {len(columns)} terms and {len(self.posting_rows)} postings "
+                    f"in {time.time() - start:.1f}s")
+        return self
+
+    def search(self, query_vector, normalized_matrix, limit, excluded=None):
+        """
+        Exact top-`limit` row ids and cosine scores for the query, ordered like top_k.
+        Rows flagged in `excluded` are never returned.
+
+        Returns None if the query has weight outside the posting lists and the index was
+        persisted without block bounds, in which case the caller has to fall back to the full scan.
+        """
+        columns, values = query_entries(query_vector)
+        terms = self.term_ids[columns]
+        posted = (terms >= 0) & (values > 0)
+        whole_blocks = not posted.all()
+        if whole_blocks and self.dense_ids is None:
+            return None
+
+        posting_bounds, dense_bounds = np.zeros(self.n_blocks), np.zeros(self.n_blocks)
+        if len(values):
+            weights = values / np.sqrt(np.dot(values, values))
+            if posted.any():
+                posting_bounds = self.block_max[terms[posted]].T @ weights[posted]
+            # Posting columns hold TF-IDF weights, which are never negative, so negative
+            # entries on them bound at zero
+            dense = self.dense_ids[columns]
+            above, below = (dense >= 0) & (values > 0), (dense >= 0) & (values < 0)
+            dense_bounds = self.dense_max[dense[above]].T @ weights[above] + \
+                self.dense_min[dense[below]].T @ weights[below]
+        upper_bounds = posting_bounds + dense_bounds
+        terms = terms[posted]
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0)
+        threshold = -np.inf
+        visited = 0
+        for block in np.argsort(-upper_bounds, kind='stable'):
+            upper_bound = upper_bounds[block]
+            if len(best_rows) >= limit and _below(upper_bound, threshold):
+                break
+            if upper_bound <= 0 and not whole_blocks:
+                break
+            visited += 1
+            low, high = block * self.block_size, min((block + 1) * self.block_size, self.n_rows)
+            # Rows without postings score at most the dense bound, so the rest of the
+            # block is only scored while that can still reach the top-k
+            if whole_blocks and (len(best_rows) < limit or not _below(dense_bounds[block], threshold)):
+                rows = np.arange(low, high)
+                scores = cosine_scores(query_vector, row_block(normalized_matrix, low, high))
+            else:
+                rows = self.block_postings(terms, low, high)
+                scores = cosine_scores(query_vector, normalized_matrix[rows])
+            keep = scores >= threshold
+            if excluded is not None:
+                keep &= ~excluded[rows]
+            rows, scores = rows[keep], scores[keep]
+
+            best_rows, best_scores = _top_rows(np.concatenate([best_rows, rows]),
+                                               np.concatenate([best_scores, scores]), limit)
+            if len(best_rows) >= limit:
+                threshold = best_scores[-1]
+
+        if len(best_rows) < limit and not whole_blocks:
+            # Every row outside the posting lists scores zero; the full scan picks the lowest ids first
+            live = np.arange(self.n_rows) if excluded is None else np.flatnonzero(~excluded)
+            fillers = np.setdiff1d(live[:limit + len(best_rows)], best_rows)
+            best_rows, best_scores = _top_rows(np.concatenate([best_rows, fillers]),
+                                               np.concatenate([best_scores, np.zeros(len(fillers))]), limit)
+
+        logger.info(f"Inverted index visited {visited} of {self.n_blocks} blocks")
+        return best_rows, best_scores
+
+    def block_postings(self, terms, low, high):
+        """
+        Ids of the rows in [low, high) that have a posting for any of the terms.
+        """
+        block_rows = [np.empty(0, dtype=np.int64)]
+        for term in terms:
+            posting = self.posting_rows[self.posting_offsets[term]:self.posting_offsets[term + 1]]
+            first, last = np.searchsorted(posting, [low, high])
+            block_rows.append(posting[first:last])
+        return np.unique(np.concatenate(block_rows)).astype(np.int64)
+
+def _below(bound, threshold):
+    # Small slack so float rounding in a bound never prunes a tying row
+    return bound + 1e-9 * abs(bound) < threshold
+
+def _block_bounds(matrix, block_size, n_blocks):
+    """
+    Minimum and maximum of every column of a CSC matrix over each block of rows, as two
+    (columns, blocks) arrays; a block with rows lacking the entry holds a zero as well.
+    """
+    n_rows, n_columns = matrix.shape
+    minima, maxima = np.zeros((n_columns, n_blocks)), np.zeros((n_columns, n_blocks))
+    matrix.sort_indices()
+    keys = np.repeat(np.arange(n_columns), np.diff(matrix.indptr)) * n_blocks + matrix.indices // block_size
+    if len(keys):
+        run_starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        run_keys = keys[run_starts]
+        counts = np.diff(np.append(run_starts, len(keys)))
+        full = counts == np.minimum(block_size, n_rows - run_keys % n_blocks * block_size)
+        run_min = np.minimum.reduceat(matrix.data, run_starts)
+        run_max = np.maximum.reduceat(matrix.data, run_starts)
+        minima.flat[run_keys] = np.where(full, run_min, np.minimum(run_min, 0))
+        maxima.flat[run_keys] = np.where(full, run_max, np.maximum(run_max, 0))
+    return minima, maxima
+
+def _top_rows(rows, scores, limit):
+    order = np.lexsort((rows, -scores))[:limit]
+    return rows[order], scores[order]
@@ -0,0 +1,97 @@
+"""
+Memoized LLM responses: a bounded in-memory LRU in front of a SQLite store that every
+worker process shares.
+
+Entries are keyed by the normalized input and a prompt version, a hash of everything
+else that shapes the response (prompt template, model and its settings, the category
+list). When the version changes, the old entries stop matching and are purged on the
+next start.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def normalize_input(text):
+    """
+    Case-folded, with whitespace collapsed and surrounding punctuation removed.
+    """
+    return re.sub(r'\s+', ' ', str(text)).strip(' \t\n.!?,;').casefold()
+
+class LLMResponseCache:
+    def __init__(self, path, prompt_version, memory_entries=1024):
+        self.path = path
+        self.prompt_version = prompt_version
+        # Responses do not go stale for a fixed prompt, so memory entries only age out by LRU
+        self.memory = TTLCache(memory_entries, ttl=float('inf'))
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.saved_seconds = 0.0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS responses (input TEXT NOT NULL, prompt_version TEXT NOT NULL, '
+                               'output TEXT NOT NULL, latency REAL NOT NULL, created REAL NOT NULL, '
+                               'PRIMARY KEY (input, prompt_version))')
+            purged = connection.execute('DELETE FROM responses WHERE prompt_version != ?', (prompt_version,)).rowcount
+        if purged:
+            logger.info(f"Purged {purged} cached LLM responses of earlier prompt versions")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, text):
+        """
+        The cached response to the text, or None.
+        """
+        key = normalize_input(text)
+        entry = self.memory.get(key)
+        if entry is None:
+            try:
+                with self._connect() as connection:
+                    entry = connection.execute('SELECT output, latency FROM responses WHERE input = ? AND prompt_version = ?',
+                                               (key, self.prompt_version)).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading LLM response cache: {str(e)}")
+                return None
+            if entry is None:
+                return None
+            self.memory.set(key, entry)
+            with self._lock:
+                self.disk_hits += 1
+        with self._lock:
+            self.saved_seconds += entry[1]
+        return entry[0]
+
+    def set(self, text, output, latency):
+        """
+        Store a response and the seconds the LLM took to produce it.
+        """
+        key = normalize_input(text)
+        self.memory.set(key, (output, latency))
+        try:
+            with self._connect() as connection:
+                connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                   (key, self.prompt_version, output, latency, time.time()))
+        except sqlite3.Error as e:
+            logger.error(f"Error writing LLM response cache: {str(e)}")
+
+    def stats(self):
+        # Every memory miss goes to disk, so misses of both layers are the memory misses less the disk hits
+        memory = self.memory.stats()
+        lookups = memory['hits'] + memory['misses']
+        hits = memory['hits'] + self.disk_hits
+        return {
+            'prompt_version': self.prompt_version,
+            'memory_entries': memory['entries'],
+            'memory_hits': memory['hits'],
+            'disk_hits': self.disk_hits,
+            'misses': lookups - hits,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'saved_llm_seconds': round(self.saved_seconds, 3)
+        }
@@ -0,0 +1,156 @@
+"""
+Gemini calls that do not block the event loop of the request making them.
+
+Calls run on a thread pool shared by every request of the worker; its size is the cap on
+LLM calls in flight, and calls beyond it queue. Each call has a timeout that covers its
+wait in the queue as well as the request itself. Versions of google-generativeai that take
+request_options get the timeout as a transport timeout too. The pinned version takes none,
+so a call the caller gave up on keeps its pool thread until the library returns; once every
+thread holds such a call, the pool is replaced so that new calls do not queue behind them.
+Model handles are created once per model name and reused.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# Whether generate_content takes a per-request timeout (google-generativeai 0.4 and later)
+TRANSPORT_TIMEOUT = 'request_options' in inspect.signature(genai.GenerativeModel.generate_content).parameters
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+class LLMClient:
+    def __init__(self, max_concurrency=4, timeout=30):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._models = {}
+        self._executor = None
+        self._pid = None
+        # Running calls of the current pool that their callers gave up on
+        self._abandoned = set()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.finished = 0
+        self.total_seconds = 0.0
+        self.pools_replaced = 0
+
+    def configure(self, max_concurrency=None, timeout=None):
+        """
+        Change the concurrency cap or default timeout; a new cap applies to a fresh pool.
+        """
+        with self._lock:
+            if max_concurrency is not None and max_concurrency != self.max_concurrency:
+                self.max_concurrency = max_concurrency
+                if self._executor is not None and self._pid == os.getpid():
+                    self._executor.shutdown(wait=False)
+                self._executor = None
+                self._abandoned = set()
+            if timeout is not None:
+                self.timeout = timeout
+
+    def model(self, name):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = genai.GenerativeModel(name)
+            return self._models[name]
+
+    def _pool(self):
+        with self._lock:
+            # A forked worker inherits the pool object but none of its threads
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.max_concurrency, thread_name_prefix='llm')
+                self._pid = os.getpid()
+                self._abandoned = set()
+            return self._executor
+
+    def _abandon(self, pool, future, model_name):
+        # Called with the lock held, for a call that timed out while running on pool
+        if pool is not self._executor:
+            return
+        abandoned = self._abandoned
+        abandoned.add(future)
+        future.add_done_callback(abandoned.discard)
+        if len(abandoned) >= self.max_concurrency:
+            # Every thread is stuck; the old pool's threads exit once the library returns
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._abandoned = set()
+            self.pools_replaced += 1
+            logger.warning(f"All {self.max_concurrency} LLM threads are stuck on {model_name} calls; "
+                           f"starting a new pool")
+
+    def _call(self, model_name, contents, kwargs):
+        with self._lock:
+            self.in_flight += 1
+        start = time.time()
+        try:
+            return self.model(model_name).generate_content(contents, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.finished += 1
+                self.total_seconds += time.time() - start
+
+    async def generate(self, model_name, contents, timeout=None, **kwargs):
+        """
+        generate_content of the named model, awaited without blocking the event loop.
+        Raises LLMTimeoutError if no response arrives within timeout seconds.
+        """
+        timeout = timeout or self.timeout
+        if TRANSPORT_TIMEOUT and 'request_options' not in kwargs:
+            kwargs['request_options'] = {'timeout': timeout}
+        with self._lock:
+            self.calls += 1
+        pool = self._pool()
+        future = pool.submit(self._call, model_name, contents, kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # Drops the call if it is still queued
+            with self._lock:
+                self.timeouts += 1
+                if not future.cancel() and not future.done():
+                    self._abandon(pool, future, model_name)
+            logger.warning(f"{model_name} call timed out after {timeout}s")
+            raise LLMTimeoutError(f"{model_name} did not respond within {timeout}s")
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'timeout': self.timeout,
+                'calls': self.calls,
+                'in_flight': self.in_flight,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'stuck': len(self._abandoned),
+                'pools_replaced': self.pools_replaced,
+                'mean_call_seconds': round(self.total_seconds / self.finished, 3) if self.finished else 0.0
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._abandoned = set()
+
+# Shared by the extraction and image query services
+default_client = LLMClient()
@@ -0,0 +1,32 @@
+"""
+Per-host request rate limiting for aiohttp sessions.
+"""
+import asyncio
+import aiohttp
+
+class HostRateLimiter:
+    """
+    Spaces the requests to each host at least 1 / requests_per_second apart. Used on a
+    single event loop, where reserving a slot needs no lock.
+    """
+
+    def __init__(self, requests_per_second=2.0):
+        self.interval = 1.0 / requests_per_second
+        self.next_slot = {}
+
+    async def acquire(self, host):
+        loop = asyncio.get_running_loop()
+        slot = max(loop.time(), self.next_slot.get(host, 0.0))
+        self.next_slot[host] = slot + self.interval
+        await asyncio.sleep(slot - loop.time())
+
+    def trace_config(self):
+        """
+        An aiohttp TraceConfig that holds every request of a session until its host's slot.
+        """
+        async def on_request_start(session, context, params):
+            await self.acquire(params.url.host)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        return trace_config
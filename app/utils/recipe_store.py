@@ -0,0 +1,116 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from app.utils.artifact_store import load_array
+
+# Rows that iter_column decodes at a time
+ITER_CHUNK_ROWS = 10000
+
+class RecipeStore:
+    """
+    Read-only columnar recipe catalog over the buffers written by save_frame.
+
+    Numeric columns are memory-mapped typed arrays that scoring reads directly. Text and
+    list columns stay as UTF-8 buffers with offsets and are only decoded for the rows a
+    request actually returns, so no per-row Python objects are kept resident.
+
+    Rows removed by an incremental update stay in place and are flagged in `tombstones`
+    (None when no row was ever removed); scoring never returns them.
+    """
+
+    def __init__(self, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'schema.json')) as f:
+            schema = json.load(f)
+        self.n_rows = schema['n_rows']
+        self.columns = [column['name'] for column in schema['columns']]
+        self.kinds = {}
+        self.arrays = {}
+        for column in schema['columns']:
+            name, stem = column['name'], column['stem']
+            self.kinds[name] = column['kind']
+            if column['kind'] == 'numeric':
+                self.arrays[name] = {'values': load_array(directory, stem, mmap_mode)}
+            elif column['kind'] == 'text':
+                self.arrays[name] = {part: load_array(directory, f'{stem}.{part}', mmap_mode)
+                                     for part in ['bytes', 'offsets', 'nulls']}
+            else:
+                self.arrays[name] = {part: load_array(directory, f'{stem}.{part}', mmap_mode)
+                                     for part in ['bytes', 'offsets', 'rows']}
+        tombstones_path = os.path.join(directory, 'tombstones.npy')
+        self.tombstones = None
+        if os.path.exists(tombstones_path):
+            self.tombstones = load_array(directory, 'tombstones', mmap_mode)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, column):
+        """
+        A whole column: the typed array for numeric columns, a list of values otherwise.
+        """
+        if self.kinds[column] == 'numeric':
+            return self.arrays[column]['values']
+        return self.decode_column(column)
+
+    def decode_column(self, column, start=0, stop=None):
+        """
+        The values of a text or list column in rows [start, stop), decoding the buffer once.
+        """
+        stop = self.n_rows if stop is None else stop
+        arrays = self.arrays[column]
+        if self.kinds[column] == 'text':
+            first, last = start, stop
+        else:
+            rows = arrays['rows'][start:stop + 1]
+            first, last = int(rows[0]), int(rows[-1])
+        offsets = arrays['offsets'][first:last + 1]
+        buffer = arrays['bytes'][offsets[0]:offsets[-1]].tobytes()
+        offsets = (offsets - offsets[0]).tolist()
+        strings = [buffer[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+        if self.kinds[column] == 'text':
+            return [np.nan if null else string for string, null in zip(strings, arrays['nulls'][start:stop])]
+        rows = (rows - first).tolist()
+        return [strings[rows[i]:rows[i + 1]] for i in range(stop - start)]
+
+    def iter_column(self, column, chunk_rows=ITER_CHUNK_ROWS):
+        """
+        Every value of a column in row order, decoding chunk_rows rows at a time.
+        """
+        for start in range(0, self.n_rows, chunk_rows):
+            stop = min(start + chunk_rows, self.n_rows)
+            if self.kinds[column] == 'numeric':
+                yield from self.arrays[column]['values'][start:stop].tolist()
+            else:
+                yield from self.decode_column(column, start, stop)
+
+    def to_frame(self):
+        """
+        The whole catalog as a dataframe, tombstoned rows included. Only for rebuilding the
+        catalog from its own rows; serving never decodes more than the rows it returns.
+        """
+        return pd.DataFrame({column: np.array(self.arrays[column]['values']) if self.kinds[column] == 'numeric'
+                             else pd.Series(self.decode_column(column), dtype=object)
+                             for column in self.columns})
+
+    def value(self, column, i):
+        """
+        The value of one cell; NaN for missing text, as in the preprocessed dataframe.
+        """
+        arrays = self.arrays[column]
+        kind = self.kinds[column]
+        if kind == 'numeric':
+            return arrays['values'][i].item()
+        if kind == 'text':
+            return np.nan if arrays['nulls'][i] else _string(arrays, i)
+        return [_string(arrays, j) for j in range(arrays['rows'][i], arrays['rows'][i + 1])]
+
+    def row(self, i):
+        """
+        One recipe as a dict of column -> value, decoding only that row.
+        """
+        return {column: self.value(column, i) for column in self.columns}
+
+def _string(arrays, i):
+    offsets = arrays['offsets']
+    return arrays['bytes'][offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
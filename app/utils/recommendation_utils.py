@@ -1,66 +1,231 @@
+import asyncio
 import logging
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
 from app.models.recipe import Recipe
+from app.utils.ann_index import recall_at_k
+from app.utils.category_partitions import build_category_partitions, category_rows
 from app.utils.feature_engineering import create_query_vector
-from app.utils.similarity_calculation import calculate_weighted_similarity
+from app.utils.similarity_calculation import calculate_weighted_similarity, calculate_batch_similarity, top_k, top_k_rows
 
 logger = logging.getLogger(__name__)
 
-async def get_top_recommendations(df, combined_matrix, tfidf_vectorizer_ingredients,
+def rank_candidates(query_vector, normalized_matrix, df, category=None, calories=None, time=None, limit=15,
+                    ann_index=None, ann_mode='exact', ann_n_probe=None, category_partitions=None,
+                    inverted_index=None, feature_blocks=None, feature_weights=None):
+    """
+    Return the row ids and scores of the best `limit` recipes for the query vector.
+    With feature_blocks, the catalog is re-weighted by feature_weights and scored exactly;
+    the ANN and inverted indexes only cover the precomputed weighting.
+    """
+    profile = dict(feature_blocks=feature_blocks, feature_weights=feature_weights)
+    if category:
+        # The catalog is sorted by category, so only that category's rows are scored
+        if category_partitions is None:
+            category_partitions = build_category_partitions(df['RecipeCategory'])
+        rows = category_rows(category_partitions, category)
+        partition_scores = calculate_weighted_similarity(query_vector, normalized_matrix, df, calories, time,
+                                                         rows=rows, **profile)
+        top_local = top_k(partition_scores, limit)
+        logger.info(f"Category partition scored {len(partition_scores)} of {normalized_matrix.shape[0]} recipes")
+        top_rows = top_local + rows.start if isinstance(rows, slice) else rows[top_local]
+        return top_rows, partition_scores[top_local]
+
+    if feature_blocks is not None:
+        similarity_scores = calculate_weighted_similarity(query_vector, normalized_matrix, df, calories, time, **profile)
+        top_indices = top_k(similarity_scores, limit)
+        return top_indices, similarity_scores[top_indices]
+
+    if inverted_index is not None and calories is None and time is None:
+        # Queries without calorie or time penalties are answered exactly from the posting lists
+        tombstones = getattr(df, 'tombstones', None)
+        result = inverted_index.search(query_vector, normalized_matrix, limit,
+                                       excluded=None if tombstones is None else np.asarray(tombstones))
+        if result is not None:
+            return result
+
+    if ann_index is not None and ann_mode in ('ann', 'audit'):
+        candidates = ann_index.search(query_vector, ann_n_probe)
+        candidate_scores = calculate_weighted_similarity(query_vector, normalized_matrix, df, calories, time,
+                                                         rows=candidates)
+        top_local = top_k(candidate_scores, limit)
+        logger.info(f"ANN search scored {len(candidates)} of {normalized_matrix.shape[0]} recipes")
+        if ann_mode == 'ann':
+            return candidates[top_local], candidate_scores[top_local]
+        ann_indices = candidates[top_local]
+
+    similarity_scores = calculate_weighted_similarity(query_vector, normalized_matrix, df, calories, time)
+    top_indices = top_k(similarity_scores, limit)
+    if ann_index is not None and ann_mode == 'audit':
+        logger.info(f"ANN recall@{len(top_indices)}: {recall_at_k(top_indices, ann_indices):.3f}")
+    return top_indices, similarity_scores[top_indices]
+
+async def build_recipe(image_service, recipe, score):
+    """
+    Turn a catalog row into a Recipe, looking up images if the row has none stored.
+    """
+    try:
+        image_urls = await image_service.search_recipe_images(recipe['Name'], recipe['Images'], 3)
+    except Exception as e:
+        logger.error(f"Error searching images for {recipe['Name']}: {str(e)}")
+        image_urls = []
+    return recipe_from_row(recipe, image_urls, score)
+
+def recipe_from_row(recipe, image_urls, score):
+    return Recipe(
+        RecipeId=int(recipe['RecipeId']),
+        Name=recipe['Name'],
+        RecipeCategory=recipe['RecipeCategory'],
+        RecipeIngredientParts=recipe['RecipeIngredientParts'],
+        Keywords=recipe['Keywords'],
+        keywords_name=recipe['keywords_name'],
+        Calories=float(recipe['Calories']),
+        TotalTime_minutes=int(recipe['TotalTime_minutes']),
+        AggregatedRating=float(recipe['AggregatedRating']),
+        ReviewCount=int(recipe['ReviewCount']),
+        Description=recipe['Description'],
+        RecipeIngredientQuantities=recipe['RecipeIngredientQuantities'],
+        RecipeInstructions=recipe['RecipeInstructions'],
+        Images=image_urls,
+        Similarity=float(score)
+    )
+
+async def build_recipes(image_service, rows, concurrency=6, time_budget=10):
+    """
+    Recipes for (catalog row, score) pairs, in order, with their image lookups run
+    concurrently: at most `concurrency` at a time and all within `time_budget` seconds.
+    Recipes whose lookup has not finished by then get placeholder images; the lookup
+    itself keeps running and caches what it finds for later requests.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def build(recipe, score):
+        async with semaphore:
+            return await build_recipe(image_service, recipe, score)
+
+    tasks = [asyncio.create_task(build(recipe, score)) for recipe, score in rows]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(tasks, timeout=time_budget)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"Image lookup timed out for {len(pending)} of {len(tasks)} recipes, using placeholders")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return [task.result() if task in done else
+            recipe_from_row(recipe, image_service.select_placeholders(3), score)
+            for task, (recipe, score) in zip(tasks, rows)]
+
+async def get_top_recommendations(df, normalized_matrix, tfidf_vectorizer_ingredients,
                                   tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
                                   category_dummies, scaler, feature_weights, image_search_service,
                                   category=None, dietary_preference=None, ingredients=None, 
-                                  calories=None, time=None, keywords=None, keywords_name=None, top_n=5):
+                                  calories=None, time=None, keywords=None, keywords_name=None, top_n=5,
+                                  ann_index=None, ann_mode='exact', ann_n_probe=None, category_partitions=None,
+                                  inverted_index=None, query_builder=None, feature_blocks=None,
+                                  image_concurrency=6, image_time_budget=10):
+    top_indices, top_scores = rank_recommendations(
+        df, normalized_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
+        tfidf_vectorizer_keywords_name, category_dummies, scaler, feature_weights, category, dietary_preference,
+        ingredients, calories, time, keywords, keywords_name, top_n, ann_index=ann_index, ann_mode=ann_mode,
+        ann_n_probe=ann_n_probe, category_partitions=category_partitions, inverted_index=inverted_index,
+        query_builder=query_builder, feature_blocks=feature_blocks
+    )
+    return await build_recommendations(df, image_search_service, top_indices, top_scores, top_n,
+                                       image_concurrency, image_time_budget)
+
+def rank_recommendations(df, normalized_matrix, tfidf_vectorizer_ingredients, tfidf_vectorizer_keywords,
+                         tfidf_vectorizer_keywords_name, category_dummies, scaler, feature_weights,
+                         category=None, dietary_preference=None, ingredients=None, calories=None, time=None,
+                         keywords=None, keywords_name=None, top_n=5, ann_index=None, ann_mode='exact',
+                         ann_n_probe=None, category_partitions=None, inverted_index=None, query_builder=None,
+                         feature_blocks=None):
+    """
+    The scoring half of get_top_recommendations: row ids and scores of the candidates for the query.
+    """
     logger.info(f"Starting recommendation process for category: {category}, dietary_preference: {dietary_preference}")
-    
-    query_vector = create_query_vector(combined_matrix, tfidf_vectorizer_ingredients,
-                                       tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
-                                       category_dummies, scaler, feature_weights,
-                                       category=category, dietary_preference=dietary_preference,
-                                       ingredients=ingredients, calories=calories, time=time,
-                                       keywords=keywords, keywords_name=keywords_name)
-
-    similarity_scores = calculate_weighted_similarity(query_vector, combined_matrix, df, calories, time)
-    
-    if category:
-        similarity_scores *= (df['RecipeCategory'] == category)
 
-    top_indices = similarity_scores.argsort()[-top_n*3:][::-1]
+    query = dict(category=category, dietary_preference=dietary_preference, ingredients=ingredients,
+                 calories=calories, time=time, keywords=keywords, keywords_name=keywords_name)
+    if query_builder is not None:
+        query_vector = query_builder.build(feature_weights, **query)
+    else:
+        query_vector = create_query_vector(normalized_matrix, tfidf_vectorizer_ingredients,
+                                           tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                                           category_dummies, scaler, feature_weights, **query)
+
+    top_indices, top_scores = rank_candidates(query_vector, normalized_matrix, df, category, calories, time,
+                                              top_n*3, ann_index=ann_index, ann_mode=ann_mode,
+                                              ann_n_probe=ann_n_probe, category_partitions=category_partitions,
+                                              inverted_index=inverted_index, feature_blocks=feature_blocks,
+                                              feature_weights=feature_weights)
     logger.info(f"Found {len(top_indices)} potential recommendations")
+    return top_indices, top_scores
+
+async def build_recommendations(df, image_search_service, top_indices, top_scores, top_n, image_concurrency=6,
+                                image_time_budget=10):
+    """
+    The enrichment half of get_top_recommendations: Recipes with images for the best top_n candidates.
+    """
+    rows = []
+    for idx, score in zip(top_indices, top_scores):
+        if len(rows) >= top_n or np.isneginf(score):
+            break
+        rows.append((df.row(idx), score))
 
-    results = []
     async with image_search_service as image_service:
-        for idx in top_indices:
-            if len(results) >= top_n:
-                break
-
-            recipe = df.iloc[idx]
-            
-            if category and recipe['RecipeCategory'] != category:
-                continue
-
-            try:
-                image_urls = await image_service.search_recipe_images(recipe['Name'], recipe['Images'], 3)
-            except Exception as e:
-                logger.error(f"Error searching images for {recipe['Name']}: {str(e)}")
-                image_urls = []
-
-            results.append(Recipe(
-                RecipeId=int(recipe['RecipeId']),
-                Name=recipe['Name'],
-                RecipeCategory=recipe['RecipeCategory'],
-                RecipeIngredientParts=recipe['RecipeIngredientParts'],
-                Keywords=recipe['Keywords'],
-                keywords_name=recipe['keywords_name'],
-                Calories=float(recipe['Calories']),
-                TotalTime_minutes=int(recipe['TotalTime_minutes']),
-                AggregatedRating=float(recipe['AggregatedRating']),
-                ReviewCount=int(recipe['ReviewCount']),
-                Description=recipe['Description'],
-                RecipeIngredientQuantities=recipe['RecipeIngredientQuantities'],
-                RecipeInstructions=recipe['RecipeInstructions'],
-                Images=image_urls,
-                Similarity=float(similarity_scores[idx])
-            ))
+        results = await build_recipes(image_service, rows, image_concurrency, image_time_budget)
 
     logger.info(f"Returning {len(results)} recommendations")
-    return results[:top_n]
\ No newline at end of file
+    return results
+
+async def get_top_recommendations_batch(df, normalized_matrix, tfidf_vectorizer_ingredients,
+                                        tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                                        category_dummies, scaler, feature_weights, image_search_service,
+                                        queries, top_n=5, category_partitions=None, query_builder=None,
+                                        feature_blocks=None, image_concurrency=6, image_time_budget=10):
+    """
+    Recommendations for several queries, scored with one sparse matrix product and a
+    single vectorized top-k selection. Returns one list of recipes per query.
+    """
+    logger.info(f"Starting batch recommendation process for {len(queries)} queries")
+
+    if query_builder is not None:
+        query_matrix = vstack([query_builder.build(feature_weights, **query) for query in queries])
+    else:
+        query_matrix = vstack([
+            csr_matrix(create_query_vector(normalized_matrix, tfidf_vectorizer_ingredients,
+                                           tfidf_vectorizer_keywords, tfidf_vectorizer_keywords_name,
+                                           category_dummies, scaler, feature_weights, **query))
+            for query in queries
+        ])
+    target_calories = np.array([np.nan if q.get('calories') is None else q['calories'] for q in queries], dtype=float)
+    target_time = np.array([np.nan if q.get('time') is None else q['time'] for q in queries], dtype=float)
+
+    scores = calculate_batch_similarity(query_matrix, normalized_matrix, df, target_calories, target_time,
+                                        feature_blocks=feature_blocks, feature_weights=feature_weights)
+
+    if category_partitions is None:
+        category_partitions = build_category_partitions(df['RecipeCategory'])
+    for row, query in enumerate(queries):
+        if query.get('category'):
+            outside = np.ones(scores.shape[1], dtype=bool)
+            outside[category_rows(category_partitions, query['category'])] = False
+            scores[row, outside] = -np.inf
+
+    top_indices = top_k_rows(scores, top_n)
+
+    # The image lookups of all queries share one concurrency limit and time budget
+    rows, counts = [], []
+    for row, indices in enumerate(top_indices):
+        live = [idx for idx in indices if not np.isneginf(scores[row, idx])]
+        rows.extend((df.row(idx), scores[row, idx]) for idx in live)
+        counts.append(len(live))
+    async with image_search_service as image_service:
+        recipes = await build_recipes(image_service, rows, image_concurrency, image_time_budget)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+    results = [recipes[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    logger.info(f"Returning recommendations for {len(results)} queries")
+    return results
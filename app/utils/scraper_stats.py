@@ -0,0 +1,66 @@
+"""
+Per-scraper outcome statistics, used to launch the scrapers most likely to answer
+quickly first.
+"""
+
+from collections import deque
+import numpy as np
+
+class ScraperStats:
+    """
+    Success rate and latency of one scraper as exponentially weighted moving averages,
+    so that a source that slows down or stops finding images is demoted within a few
+    lookups. Before any lookup the priors make every scraper look alike.
+    """
+
+    def __init__(self, alpha=0.2, prior_latency=1.0, prior_success_rate=0.5):
+        self.alpha = alpha
+        self.latency = prior_latency
+        self.success_rate = prior_success_rate
+        self.attempts = 0
+        self.successes = 0
+        self.cancelled = 0
+        # Durations of the lookups that completed, for the adaptive timeout
+        self.recent_latencies = deque(maxlen=100)
+
+    def record(self, latency, success):
+        self.attempts += 1
+        self.successes += int(success)
+        self.latency += self.alpha * (latency - self.latency)
+        self.success_rate += self.alpha * (float(success) - self.success_rate)
+
+    def record_completed(self, latency):
+        self.recent_latencies.append(latency)
+
+    def p95(self):
+        """
+        95th percentile of the recent completed lookups; None until there are a few.
+        """
+        if len(self.recent_latencies) < 5:
+            return None
+        return float(np.percentile(self.recent_latencies, 95))
+
+    def record_cancelled(self, elapsed):
+        """
+        A lookup cancelled because others already found enough; it took at least `elapsed`.
+        """
+        self.cancelled += 1
+        if elapsed > self.latency:
+            self.latency += self.alpha * (elapsed - self.latency)
+
+    def expected_cost(self):
+        """
+        Expected seconds until this scraper answers with images.
+        """
+        return self.latency / max(self.success_rate, 0.05)
+
+    def snapshot(self):
+        return {
+            'attempts': self.attempts,
+            'successes': self.successes,
+            'cancelled': self.cancelled,
+            'success_rate': round(self.success_rate, 3),
+            'latency_seconds': round(self.latency, 3),
+            'expected_cost_seconds': round(self.expected_cost(), 3),
+            'p95_latency_seconds': None if self.p95() is None else round(self.p95(), 3)
+        }
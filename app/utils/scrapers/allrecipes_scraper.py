@@ -1,7 +1,7 @@
-from bs4 import BeautifulSoup
 from urllib.parse import quote
-from typing import List
-from .base_scraper import BaseScraper
+from typing import List, Set
+from .base_scraper import BaseScraper, SOURCE_ERRORS
+from .html_extract import iter_tags
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,26 +13,25 @@ class AllRecipesScraper(BaseScraper):
         
         try:
             async with self.session.get(url, headers=await self.get_headers()) as response:
-                if response.status != 200:
+                if not self.check_status(response):
                     return []
                 
                 html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                images = set()
+                images = self.extract_candidates(html)
                 
-                for img in soup.find_all('img'):
-                    src = img.get('src') or img.get('data-src')
-                    if src and not any(x in src.lower() for x in ['icon', 'logo', 'advertisement']):
-                        images.add(src)
-                
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
+                valid_images = await self.verify_image_urls(images, num_images)
                 
                 return valid_images
+        except SOURCE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"AllRecipes scraping error: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def extract_candidates(self, html: str) -> Set[str]:
+        images = set()
+        for _, _, img in iter_tags(html, ['img']):
+            src = img.get('src') or img.get('data-src')
+            if src and not any(x in src.lower() for x in ['icon', 'logo', 'advertisement']):
+                images.add(src)
+        return images
\ No newline at end of file
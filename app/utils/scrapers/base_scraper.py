@@ -1,12 +1,33 @@
+import asyncio
 import random
 import aiohttp
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterable, List
 import logging
+from app.utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+class ScraperHTTPError(Exception):
+    """
+    The source refused or failed the request (rate limited or a server error), as
+    opposed to answering without images. Raised so the circuit breaker can count it.
+    """
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP {status} from {url}")
+        self.status = status
+
+# Errors that say the source is unhealthy; scrapers let these propagate
+SOURCE_ERRORS = (ScraperHTTPError, aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
 class BaseScraper(ABC):
+    # Verification outcomes by URL, shared by every scraper; failures are re-checked sooner
+    url_checks = TTLCache(max_entries=50000, ttl=24 * 3600)
+    failed_check_ttl = 600
+    # HEAD requests per verify_image_urls call, and the seconds each may take
+    verify_concurrency = 4
+    verify_timeout = 5
+
     def __init__(self):
         self.user_agents = [
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -23,16 +44,57 @@ class BaseScraper(ABC):
             'Referer': 'https://www.google.com/',
         }
 
+    def check_status(self, response) -> bool:
+        """
+        Whether the response is a 200. Raises ScraperHTTPError for 429 and 5xx responses.
+        """
+        if response.status == 429 or response.status >= 500:
+            raise ScraperHTTPError(response.status, str(response.url))
+        return response.status == 200
+
     @abstractmethod
     async def search_images(self, recipe_name: str, num_images: int) -> List[str]:
         pass
 
     async def verify_image_url(self, url: str) -> bool:
         try:
-            async with self.session.head(url, allow_redirects=True, timeout=60) as response:
+            timeout = aiohttp.ClientTimeout(total=self.verify_timeout)
+            async with self.session.head(url, allow_redirects=True, timeout=timeout) as response:
                 content_type = response.headers.get('content-type', '')
                 return (response.status == 200 and 
                        'image' in content_type and 
                        not any(x in url.lower() for x in ['placeholder', 'default', 'missing']))
         except:
-            return False
\ No newline at end of file
+            return False
+
+    async def verify_image_urls(self, urls: Iterable[str], num_images: int) -> List[str]:
+        """
+        Up to num_images of the urls that pass verify_image_url. Cached outcomes are used
+        first; the rest are checked verify_concurrency at a time, stopping once enough pass.
+        """
+        valid_images = []
+        unchecked = []
+        for url in dict.fromkeys(urls):
+            passed = self.url_checks.get(url)
+            if passed is None:
+                unchecked.append(url)
+            elif passed:
+                valid_images.append(url)
+
+        running = {}
+        try:
+            while len(valid_images) < num_images and (unchecked or running):
+                while unchecked and len(running) < self.verify_concurrency:
+                    url = unchecked.pop(0)
+                    running[asyncio.create_task(self.verify_image_url(url))] = url
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = running.pop(task)
+                    passed = task.result()
+                    self.url_checks.set(url, passed, None if passed else self.failed_check_ttl)
+                    if passed:
+                        valid_images.append(url)
+        finally:
+            for task in running:
+                task.cancel()
+        return valid_images[:num_images]
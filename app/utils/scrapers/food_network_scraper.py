@@ -1,7 +1,7 @@
-from bs4 import BeautifulSoup
 from urllib.parse import quote
-from .base_scraper import BaseScraper
-from typing import List
+from .base_scraper import BaseScraper, SOURCE_ERRORS
+from .html_extract import iter_tags
+from typing import List, Set
 
 import logging
 
@@ -14,26 +14,25 @@ class FoodNetworkScraper(BaseScraper):
         
         try:
             async with self.session.get(url, headers=await self.get_headers()) as response:
-                if response.status != 200:
+                if not self.check_status(response):
                     return []
                 
                 html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                images = set()
+                images = self.extract_candidates(html)
                 
-                for img in soup.find_all('img', {'data-src': True}):
-                    src = img.get('data-src')
-                    if src and 'thumbnail' not in src.lower():
-                        images.add(src)
-                
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
+                valid_images = await self.verify_image_urls(images, num_images)
                 
                 return valid_images
+        except SOURCE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Food Network scraping error: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def extract_candidates(self, html: str) -> Set[str]:
+        images = set()
+        for _, _, img in iter_tags(html, ['img']):
+            src = img.get('data-src')
+            if src and 'thumbnail' not in src.lower():
+                images.add(src)
+        return images
\ No newline at end of file
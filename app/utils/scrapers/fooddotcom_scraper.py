@@ -1,8 +1,8 @@
-from bs4 import BeautifulSoup
 import re
-from typing import List
+from typing import List, Set
 from urllib.parse import quote
-from .base_scraper import BaseScraper
+from .base_scraper import BaseScraper, SOURCE_ERRORS
+from .html_extract import iter_tags, has_class
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,52 +14,55 @@ class FoodDotComScraper(BaseScraper):
         
         try:
             async with self.session.get(url, headers=await self.get_headers()) as response:
-                if response.status != 200:
+                if not self.check_status(response):
                     return []
                 
                 html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                images = set()
+                images = self.extract_candidates(html)
                 
-                # Look for recipe cards which usually contain the main images
-                recipe_cards = soup.find_all('div', {'class': 'recipe-card'})
-                for card in recipe_cards:
-                    # Check for lazy-loaded images
-                    img_tags = card.find_all('img', {'data-src': True})
-                    for img in img_tags:
-                        src = img.get('data-src')
-                        if src:
-                            # Food.com often uses different image sizes, try to get the largest
-                            # Replace size parameters in URL to get larger images
-                            src = re.sub(r's\d+-c', 's800-c', src)
-                            images.add(src)
-                    
-                    # Check for regular images
-                    img_tags = card.find_all('img', {'src': True})
-                    for img in img_tags:
-                        src = img.get('src')
-                        if src and not any(x in src.lower() for x in ['icon', 'logo', 'advertisement']):
-                            src = re.sub(r's\d+-c', 's800-c', src)
-                            images.add(src)
-                
-                # If no recipe cards found, try finding images in the main content
-                if not images:
-                    img_tags = soup.find_all('img', {'class': 'recipe-image'})
-                    for img in img_tags:
-                        src = img.get('src') or img.get('data-src')
-                        if src:
-                            src = re.sub(r's\d+-c', 's800-c', src)
-                            images.add(src)
-                
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
+                valid_images = await self.verify_image_urls(images, num_images)
                 
                 return valid_images
                 
+        except SOURCE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Food.com scraping error: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def extract_candidates(self, html: str) -> Set[str]:
+        images = set()
+        fallback = set()
+        # One entry per open div, True for recipe cards; images count while any card is open
+        open_divs = []
+        open_cards = 0
+        for name, end, attrs in iter_tags(html, ['div', 'img']):
+            if name == 'div':
+                if not end:
+                    open_divs.append(has_class(attrs, 'recipe-card'))
+                    open_cards += open_divs[-1]
+                elif open_divs:
+                    open_cards -= open_divs.pop()
+                continue
+
+            # Look for recipe cards which usually contain the main images
+            if open_cards:
+                # Check for lazy-loaded images
+                src = attrs.get('data-src')
+                if src:
+                    # Food.com often uses different image sizes, try to get the largest
+                    # Replace size parameters in URL to get larger images
+                    images.add(re.sub(r's\d+-c', 's800-c', src))
+
+                # Check for regular images
+                src = attrs.get('src')
+                if src and not any(x in src.lower() for x in ['icon', 'logo', 'advertisement']):
+                    images.add(re.sub(r's\d+-c', 's800-c', src))
+
+            # If no recipe cards found, try finding images in the main content
+            if has_class(attrs, 'recipe-image'):
+                src = attrs.get('src') or attrs.get('data-src')
+                if src:
+                    fallback.add(re.sub(r's\d+-c', 's800-c', src))
+
+        return images or fallback
@@ -1,9 +1,9 @@
-from bs4 import BeautifulSoup
 import re
 from urllib.parse import quote, unquote
-from .base_scraper import BaseScraper
+from .base_scraper import BaseScraper, SOURCE_ERRORS
+from .html_extract import script_texts
 import logging
-from typing import List
+from typing import List, Set
 
 
 logger = logging.getLogger(__name__)
@@ -15,28 +15,27 @@ class GoogleScraper(BaseScraper):
         
         try:
             async with self.session.get(url, headers=await self.get_headers()) as response:
-                if response.status != 200:
+                if not self.check_status(response):
                     return []
                 
                 html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                images = set()
-
-                # Extract from JSON-like data in scripts
-                for script in soup.find_all('script'):
-                    if script.string and 'AF_initDataCallback' in script.string:
-                        urls = re.findall(r'(https?://\S+\.(?:jpg|jpeg|png))', script.string)
-                        images.update(unquote(url) for url in urls)
+                images = self.extract_candidates(html)
 
                 # Verify URLs and take only valid ones
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
+                valid_images = await self.verify_image_urls(images, num_images)
 
                 return valid_images
+        except SOURCE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Google scraping error: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def extract_candidates(self, html: str) -> Set[str]:
+        images = set()
+        # Extract from JSON-like data in scripts
+        for script in script_texts(html):
+            if 'AF_initDataCallback' in script:
+                urls = re.findall(r'(https?://\S+\.(?:jpg|jpeg|png))', script)
+                images.update(unquote(url) for url in urls)
+        return images
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Lean extraction of the few tags the scrapers need from a results page.
+
+Instead of building a full BeautifulSoup tree, one regular expression scans the page for
+the requested tags only. Comments and the raw-text elements (script, style, textarea,
+title) are matched as whole units, so markup inside them is never mistaken for tags,
+the same way an HTML parser treats them.
+"""
+import html
+import re
+from typing import Dict, Iterable, Iterator, Tuple
+
+# Attribute list of a tag: runs of anything but '>', '<' and quotes, or quoted strings.
+# The possessive quantifiers and stopping at '<' keep a tag that never closes from being
+# rescanned to the end of the page from every later '<'
+_ATTRIBUTES = r'''(?:[^<>"']++|"[^"]*+"|'[^']*+')*+'''
+_ATTRIBUTE = re.compile(r'''([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?''')
+_RAW_TEXT = 'script|style|textarea|title'
+_patterns = {}
+
+def _pattern(names: Tuple[str, ...]) -> re.Pattern:
+    if names not in _patterns:
+        # Every alternative starts with '<', so the scan jumps from one '<' to the next
+        tags = rf'|(/?)({"|".join(map(re.escape, names))})\b({_ATTRIBUTES})>' if names else ''
+        _patterns[names] = re.compile(
+            rf'<(?:!--.*?(?:-->|$)|({_RAW_TEXT})\b({_ATTRIBUTES})>(.*?)(?:</\1\s*>|$){tags})',
+            re.S | re.I
+        )
+    return _patterns[names]
+
+def parse_attributes(text: str) -> Dict[str, str]:
+    """
+    Attributes of a tag as a dict with lowercased names and unescaped values; a value-less
+    attribute maps to '' and a repeated attribute keeps its last value.
+    """
+    attributes = {}
+    for match in _ATTRIBUTE.finditer(text):
+        name, double_quoted, single_quoted, unquoted = match.groups()
+        value = next((v for v in (double_quoted, single_quoted, unquoted) if v is not None), '')
+        attributes[name.lower()] = html.unescape(value)
+    return attributes
+
+def iter_tags(page: str, names: Iterable[str]) -> Iterator[Tuple[str, bool, Dict[str, str]]]:
+    """
+    (tag name, is end tag, attributes) for every start and end tag of the given names,
+    in document order. Raw-text elements among the names are reported by their start tag.
+    """
+    names = tuple(sorted(name.lower() for name in names))
+    for match in _pattern(names).finditer(page):
+        raw_name, raw_attributes, _, end, name, attributes = match.groups()
+        if raw_name is not None:
+            if raw_name.lower() in names:
+                yield raw_name.lower(), False, parse_attributes(raw_attributes)
+        elif name is not None:
+            yield name.lower(), bool(end), parse_attributes(attributes) if not end else {}
+
+def script_texts(page: str) -> Iterator[str]:
+    """
+    The text content of every script element.
+    """
+    for match in _pattern(()).finditer(page):
+        if match.group(1) is not None and match.group(1).lower() == 'script':
+            yield match.group(3)
+
+def has_class(attributes: Dict[str, str], name: str) -> bool:
+    return name in attributes.get('class', '').split()
@@ -1,6 +1,6 @@
 from urllib.parse import quote
 from typing import List
-from .base_scraper import BaseScraper
+from .base_scraper import BaseScraper, SOURCE_ERRORS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,7 +20,7 @@ class WikimediaScraper(BaseScraper):
         
         try:
             async with self.session.get(url, params=params, headers=await self.get_headers()) as response:
-                if response.status != 200:
+                if not self.check_status(response):
                     return []
                 
                 data = await response.json()
@@ -32,14 +32,11 @@ class WikimediaScraper(BaseScraper):
                         file_url = f"https://commons.wikimedia.org/wiki/Special:FilePath/{quote(title[5:])}"
                         images.add(file_url)
                 
-                valid_images = []
-                for img_url in images:
-                    if len(valid_images) >= num_images:
-                        break
-                    if await self.verify_image_url(img_url):
-                        valid_images.append(img_url)
+                valid_images = await self.verify_image_urls(images, num_images)
                 
                 return valid_images
+        except SOURCE_ERRORS:
+            raise
         except Exception as e:
             logger.error(f"Wikimedia scraping error: {str(e)}")
             return []
\ No newline at end of file
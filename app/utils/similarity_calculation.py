@@ -1,22 +1,151 @@
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from scipy.sparse import csr_matrix, issparse
 import numpy as np
 
-def calculate_weighted_similarity(query_vector, combined_matrix, df, target_calories=None, target_time=None):
+def normalize_matrix(combined_matrix):
     """
-    Calculate weighted similarity scores between the query vector and the combined matrix.
+    L2-normalize the rows of the combined matrix once at precompute time.
+
+    Returns:
+        Tuple of the normalized CSR matrix and the original row norms
+    """
+    matrix = combined_matrix.tocsr().astype(np.float64)
+    row_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    normalized_matrix = normalize(matrix, norm='l2', copy=True)
+    return normalized_matrix, row_norms
+
+def row_block(matrix, start, end):
+    """
+    Rows [start, end) of a CSR matrix as a view that shares the parent's data and indices.
+    """
+    indptr = matrix.indptr[start:end + 1]
+    first, last = indptr[0], indptr[-1]
+    return csr_matrix((matrix.data[first:last], matrix.indices[first:last], indptr - first),
+                      shape=(end - start, matrix.shape[1]), copy=False)
+
+def query_entries(query_vector):
+    """
+    Column ids and values of the non-zero entries of a dense or sparse query vector.
+    """
+    if issparse(query_vector):
+        query_vector = query_vector.tocsr()
+        nonzero = query_vector.data != 0
+        return query_vector.indices[nonzero], query_vector.data[nonzero].astype(np.float64)
+    query = np.asarray(query_vector, dtype=np.float64).ravel()
+    columns = np.flatnonzero(query)
+    return columns, query[columns]
+
+def cosine_scores(query_vector, normalized_matrix):
+    """
+    Cosine similarity of the query against every row of a pre-normalized matrix,
+    computed as a single sparse-dense matrix-vector product.
+    """
+    columns, values = query_entries(query_vector)
+    query_norm = np.sqrt(np.dot(values, values))
+    if query_norm == 0:
+        return np.zeros(normalized_matrix.shape[0])
+    query = np.zeros(normalized_matrix.shape[1])
+    query[columns] = values / query_norm
+    return normalized_matrix @ query
+
+def top_k(scores, k):
+    """
+    Indices of the k highest scores, ordered by descending score and then ascending index
+    so that every retrieval path breaks ties the same way.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    kth_largest = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= kth_largest)
+    return candidates[np.lexsort((candidates, -scores[candidates]))[:k]]
+
+def top_k_rows(scores, k):
+    """
+    Row-wise top_k for an (n_queries, n_rows) score matrix, done for all rows at once.
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidates.sort(axis=1)
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+def calculate_weighted_similarity(query_vector, normalized_matrix, df, target_calories=None, target_time=None,
+                                  rows=None, feature_blocks=None, feature_weights=None):
     """
-    base_similarity = cosine_similarity(query_vector, combined_matrix).flatten()
-    
+    Calculate weighted similarity scores between the query vector and the normalized combined matrix.
+    If rows is given (an index array or a slice), only those rows are scored and the
+    scores follow their order. If feature_blocks is given, the catalog is re-weighted
+    with feature_weights at query time instead of using the precomputed weighting.
+    """
+    if feature_blocks is not None:
+        base_similarity = feature_blocks.cosine_scores(query_vector, feature_weights, rows)
+    else:
+        if isinstance(rows, slice):
+            normalized_matrix = row_block(normalized_matrix, rows.start, rows.stop)
+        elif rows is not None:
+            normalized_matrix = normalized_matrix[rows]
+        base_similarity = cosine_scores(query_vector, normalized_matrix)
+
     penalties = np.ones_like(base_similarity)
-    
+
     if target_calories is not None:
-        calorie_diff = np.abs(df['Calories'].values - target_calories)
+        calories = np.asarray(df['Calories']) if rows is None else np.asarray(df['Calories'])[rows]
+        calorie_diff = np.abs(calories - target_calories)
         calorie_penalty = 1 - (calorie_diff / df['Calories'].max())
         penalties *= calorie_penalty
-        
+
     if target_time is not None:
-        time_diff = np.abs(df['TotalTime_minutes'].values - target_time)
+        times = np.asarray(df['TotalTime_minutes']) if rows is None else np.asarray(df['TotalTime_minutes'])[rows]
+        time_diff = np.abs(times - target_time)
         time_penalty = 1 - (time_diff / df['TotalTime_minutes'].max())
         penalties *= time_penalty
-    
-    return base_similarity * penalties
\ No newline at end of file
+
+    return mask_tombstones(base_similarity * penalties, df, rows)
+
+def calculate_batch_similarity(query_matrix, normalized_matrix, df, target_calories, target_time,
+                               feature_blocks=None, feature_weights=None):
+    """
+    Weighted similarity of several queries at once, with a single sparse matrix product.
+
+    Args:
+        query_matrix: (n_queries, n_features) sparse matrix of stacked query vectors
+        target_calories, target_time: Per-query targets, NaN where the query has none
+        feature_blocks, feature_weights: Optional query-time re-weighting of the catalog
+
+    Returns:
+        (n_queries, n_rows) array of scores
+    """
+    if feature_blocks is not None:
+        scores = feature_blocks.batch_cosine_scores(query_matrix, feature_weights)
+    else:
+        queries = query_matrix.toarray()
+        query_norms = np.sqrt(np.einsum('ij,ij->i', queries, queries))
+        query_norms[query_norms == 0] = 1
+        scores = np.ascontiguousarray((normalized_matrix @ (queries / query_norms[:, None]).T).T)
+
+    penalties = np.ones_like(scores)
+
+    has_calories = ~np.isnan(target_calories)
+    if has_calories.any():
+        calorie_diff = np.abs(np.asarray(df['Calories'])[None, :] - target_calories[has_calories, None])
+        penalties[has_calories] *= 1 - (calorie_diff / df['Calories'].max())
+
+    has_time = ~np.isnan(target_time)
+    if has_time.any():
+        time_diff = np.abs(np.asarray(df['TotalTime_minutes'])[None, :] - target_time[has_time, None])
+        penalties[has_time] *= 1 - (time_diff / df['TotalTime_minutes'].max())
+
+    return mask_tombstones(scores * penalties, df)
+
+def mask_tombstones(scores, df, rows=None):
+    """
+    Score catalog rows removed by an incremental update as -inf, so that top_k ranks them
+    after every live row. scores may hold one row of scores or one per query.
+    """
+    tombstones = getattr(df, 'tombstones', None)
+    if tombstones is not None:
+        scores[..., tombstones if rows is None else tombstones[rows]] = -np.inf
+    return scores
@@ -0,0 +1,176 @@
+"""
+Correctness harness and throughput benchmark for the scrapers' candidate extraction
+against the BeautifulSoup code it replaced.
+
+Each site is measured on synthetic results pages shaped like its own (script payloads,
+lazy-loaded images, recipe cards, comments and markup inside scripts), and on the pages
+of a fixture directory holding google.html, allrecipes.html, foodnetwork.html and
+fooddotcom.html. The bundled fixtures in benchmarks/fixtures reproduce each site's results
+markup by hand, with unquoted attributes, srcset and uppercase tags; pages saved from the
+live sites can be dropped in their place.
+
+    python -m benchmarks.html_extraction [--pages 20] [--fixtures DIR]
+"""
+import argparse
+import os
+import random
+import re
+import time
+from urllib.parse import unquote
+from bs4 import BeautifulSoup
+from app.utils.scrapers.allrecipes_scraper import AllRecipesScraper
+from app.utils.scrapers.food_network_scraper import FoodNetworkScraper
+from app.utils.scrapers.fooddotcom_scraper import FoodDotComScraper
+from app.utils.scrapers.google_scraper import GoogleScraper
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+FILLER = ('<div class="nav"><a href="/x?a=1&amp;b=2">Link</a><span class="label">Recipes &gt; More</span>'
+          '<!-- <img src="https://cdn.example.com/commented-out.jpg"> --><p>Lorem ipsum dolor sit amet, '
+          'consectetur adipiscing elit.</p><svg width="10"><path d="M0 0L10 10"/></svg></div>\n')
+STYLE = '<style>.card > img { width: 100%; } a[href^="x"] { color: red; }</style>'
+SCRIPT = ('<script>var tpl = "<img src=\\"https://cdn.example.com/in-script.jpg\\">"; '
+          'window.data = {"a": [1, 2, 3], "b": "x > y"};</script>')
+
+def image_url(rng, site, size=True):
+    size_part = f"/s{rng.choice([120, 240, 300])}-c" if size else ''
+    return f"https://img.{site}.example.com/photos{size_part}/{rng.randrange(10 ** 8)}.jpg"
+
+def page(rng, body):
+    return f'<!DOCTYPE html><html><head><title>Results</title>{STYLE}{SCRIPT}</head><body>{body}</body></html>'
+
+def google_page(rng):
+    parts = []
+    for i in range(40):
+        urls = ', '.join(f'["{image_url(rng, "gstatic")}", 300, 200]' for _ in range(rng.randint(1, 4)))
+        payload = f"AF_initDataCallback({{key: 'ds:{i}', data: [{urls}, \"x%20y\"]}});" if i % 3 == 0 \
+            else f"(function(){{var s = '{'x' * 2000}';}})();"
+        parts.append(f'<script nonce="abc">{payload}</script>{FILLER}')
+    return page(rng, ''.join(parts))
+
+def allrecipes_page(rng):
+    parts = []
+    for _ in range(60):
+        src = rng.choice([f'src="{image_url(rng, "allrecipes")}"', f'data-src="{image_url(rng, "allrecipes")}" src=""',
+                          'src="https://img.allrecipes.example.com/logo.svg"', "src='/icons/star.png'"])
+        parts.append(f'<div class="card"><a href="/recipe/{rng.randrange(10 ** 6)}">'
+                     f'<img class="card__img" alt="A &quot;great&quot; dish" {src} loading=lazy></a></div>{FILLER}')
+    return page(rng, ''.join(parts))
+
+def foodnetwork_page(rng):
+    parts = []
+    for _ in range(60):
+        src = rng.choice([f'data-src="{image_url(rng, "foodnetwork")}"',
+                          f'data-src="{image_url(rng, "foodnetwork")}?thumbnail=1"', f'src="{image_url(rng, "fn")}"'])
+        parts.append(f'<section><IMG {src} alt="dish"/></section>{FILLER}')
+    return page(rng, ''.join(parts))
+
+def fooddotcom_page(rng):
+    parts = []
+    for _ in range(50):
+        card = rng.random() < 0.7
+        inner = (f'<div class="inner"><img data-src="{image_url(rng, "food")}" src="data:image/gif;base64,R0l">'
+                 f'<img src="{image_url(rng, "food")}"><img src="/images/advertisement.png"></div>')
+        parts.append(f'<div class="{"recipe-card grid" if card else "promo"}">{inner}</div>'
+                     f'<img class="recipe-image hero" src="{image_url(rng, "food", False)}">{FILLER}')
+    return page(rng, ''.join(parts))
+
+def fooddotcom_page_without_cards(rng):
+    return page(rng, ''.join(f'<img class="recipe-image" data-src="{image_url(rng, "food")}">{FILLER}'
+                             for _ in range(30)))
+
+# The BeautifulSoup extraction each scraper did before
+def google_reference(html):
+    images = set()
+    for script in BeautifulSoup(html, 'html.parser').find_all('script'):
+        if script.string and 'AF_initDataCallback' in script.string:
+            images.update(unquote(url) for url in re.findall(r'(https?://\S+\.(?:jpg|jpeg|png))', script.string))
+    return images
+
+def allrecipes_reference(html):
+    images = set()
+    for img in BeautifulSoup(html, 'html.parser').find_all('img'):
+        src = img.get('src') or img.get('data-src')
+        if src and not any(x in src.lower() for x in ['icon', 'logo', 'advertisement']):
+            images.add(src)
+    return images
+
+def foodnetwork_reference(html):
+    images = set()
+    for img in BeautifulSoup(html, 'html.parser').find_all('img', {'data-src': True}):
+        src = img.get('data-src')
+        if src and 'thumbnail' not in src.lower():
+            images.add(src)
+    return images
+
+def fooddotcom_reference(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    images = set()
+    for card in soup.find_all('div', {'class': 'recipe-card'}):
+        for img in card.find_all('img', {'data-src': True}):
+            if img.get('data-src'):
+                images.add(re.sub(r's\d+-c', 's800-c', img.get('data-src')))
+        for img in card.find_all('img', {'src': True}):
+            src = img.get('src')
+            if src and not any(x in src.lower() for x in ['icon', 'logo', 'advertisement']):
+                images.add(re.sub(r's\d+-c', 's800-c', src))
+    if not images:
+        for img in soup.find_all('img', {'class': 'recipe-image'}):
+            src = img.get('src') or img.get('data-src')
+            if src:
+                images.add(re.sub(r's\d+-c', 's800-c', src))
+    return images
+
+SITES = {
+    'google': (GoogleScraper(), google_reference, [google_page]),
+    'allrecipes': (AllRecipesScraper(), allrecipes_reference, [allrecipes_page]),
+    'foodnetwork': (FoodNetworkScraper(), foodnetwork_reference, [foodnetwork_page]),
+    'fooddotcom': (FoodDotComScraper(), fooddotcom_reference, [fooddotcom_page, fooddotcom_page_without_cards])
+}
+
+def fixture_page(directory, site):
+    path = os.path.join(directory, f'{site}.html')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def timed(func, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            func(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20, help='Synthetic pages per site')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help='Directory of saved results pages, one <site>.html per site')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    for site, (scraper, reference, generators) in SITES.items():
+        runs = [('synthetic', [rng.choice(generators)(rng) for _ in range(args.pages)])]
+        fixture = fixture_page(args.fixtures, site)
+        if fixture is not None:
+            runs.append(('saved', [fixture]))
+
+        for kind, pages in runs:
+            mismatches = sum(scraper.extract_candidates(html) != reference(html) for html in pages)
+            candidates = sum(len(scraper.extract_candidates(html)) for html in pages)
+            reference_time = timed(reference, pages, args.repeat)
+            lean_time = timed(scraper.extract_candidates, pages, args.repeat)
+            size = sum(len(html) for html in pages) / len(pages) / 1024
+            print(f"{site:>11} {kind:>9}: {len(pages)} pages of {size:5.0f} KiB, "
+                  f"{candidates / len(pages):5.1f} candidates/page | "
+                  f"BeautifulSoup {reference_time / len(pages) * 1000:7.2f} ms/page | "
+                  f"lean {lean_time / len(pages) * 1000:6.2f} ms/page ({reference_time / lean_time:5.1f}x) | "
+                  f"mismatches {mismatches}")
+
+if __name__ == '__main__':
+    main()
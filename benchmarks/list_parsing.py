@@ -0,0 +1,76 @@
+"""
+Correctness harness and throughput benchmark for parse_list_string_column in
+data_preprocessing against the per-cell parse_list_string.
+
+The R-vector columns keep the per-cell parse_r_vector: a bulk parse only paid off while
+its tokens stayed flat, and preprocess_chunk needs one list per row.
+
+    python -m benchmarks.list_parsing --rows 200000 [--csv recipe_dataset.csv]
+"""
+import argparse
+import random
+import time
+import pandas as pd
+from app.utils.data_preprocessing import parse_list_string, parse_list_string_column
+
+WORDS = ['sugar', 'butter', 'all-purpose flour', 'eggs', 'Low Protein', '< 30 Mins', 'crème fraîche',
+         'salt & pepper', 'NA', 'na', ' NA ', '', '   ', 'a, b', "it's", '1/2 cup']
+
+# Cells that exercise the fallbacks and the edges of the format
+LIST_EDGE_CASES = ["[]", "[ ]", "['a',]", "[,]", "['a' 'b']", "[1, 2]", "'abc'", "['it\\'s']", '["it\'s"]',
+                   "['a', ['b']]", "['a']\n", " ['a']", "['a', 'b']", "['a\\nb']", "['a'] + ['b']",
+                   'None', "{'a': 1}", 'c("x", "y")', 'character(0)', 'plain words', '', "['a'\x00]",
+                   'lambda(x)', 'f(1) if 1 else (2)', "['\t', '\f']", float('nan'), 7]
+
+def list_cell(rng):
+    quote = rng.choice(["'", '"'])
+    return '[' + ', '.join(f'{quote}{word}{quote}' for word in rng.sample(WORDS[:8], rng.randint(0, 5))) + ']'
+
+def make_column(rng, rows, cell, edge_cases, edge_rate):
+    return [rng.choice(edge_cases) if rng.random() < edge_rate else cell(rng) for _ in range(rows)]
+
+def mismatches(cells):
+    expected = [parse_list_string(cell) for cell in cells]
+    actual = parse_list_string_column(cells)
+    return [(cell, e, a) for cell, e, a in zip(cells, expected, actual)
+            if e != a or [type(x) for x in e] != [type(x) for x in a]]
+
+def throughput(cells, repeat):
+    scalar_time = min(timed(lambda: [parse_list_string(cell) for cell in cells]) for _ in range(repeat))
+    column_time = min(timed(lambda: parse_list_string_column(cells)) for _ in range(repeat))
+    return len(cells) / scalar_time, len(cells) / column_time
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--csv', help='Also check the list columns of a raw recipe CSV')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # Edge cases on their own, mixed into generated columns, and a clean column for timing
+    failures = mismatches(LIST_EDGE_CASES)
+    for _ in range(20):
+        failures += mismatches(make_column(rng, 500, list_cell, LIST_EDGE_CASES, 0.2))
+    for failure in failures[:5]:
+        print(f"  mismatch: {failure!r}")
+    scalar_rate, column_rate = throughput(make_column(rng, args.rows, list_cell, LIST_EDGE_CASES, 0.0), args.repeat)
+    print(f"list_string: per-cell {scalar_rate:9.0f} rows/s | column {column_rate:9.0f} rows/s "
+          f"({column_rate / scalar_rate:4.1f}x) | mismatches {len(failures)}")
+
+    if args.csv:
+        df = pd.read_csv(args.csv, usecols=['Keywords', 'keywords_name'])
+        for col in df.columns:
+            cells = df[col].tolist()
+            scalar_rate, column_rate = throughput(cells, 1)
+            print(f"{col:>13}: {len(mismatches(cells))} mismatches over {len(cells)} rows, "
+                  f"{column_rate / scalar_rate:4.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Per-query build cost of create_query_vector versus QueryVectorBuilder, with a
+bit-for-bit comparison of their outputs.
+
+    python -m benchmarks.query_vector_build --precomputed-dir precomputed
+"""
+import argparse
+import random
+import time
+import numpy as np
+from app.utils.data_loading import load_precomputed_data
+from app.utils.feature_engineering import create_query_vector, CompiledTfidf, QueryVectorBuilder, DIETARY_COLUMNS
+
+FEATURE_WEIGHTS = {
+    'recommend': {'ingredients': 0.15, 'category': 0.25, 'dietary': 0.20,
+                  'calories': 0.10, 'time': 0.10, 'keywords': 0.10, 'keywords_name': 0.10},
+    'extract': {'ingredients': 0.50, 'category': 0.0, 'dietary': 0.0,
+                'calories': 0.0, 'time': 0.0, 'keywords': 0.40, 'keywords_name': 0.10}
+}
+
+def sample_queries(data, n, seed):
+    rng = random.Random(seed)
+    ingredients = list(data['tfidf_vectorizer_ingredients'].vocabulary_)
+    keywords = list(data['tfidf_vectorizer_keywords'].vocabulary_)
+    keywords_name = list(data['tfidf_vectorizer_keywords_name'].vocabulary_)
+    categories = list(data['category_dummies'].columns)
+    queries = []
+    for _ in range(n):
+        queries.append({
+            'category': rng.choice(categories + [None]),
+            'dietary_preference': rng.choice(DIETARY_COLUMNS + [None]),
+            'ingredients': rng.sample(ingredients, min(len(ingredients), rng.randint(0, 5))),
+            'calories': rng.choice([None, rng.randint(50, 1500)]),
+            'time': rng.choice([None, rng.randint(5, 240)]),
+            'keywords': rng.sample(keywords, min(len(keywords), rng.randint(0, 4))),
+            'keywords_name': rng.sample(keywords_name, min(len(keywords_name), rng.randint(0, 3)))
+        })
+    return queries
+
+def tfidf_mismatches(vectorizer, texts):
+    """
+    Texts whose compiled tf-idf row differs from vectorizer.transform in any bit.
+    """
+    compiled = CompiledTfidf(vectorizer)
+    mismatches = 0
+    for text in texts:
+        expected = vectorizer.transform([text])
+        expected.sort_indices()
+        columns, values = compiled.transform(text)
+        if not (np.array_equal(expected.indices, columns) and
+                np.array_equal(expected.data.view(np.uint64), np.array(values, dtype=np.float64).view(np.uint64))):
+            mismatches += 1
+    return mismatches
+
+def time_per_call(func, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            func(query)
+        timings.append((time.perf_counter() - start) / len(queries))
+    return min(timings) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--precomputed-dir', default='precomputed')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    data = load_precomputed_data(args.precomputed_dir)
+    n_features = data['normalized_matrix'].shape[1]
+    builder = QueryVectorBuilder(n_features, data['tfidf_vectorizer_ingredients'], data['tfidf_vectorizer_keywords'],
+                                 data['tfidf_vectorizer_keywords_name'], data['category_dummies'], data['scaler'])
+    queries = sample_queries(data, args.queries, args.seed)
+
+    for field, vectorizer in [('ingredients', data['tfidf_vectorizer_ingredients']),
+                              ('keywords', data['tfidf_vectorizer_keywords']),
+                              ('keywords_name', data['tfidf_vectorizer_keywords_name'])]:
+        texts = [' '.join(query[field]) for query in queries]
+        print(f"{field:>13} tf-idf: bitwise mismatches {tfidf_mismatches(vectorizer, texts)}/{len(texts)}")
+
+    for name, weights in FEATURE_WEIGHTS.items():
+        def reference(query):
+            return create_query_vector(data['normalized_matrix'], data['tfidf_vectorizer_ingredients'],
+                                       data['tfidf_vectorizer_keywords'], data['tfidf_vectorizer_keywords_name'],
+                                       data['category_dummies'], data['scaler'], weights, **query)
+
+        def compiled(query):
+            return builder.build(weights, **query)
+
+        mismatches = 0
+        for query in queries:
+            expected = reference(query).ravel()
+            actual = compiled(query).toarray().ravel()
+            # Exact float equality; only the -0.0 that zero weights leave in the dense vector is not stored sparsely
+            if not np.array_equal(expected, actual):
+                mismatches += 1
+
+        reference_us = time_per_call(reference, queries, args.repeat)
+        compiled_us = time_per_call(compiled, queries, args.repeat)
+        print(f"{name:>9}: create_query_vector {reference_us:8.1f} us/query | "
+              f"QueryVectorBuilder {compiled_us:6.1f} us/query | "
+              f"speedup {reference_us / compiled_us:5.1f}x | mismatches {mismatches}/{len(queries)}")
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 
 class Config:
@@ -5,4 +6,62 @@ class Config:
     PRECOMPUTED_DIR = 'precomputed'
     EXTRACTION_API_KEY = os.getenv('EXTRACTION_API_KEY')
     GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+    # ANN_MODE is one of 'exact', 'ann' or 'audit'; ANN_N_PROBE trades recall for latency
+    ANN_MODE = os.getenv('ANN_MODE', 'exact')
+    ANN_N_PROBE = int(os.getenv('ANN_N_PROBE', 8))
+    INVERTED_INDEX = os.getenv('INVERTED_INDEX', 'true').lower() == 'true'
+    # Named feature weight profiles as JSON, e.g. {"pantry": {"ingredients": 0.8, "keywords": 0.2}}. Profiles
+    # re-weight the catalog, so their queries take the full scan and need a second copy of the matrix
+    WEIGHT_PROFILES = json.loads(os.getenv('WEIGHT_PROFILES', '{}'))
+    # CSV ingestion during a rebuild; 0 workers means one per CPU
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 0)) or None
+    INGEST_MEMORY_LIMIT_MB = int(os.getenv('INGEST_MEMORY_LIMIT_MB', 1024))
+    # Re-hash every artifact against the manifest at startup instead of only comparing sizes
+    VERIFY_ARTIFACT_CHECKSUMS = os.getenv('VERIFY_ARTIFACT_CHECKSUMS', 'false').lower() == 'true'
+    # Rise in the out-of-vocabulary share of incrementally appended rows that schedules a full refit
+    REFIT_DRIFT_THRESHOLD = float(os.getenv('REFIT_DRIFT_THRESHOLD', 0.1))
 
+    # Cache of get_recommendations: ranked row ids live for RANKING_CACHE_TTL seconds and the
+    # image-enriched recipes for PAYLOAD_CACHE_TTL; a size or TTL of 0 disables that cache
+    RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', 1024))
+    RANKING_CACHE_TTL = float(os.getenv('RANKING_CACHE_TTL', 3600))
+    PAYLOAD_CACHE_TTL = float(os.getenv('PAYLOAD_CACHE_TTL', 300))
+    # Scraped image URLs are cached on disk for IMAGE_CACHE_TTL seconds (0 disables the cache);
+    # recipes the scrapers found nothing for are retried after IMAGE_CACHE_NEGATIVE_TTL
+    IMAGE_CACHE_TTL = float(os.getenv('IMAGE_CACHE_TTL', 7 * 24 * 3600))
+    IMAGE_CACHE_NEGATIVE_TTL = float(os.getenv('IMAGE_CACHE_NEGATIVE_TTL', 3600))
+    # Pooled HTTP connections of the image scrapers, kept for the lifetime of each worker
+    HTTP_CONNECTION_LIMIT = int(os.getenv('HTTP_CONNECTION_LIMIT', 100))
+    HTTP_CONNECTION_LIMIT_PER_HOST = int(os.getenv('HTTP_CONNECTION_LIMIT_PER_HOST', 8))
+    HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 30))
+    HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+    # Image lookups of one request: how many run at once, and the seconds they get in total
+    # before the remaining recipes are answered with placeholder images
+    IMAGE_LOOKUP_CONCURRENCY = int(os.getenv('IMAGE_LOOKUP_CONCURRENCY', 6))
+    IMAGE_LOOKUP_TIME_BUDGET = float(os.getenv('IMAGE_LOOKUP_TIME_BUDGET', 10))
+    # Race the image scrapers, cheapest first and IMAGE_SCRAPER_RACE_WIDTH at a time, stopping
+    # once enough images are found; 'false' waits for all of them up to IMAGE_SCRAPER_TIMEOUT
+    IMAGE_SCRAPER_RACING = os.getenv('IMAGE_SCRAPER_RACING', 'true').lower() == 'true'
+    IMAGE_SCRAPER_RACE_WIDTH = int(os.getenv('IMAGE_SCRAPER_RACE_WIDTH', 2))
+    IMAGE_SCRAPER_TIMEOUT = float(os.getenv('IMAGE_SCRAPER_TIMEOUT', 60))
+    # Candidate image URLs are checked with HEAD requests, this many at once per scraper
+    IMAGE_VERIFY_CONCURRENCY = int(os.getenv('IMAGE_VERIFY_CONCURRENCY', 4))
+    IMAGE_VERIFY_TIMEOUT = float(os.getenv('IMAGE_VERIFY_TIMEOUT', 5))
+    # A scraper is skipped for SCRAPER_BREAKER_OPEN_SECONDS once this share of its recent lookups
+    # failed or took longer than SCRAPER_SLOW_CALL_SECONDS
+    SCRAPER_BREAKER_FAILURE_RATE = float(os.getenv('SCRAPER_BREAKER_FAILURE_RATE', 0.5))
+    SCRAPER_BREAKER_OPEN_SECONDS = float(os.getenv('SCRAPER_BREAKER_OPEN_SECONDS', 30))
+    SCRAPER_SLOW_CALL_SECONDS = float(os.getenv('SCRAPER_SLOW_CALL_SECONDS', 10))
+    # Outputs of the attribute-extraction LLM are memoized per normalized input text, in memory
+    # and in a SQLite store shared by the workers; 'false' calls the LLM every time
+    EXTRACTION_CACHE = os.getenv('EXTRACTION_CACHE', 'true').lower() == 'true'
+    EXTRACTION_CACHE_SIZE = int(os.getenv('EXTRACTION_CACHE_SIZE', 1024))
+    # LLM calls of a worker run on a pool of LLM_MAX_CONCURRENCY threads; a call that gets no
+    # response within LLM_TIMEOUT seconds, queueing included, fails the request with a 504
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))
+    # Inputs that name only a category plus calories or time ("chicken in 30 minutes") reuse the
+    # LLM output for the bare category when at least FAST_PATH_CONFIDENCE of their words are
+    # recognized, and go to the LLM otherwise
+    FAST_PATH_EXTRACTION = os.getenv('FAST_PATH_EXTRACTION', 'true').lower() == 'true'
+    FAST_PATH_CONFIDENCE = float(os.getenv('FAST_PATH_CONFIDENCE', 1.0))
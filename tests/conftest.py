@@ -0,0 +1,25 @@
+import pytest
+from app.services.recommendation import DEFAULT_FEATURE_WEIGHTS
+from app.utils.data_loading import compute_and_save_data, load_precomputed_data
+from app.utils.feature_engineering import QueryVectorBuilder
+from tests.synthetic import write_recipe_csv
+
+@pytest.fixture(scope='session')
+def recipe_csv(tmp_path_factory):
+    return str(write_recipe_csv(tmp_path_factory.mktemp('csv') / 'recipes.csv', 3000))
+
+@pytest.fixture(scope='session')
+def artifacts_dir(recipe_csv, tmp_path_factory):
+    precomputed_dir = str(tmp_path_factory.mktemp('precomputed'))
+    compute_and_save_data(recipe_csv, precomputed_dir, DEFAULT_FEATURE_WEIGHTS, ingest_workers=1)
+    return precomputed_dir
+
+@pytest.fixture(scope='session')
+def catalog(artifacts_dir):
+    return load_precomputed_data(artifacts_dir)
+
+@pytest.fixture(scope='session')
+def query_builder(catalog):
+    return QueryVectorBuilder(catalog['normalized_matrix'].shape[1], catalog['tfidf_vectorizer_ingredients'],
+                              catalog['tfidf_vectorizer_keywords'], catalog['tfidf_vectorizer_keywords_name'],
+                              catalog['category_dummies'], catalog['scaler'])
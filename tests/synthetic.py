@@ -0,0 +1,61 @@
+"""
+Small synthetic recipe catalogs in the format of the recipe CSV.
+"""
+import csv
+import random
+
+CATEGORIES = ['dessert', 'chicken', 'beverages', 'vegetable', 'pie', 'asian', 'breakfast', 'pork', 'rice',
+              'one dish meal', 'lunch/snacks', '< 60 mins']
+INGREDIENTS = ['chicken', 'rice', 'flour', 'sugar', 'butter', 'eggs', 'milk', 'salt', 'pepper', 'garlic', 'onion',
+               'tomatoes', 'basil', 'cheese', 'beef', 'potatoes', 'carrots', 'soy sauce', 'ginger', 'lemon juice',
+               'olive oil', 'chocolate', 'vanilla', 'cream', 'noodles', 'tofu', 'spinach', 'mushrooms', 'paprika',
+               'cumin']
+KEYWORDS = ['Dessert', 'Healthy', 'Easy', 'Weeknight', 'Asian', 'Low Protein', '< 30 Mins', 'Oven', 'Stove Top',
+            'Kid Friendly', 'Beginner Cook', 'Inexpensive', 'Spicy', 'Vegan', 'Brunch']
+NAME_WORDS = ['best', 'easy', "grandma's", 'spicy', 'creamy', 'quick', 'classic', 'baked', 'fried', 'sweet', 'soup',
+              'cake', 'stew', 'salad', 'pasta', 'curry', 'bread', 'pie', 'noodles', 'rice']
+COLUMNS = ['RecipeId', 'Name', 'RecipeCategory', 'RecipeIngredientParts', 'RecipeIngredientQuantities',
+           'RecipeInstructions', 'Keywords', 'keywords_name', 'Calories', 'TotalTime_minutes', 'AggregatedRating',
+           'ReviewCount', 'Description', 'Images', 'is_vegetarian', 'is_vegan', 'is_gluten free', 'is_dairy free',
+           'is_low carb', 'is_keto', 'is_paleo']
+
+def r_vector(values):
+    return 'c(' + ', '.join(f'"{value}"' for value in values) + ')' if values else 'character(0)'
+
+def recipe_rows(n_rows, seed=0, first_id=1):
+    """
+    Rows of a recipe CSV with the missing values and empty vectors of the real dataset.
+    """
+    rng = random.Random(seed)
+    for i in range(n_rows):
+        name_words = rng.sample(NAME_WORDS, rng.randint(1, 3))
+        ingredients = rng.sample(INGREDIENTS, rng.randint(0, 8))
+        quantities = [str(rng.randint(1, 4)) for _ in ingredients] + (['NA'] if rng.random() < 0.1 else [])
+        yield [
+            first_id + i, ' '.join(name_words).title(), rng.choice(CATEGORIES) if rng.random() > 0.02 else '',
+            r_vector(ingredients), r_vector(quantities),
+            r_vector([f'Step {k}, mix well.' for k in range(rng.randint(1, 4))]),
+            r_vector(rng.sample(KEYWORDS, rng.randint(0, 4))) if rng.random() > 0.05 else 'NA',
+            str(name_words) if rng.random() > 0.05 else '',
+            round(rng.uniform(20, 1200), 1) if rng.random() > 0.03 else '',
+            rng.randint(5, 300) if rng.random() > 0.03 else '',
+            round(rng.uniform(1, 5), 1) if rng.random() > 0.1 else '', rng.randint(1, 200), 'A tasty recipe.',
+            r_vector(['https://img.sndimg.com/a.jpg', 'https://img.sndimg.com/b.jpg']) if rng.random() < 0.5 else 'NA'
+        ] + [rng.choice(['TRUE', 'FALSE']) for _ in range(7)]
+
+def write_recipe_csv(path, n_rows, seed=0, first_id=1, rows=None):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(recipe_rows(n_rows, seed, first_id) if rows is None else rows)
+    return path
+
+def text_queries(catalog, n, seed=0):
+    """
+    Keyword arguments of n random text queries over the vocabularies of a loaded catalog.
+    """
+    rng = random.Random(seed)
+    vocabularies = {block: sorted(catalog[f'tfidf_vectorizer_{block}'].vocabulary_)
+                    for block in ['ingredients', 'keywords', 'keywords_name']}
+    for _ in range(n):
+        yield {block: rng.sample(vocabulary, rng.randint(0, 3)) for block, vocabulary in vocabularies.items()}
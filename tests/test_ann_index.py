@@ -0,0 +1,79 @@
+import logging
+import numpy as np
+import pytest
+from app.services.recommendation import DEFAULT_FEATURE_WEIGHTS
+from app.utils.ann_index import ClusterPrunedIndex, evaluate_recall, recall_at_k
+from app.utils.data_loading import load_or_create_ann_index
+from app.utils.recommendation_utils import rank_candidates
+from app.utils.similarity_calculation import calculate_weighted_similarity, cosine_scores, top_k
+from tests.synthetic import text_queries
+
+@pytest.fixture(scope='module')
+def ann_index(catalog):
+    return ClusterPrunedIndex(n_clusters=16, n_probe=4).fit(catalog['normalized_matrix'])
+
+@pytest.fixture(scope='module')
+def query_vectors(catalog, query_builder):
+    return [query_builder.build(DEFAULT_FEATURE_WEIGHTS, **query) for query in text_queries(catalog, 30, seed=2)]
+
+def test_clusters_cover_every_row_once(catalog, ann_index):
+    n_rows = catalog['normalized_matrix'].shape[0]
+    assert sorted(ann_index.order) == list(range(n_rows))
+    assert ann_index.offsets[0] == 0 and ann_index.offsets[-1] == n_rows
+    assert len(ann_index.offsets) == len(ann_index.centroids) + 1
+
+def score_recall(query_vector, matrix, candidates, k):
+    """
+    Fraction of the ANN top-k that scores at least the exact k-th best score. Unlike
+    recall by row id, it does not count tied rows as misses; the synthetic catalog has many.
+    """
+    exact_scores = cosine_scores(query_vector, matrix)
+    candidate_scores = cosine_scores(query_vector, matrix[candidates])
+    return np.mean(candidate_scores[top_k(candidate_scores, k)] >= np.sort(exact_scores)[-k])
+
+def test_recall_grows_with_n_probe_and_is_exact_when_probing_every_cluster(catalog, ann_index, query_vectors):
+    matrix = catalog['normalized_matrix']
+    recalls = {n_probe: np.mean([score_recall(query_vector, matrix, ann_index.search(query_vector, n_probe), 15)
+                                 for query_vector in query_vectors])
+               for n_probe in [1, 2, 4, 8, 16]}
+    assert list(recalls.values()) == sorted(recalls.values())
+    assert recalls[16] == 1.0
+    # Better than the share of the rows that the probed clusters hold on average
+    assert recalls[4] > 4 / 16
+
+def test_recall_report(catalog, ann_index, query_vectors):
+    report = evaluate_recall(ann_index, catalog['normalized_matrix'], query_vectors, k=15, n_probe_values=(1, 16))
+    assert [entry['n_probe'] for entry in report] == [1, 16]
+    assert all(0 <= entry['recall_at_k'] <= 1 and entry['latency_ms'] > 0 for entry in report)
+
+def test_ann_mode_scores_the_probed_clusters_exactly(catalog, ann_index, query_vectors):
+    matrix, df = catalog['normalized_matrix'], catalog['df']
+    for query_vector in query_vectors[:10]:
+        rows, scores = rank_candidates(query_vector, matrix, df, ann_index=ann_index, ann_mode='ann', ann_n_probe=1)
+        candidates = ann_index.search(query_vector, 1)
+        assert set(rows) <= set(candidates)
+        np.testing.assert_allclose(scores, calculate_weighted_similarity(query_vector, matrix, df, rows=rows))
+        candidate_scores = calculate_weighted_similarity(query_vector, matrix, df, rows=candidates)
+        np.testing.assert_allclose(scores, candidate_scores[top_k(candidate_scores, 15)])
+
+def test_audit_mode_returns_the_exact_ranking_and_logs_recall(catalog, ann_index, query_vectors, caplog):
+    matrix, df = catalog['normalized_matrix'], catalog['df']
+    for query_vector in query_vectors[:10]:
+        with caplog.at_level(logging.INFO, logger='app.utils.recommendation_utils'):
+            rows, scores = rank_candidates(query_vector, matrix, df, calories=300, ann_index=ann_index,
+                                           ann_mode='audit', ann_n_probe=1)
+        exact_scores = calculate_weighted_similarity(query_vector, matrix, df, 300)
+        np.testing.assert_array_equal(rows, top_k(exact_scores, 15))
+        np.testing.assert_array_equal(scores, exact_scores[rows])
+    assert caplog.text.count('ANN recall@15') == 10
+
+def test_recall_at_k():
+    assert recall_at_k([1, 2, 3, 4], [4, 3, 9]) == 0.5
+    assert recall_at_k([], [1]) == 1.0
+
+def test_persisted_index_is_rebuilt_when_the_catalog_changes(catalog, tmp_path):
+    matrix = catalog['normalized_matrix']
+    index = load_or_create_ann_index(str(tmp_path), matrix)
+    assert index.n_rows == matrix.shape[0]
+    assert load_or_create_ann_index(str(tmp_path), matrix).n_rows == matrix.shape[0]
+    assert load_or_create_ann_index(str(tmp_path), matrix[:100]).n_rows == 100
@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+from app.services.image_search import ImageSearchService, ScraperTimeoutError
+from app.utils.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+@pytest.fixture
+def clock():
+    return [0.0]
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_rate=0.5, window=10, min_calls=4, open_seconds=30, slow_call_seconds=2,
+                          clock=lambda: clock[0])
+
+def record_all(breaker, outcomes):
+    for success in outcomes:
+        assert breaker.allow()
+        breaker.record(success)
+
+def test_stays_closed_until_min_calls(breaker):
+    record_all(breaker, [False] * 3)
+    assert breaker.state == CLOSED
+    record_all(breaker, [False])
+    assert breaker.state == OPEN and breaker.times_opened == 1
+
+def test_opens_at_the_failure_rate_over_the_window(breaker):
+    record_all(breaker, [True, True, True, False, False])
+    assert breaker.state == CLOSED
+    record_all(breaker, [False])
+    assert breaker.state == OPEN
+
+def test_rate_is_over_the_last_window_calls(breaker):
+    record_all(breaker, [True, True, True, False] + [True] * 6 + [False] * 4)
+    assert breaker.state == CLOSED
+    # 5 of the last 10 calls failed, though only 6 of all 15 did
+    record_all(breaker, [False])
+    assert breaker.state == OPEN
+
+def test_slow_calls_count_as_failures(breaker):
+    for _ in range(4):
+        assert breaker.allow()
+        breaker.record(True, latency=3)
+    assert breaker.state == OPEN
+
+def test_open_refuses_calls_until_open_seconds_pass(breaker, clock):
+    record_all(breaker, [False] * 4)
+    clock[0] += 29
+    assert not breaker.allow() and not breaker.allow()
+    assert breaker.rejected == 2
+    assert breaker.snapshot()['retry_in_seconds'] == 1.0
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+def test_half_open_lets_one_trial_through_and_closes_on_success(breaker, clock):
+    record_all(breaker, [False] * 4)
+    clock[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True, latency=0.5)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()['recent_calls'] == 0
+    assert breaker.allow()
+
+def test_failed_trial_opens_again(breaker, clock):
+    record_all(breaker, [False] * 4)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.times_opened == 2
+    clock[0] += 29
+    assert not breaker.allow()
+
+def test_released_trial_lets_another_through(breaker, clock):
+    record_all(breaker, [False] * 4)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+@pytest.fixture
+def service():
+    service = ImageSearchService(breaker_failure_rate=0.5, breaker_open_seconds=30, scraper_timeout=1,
+                                 min_scraper_timeout=0.1, timeout_margin=2)
+    yield service
+    service.close()
+
+def test_scraper_failures_and_timeouts_open_its_breaker(service):
+    scraper = service.scrapers[0]
+    name = type(scraper).__name__
+
+    async def failing(recipe_name, num_images):
+        raise RuntimeError('blocked')
+
+    async def hanging(recipe_name, num_images):
+        await asyncio.sleep(10)
+
+    async def run(search_images, calls):
+        scraper.search_images = search_images
+        for _ in range(calls):
+            with pytest.raises((RuntimeError, ScraperTimeoutError)):
+                await service.run_scraper(scraper, 'soup', 3)
+
+    asyncio.run(run(failing, 2))
+    asyncio.run(run(hanging, 3))
+    assert service.breakers[name].state == OPEN
+    assert scraper not in service.available_scrapers()
+    assert all(other in service.available_scrapers() for other in service.scrapers[1:])
+
+def test_cancelled_lookup_releases_the_trial_call(service):
+    scraper = service.scrapers[0]
+    breaker = service.breakers[type(scraper).__name__]
+    breaker.state, breaker.opened_at = OPEN, breaker.clock() - 60
+
+    async def hanging(recipe_name, num_images):
+        await asyncio.sleep(10)
+
+    async def cancel_trial():
+        scraper.search_images = hanging
+        assert breaker.allow()
+        task = asyncio.create_task(service.run_scraper(scraper, 'soup', 3))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(cancel_trial())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+def test_adaptive_timeout_follows_p95_within_bounds(service):
+    scraper = service.scrapers[0]
+    stats = service.stats[type(scraper).__name__]
+    assert service.adaptive_timeout(scraper) == service.scraper_timeout
+    for latency in [0.01] * 5:
+        stats.record_completed(latency)
+    assert service.adaptive_timeout(scraper) == service.min_scraper_timeout
+    for latency in [0.2] * 20:
+        stats.record_completed(latency)
+    assert service.adaptive_timeout(scraper) == pytest.approx(0.4)
+    for latency in [5.0] * 20:
+        stats.record_completed(latency)
+    assert service.adaptive_timeout(scraper) == service.scraper_timeout
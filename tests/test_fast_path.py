@@ -0,0 +1,93 @@
+import asyncio
+import json
+import pytest
+from app.services import extraction
+from app.services.extraction import FastPathExtractor
+
+def output(category, ingredients, keywords, keywords_name, calories='', time=''):
+    return json.dumps({'category': category, 'calories': calories, 'time': time, 'ingredients': ingredients,
+                       'keywords': keywords, 'keywords_name': keywords_name})
+
+DESSERT = (['sugar', 'flour', 'butter', 'eggs'], ['dessert', 'sweet', 'baking'], ['dessert'])
+CHICKEN = (['chicken', 'salt', 'pepper', 'oil'], ['chicken', 'main course', 'protein'], ['chicken'])
+# Model outputs in the prompt's format, as the response cache stores them
+RECORDED = {
+    'dessert': output('dessert', *DESSERT),
+    'desserts under 300 calories': output('dessert', DESSERT[0], DESSERT[1] + ['300 calories'], DESSERT[2],
+                                          calories='300'),
+    'a desert in 45 mins': output('dessert', DESSERT[0], DESSERT[1] + ['45 minutes'], DESSERT[2], time='45'),
+    'chicken': output('chicken', *CHICKEN),
+    'chicken in 30 minutes': output('chicken', CHICKEN[0], CHICKEN[1] + ['30 minutes'], CHICKEN[2], time='30'),
+    'chiken recipe in 1 hour': output('chicken', CHICKEN[0], CHICKEN[1] + ['60 minutes'], CHICKEN[2],
+                                        time='60'),
+    'chicken with garlic': output('chicken', ['chicken', 'garlic', 'salt', 'oil'],
+                                  ['chicken', 'garlic', 'savory'], ['chicken', 'garlic']),
+    'spicy chicken': output('chicken', ['chicken', 'chili', 'paprika', 'oil'],
+                            ['chicken', 'spicy', 'hot'], ['chicken', 'spicy']),
+    'vegan dessert': output('dessert', ['coconut milk', 'sugar', 'flour', 'oil'],
+                            ['vegan', 'dessert', 'dairy-free'], ['vegan', 'dessert']),
+    'lemon chicken': output('chicken', ['chicken', 'lemon', 'garlic', 'oil'],
+                            ['chicken', 'lemon', 'citrus'], ['lemon', 'chicken']),
+    'under 300 calories': output('', [], ['300 calories', 'low calorie', 'healthy'], ['']),
+    'beef tacos': output('beef organ meats', ['beef', 'tortillas', 'lettuce', 'tomatoes'],
+                         ['mexican', 'beef', 'street food'], ['mexican', 'beef']),
+}
+SIMPLE = {'dessert', 'desserts under 300 calories', 'a desert in 45 mins', 'chicken', 'chicken in 30 minutes',
+          'chiken recipe in 1 hour'}
+
+@pytest.fixture
+def model(monkeypatch, query_builder):
+    calls = []
+
+    async def generate_output(text):
+        calls.append(text)
+        return RECORDED[text]
+
+    monkeypatch.setattr(extraction, 'generate_output', generate_output)
+    monkeypatch.setattr(extraction, 'response_cache', None)
+    monkeypatch.setattr(extraction, 'fast_path', None)
+    extraction.enable_fast_path(query_builder.compiled('ingredients'))
+    return calls
+
+def test_fast_path_agrees_with_the_model(model):
+    answered = set()
+    for text, recorded in RECORDED.items():
+        hits = extraction.fast_path.hits
+        result = asyncio.run(extraction.extract_recipe_attributes(text))
+        if extraction.fast_path.hits > hits:
+            answered.add(text)
+        expected = extraction.refine_attributes(json.loads(recorded), text)
+        assert sorted(result.pop('keywords')) == sorted(expected.pop('keywords')), text
+        assert result == expected, text
+    assert answered == SIMPLE
+    # Simple inputs only asked the model about their category
+    assert set(model) == (set(RECORDED) - SIMPLE) | {'dessert', 'chicken'}
+
+def test_one_model_output_serves_every_query_about_a_category(model, tmp_path):
+    extraction.enable_response_cache(str(tmp_path / 'llm.db'))
+    for text in ['desserts under 300 calories', 'dessert', 'a desert in 45 mins']:
+        asyncio.run(extraction.extract_recipe_attributes(text))
+    assert model == ['dessert']
+
+@pytest.mark.parametrize('text, confidence, attributes', [
+    ('Chicken in 30 minutes', 1.0, {'category': 'chicken', 'time': '30', 'keywords': ['30 minutes']}),
+    ('chicken breasts for 2 hrs', 1.0, {'category': 'chicken breast', 'time': '120'}),
+    ('show me a dessert recipe under 250 kcal', 1.0, {'category': 'dessert', 'calories': '250'}),
+    ('chicken with garlic', 0.5, {'category': 'chicken'}),
+    ('lemon chicken', 0.5, {'category': 'lemon'}),
+    ('garlic butter in 10 minutes', 0.0, {'category': '', 'time': '10'}),
+    ('', 0.0, {'category': ''}),
+])
+def test_confidence(query_builder, text, confidence, attributes):
+    extractor = FastPathExtractor(query_builder.compiled('ingredients'))
+    result, score = extractor.extract(text)
+    assert score == confidence
+    assert {key: result[key] for key in attributes} == attributes
+    assert (extractor.try_extract(text) is not None) == (confidence == 1.0)
+    assert extractor.stats()['hit_rate'] == (confidence == 1.0)
+
+def test_threshold(query_builder):
+    extractor = FastPathExtractor(query_builder.compiled('ingredients'), threshold=0.5)
+    assert extractor.try_extract('chicken with garlic') is not None
+    assert extractor.try_extract('garlic with chicken and onions') is None
+    assert extractor.stats() == {'threshold': 0.5, 'attempts': 2, 'hits': 1, 'hit_rate': 0.5}
@@ -0,0 +1,25 @@
+import random
+import re
+import pytest
+from benchmarks.html_extraction import FIXTURES_DIR, SITES, fixture_page
+
+@pytest.mark.parametrize('site', list(SITES))
+def test_saved_pages_match_beautifulsoup(site):
+    scraper, reference, _ = SITES[site]
+    html = fixture_page(FIXTURES_DIR, site)
+    candidates = scraper.extract_candidates(html)
+    assert candidates and candidates == reference(html)
+
+@pytest.mark.parametrize('site', list(SITES))
+def test_synthetic_pages_match_beautifulsoup(site):
+    scraper, reference, generators = SITES[site]
+    rng = random.Random(0)
+    for _ in range(5):
+        html = rng.choice(generators)(rng)
+        assert scraper.extract_candidates(html) == reference(html)
+
+def test_saved_pages_have_the_markup_the_scan_must_handle():
+    pages = [fixture_page(FIXTURES_DIR, site) for site in SITES]
+    assert all(re.search(r'<[A-Z]+[\s>]', html) for html in pages)
+    assert all(re.search(r'\ssrcset=', html, re.I) for html in pages)
+    assert all(re.search(r'''\s(?:src|data-src)=[^\s"'>]''', html, re.I) for html in pages)
@@ -0,0 +1,77 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from app.services.image_search import ImageSearchService
+from app.utils.image_cache import ImageUrlCache
+from app.utils.recommendation_utils import build_recipes
+
+@pytest.fixture
+def service(tmp_path):
+    service = ImageSearchService(image_cache=ImageUrlCache(str(tmp_path / 'images.db')))
+    yield service
+    service.close()
+
+def fake_scraper(service, urls, delay=0.0, error=None):
+    """
+    Replace the scrapers of the service; returns the list of recipe names looked up.
+    """
+    calls = []
+
+    async def scrape_images(recipe_name, num_images):
+        calls.append(recipe_name)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return urls[:num_images]
+
+    service.scrape_images = scrape_images
+    return calls
+
+def recipe_row(catalog, name):
+    return {**catalog['df'].row(0), 'Name': name, 'Images': np.nan}
+
+def wait_for_cache(service, name, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        urls = service.image_cache.get(name, 3)
+        if urls is not None:
+            return urls
+        time.sleep(0.02)
+    return None
+
+def test_lookup_past_the_time_budget_is_still_cached(service, catalog):
+    urls = ['https://example.com/soup-1.jpg', 'https://example.com/soup-2.jpg', 'https://example.com/soup-3.jpg']
+    calls = fake_scraper(service, urls, delay=0.3)
+
+    recipes = asyncio.run(build_recipes(service, [(recipe_row(catalog, 'Slow Soup'), 0.9)], time_budget=0.05))
+    assert all(url in service.placeholder_images for url in recipes[0].Images)
+
+    assert wait_for_cache(service, 'Slow Soup') == urls
+    recipes = asyncio.run(build_recipes(service, [(recipe_row(catalog, 'Slow Soup'), 0.9)], time_budget=1))
+    assert recipes[0].Images == urls
+    assert calls == ['Slow Soup']
+
+def test_waiters_share_one_lookup(service):
+    urls = ['https://example.com/stew.jpg']
+    calls = fake_scraper(service, urls, delay=0.2)
+
+    async def search_concurrently():
+        return await asyncio.gather(*[service.search_recipe_images('Beef Stew', np.nan, 3) for _ in range(5)])
+
+    assert asyncio.run(search_concurrently()) == [urls] * 5
+    assert calls == ['Beef Stew']
+
+def test_failed_lookup_gives_waiters_placeholders(service):
+    calls = fake_scraper(service, [], delay=0.2, error=RuntimeError('scraper down'))
+
+    async def search_concurrently():
+        return await asyncio.gather(*[service.search_recipe_images('Beef Stew', np.nan, 3) for _ in range(5)])
+
+    for images in asyncio.run(search_concurrently()):
+        assert len(images) == 3 and all(url in service.placeholder_images for url in images)
+    assert calls == ['Beef Stew']
+    # The failure is not cached, so the next request tries again
+    assert service.image_cache.get('Beef Stew', 3) is None
+    asyncio.run(service.search_recipe_images('Beef Stew', np.nan, 3))
+    assert calls == ['Beef Stew', 'Beef Stew']
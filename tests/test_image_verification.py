@@ -0,0 +1,101 @@
+import asyncio
+import time
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.utils.cache import TTLCache
+from app.utils.scrapers.base_scraper import BaseScraper
+
+class FakeScraper(BaseScraper):
+    """
+    A scraper whose URL checks take `delays[url]` seconds and return `outcomes[url]`.
+    """
+
+    def __init__(self, outcomes, delays=None):
+        super().__init__()
+        self.outcomes = outcomes
+        self.delays = delays or {}
+        self.checked = []
+        self.running = self.max_running = 0
+
+    async def search_images(self, recipe_name, num_images):
+        return []
+
+    async def verify_image_url(self, url):
+        self.checked.append(url)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delays.get(url, 0.01))
+            return self.outcomes[url]
+        finally:
+            self.running -= 1
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(BaseScraper, 'url_checks', TTLCache(max_entries=100, ttl=3600, clock=lambda: now[0]))
+    return now
+
+def test_checks_run_concurrently_and_stop_once_enough_pass(clock):
+    urls = [f'https://example.com/{i}.jpg' for i in range(20)]
+    scraper = FakeScraper({url: i % 2 == 0 for i, url in enumerate(urls)})
+    scraper.verify_concurrency = 4
+    valid = asyncio.run(scraper.verify_image_urls(urls, 3))
+    assert len(valid) == 3 and all(scraper.outcomes[url] for url in valid)
+    assert scraper.max_running == 4
+    assert len(scraper.checked) < len(urls)
+
+def test_slow_checks_are_cancelled_once_enough_pass(clock):
+    urls = ['https://example.com/fast.jpg', 'https://example.com/slow.jpg']
+    scraper = FakeScraper({url: True for url in urls}, delays={urls[1]: 30})
+    start = time.monotonic()
+    assert asyncio.run(scraper.verify_image_urls(urls, 1)) == [urls[0]]
+    assert time.monotonic() - start < 5
+    # A cancelled check leaves no outcome behind
+    assert BaseScraper.url_checks.get(urls[1]) is None
+
+def test_outcomes_are_cached_and_failures_expire_sooner(clock):
+    urls = ['https://example.com/a.jpg', 'https://example.com/missing.jpg', 'https://example.com/a.jpg']
+    scraper = FakeScraper({urls[0]: True, urls[1]: False})
+    assert asyncio.run(scraper.verify_image_urls(urls, 3)) == [urls[0]]
+    assert scraper.checked == urls[:2]
+
+    assert asyncio.run(scraper.verify_image_urls(urls, 3)) == [urls[0]]
+    assert scraper.checked == urls[:2]
+
+    clock[0] += BaseScraper.failed_check_ttl + 1
+    assert asyncio.run(scraper.verify_image_urls(urls, 3)) == [urls[0]]
+    assert scraper.checked == urls[:2] + [urls[1]]
+
+def test_verify_image_url_against_a_server(clock):
+    async def image(request):
+        return web.Response(body=b'\xff\xd8', content_type='image/jpeg')
+
+    async def page(request):
+        return web.Response(text='<html></html>', content_type='text/html')
+
+    async def moved(request):
+        raise web.HTTPFound('/photo.jpg')
+
+    async def slow(request):
+        await asyncio.sleep(5)
+        return web.Response(body=b'', content_type='image/png')
+
+    app = web.Application()
+    app.router.add_route('HEAD', '/photo.jpg', image)
+    app.router.add_route('HEAD', '/placeholder.jpg', image)
+    app.router.add_route('HEAD', '/page', page)
+    app.router.add_route('HEAD', '/slow.png', slow)
+    app.router.add_route('HEAD', '/moved.jpg', moved)
+
+    async def check():
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            scraper = FakeScraper({})
+            scraper.session = session
+            scraper.verify_timeout = 0.5
+            paths = ['/photo.jpg', '/moved.jpg', '/placeholder.jpg', '/page', '/missing.jpg', '/slow.png']
+            return [await BaseScraper.verify_image_url(scraper, str(server.make_url(path))) for path in paths]
+
+    assert asyncio.run(check()) == [True, True, False, False, False, False]
@@ -0,0 +1,136 @@
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from app.services.recommendation import DEFAULT_FEATURE_WEIGHTS
+from app.utils.artifact_store import directory_lock, load_array, load_csr
+from app.utils.data_loading import (load_or_create_data, load_update_state, refit_catalog,
+                                    compute_and_save_data, load_precomputed_data)
+from app.utils.data_preprocessing import NUMERICAL_COLUMNS
+from app.utils.feature_engineering import QueryVectorBuilder
+from app.utils.incremental_update import apply_delta
+from app.utils.recipe_store import RecipeStore
+from app.utils.recommendation_utils import rank_candidates
+from app.utils.similarity_calculation import cosine_scores, top_k
+from tests.synthetic import recipe_rows, COLUMNS
+
+@pytest.fixture(scope='module')
+def updated(recipe_csv, artifacts_dir, tmp_path_factory):
+    """
+    A copy of the catalog after a delta of new, re-added, changed and deleted recipes.
+    """
+    precomputed_dir = str(tmp_path_factory.mktemp('updated') / 'precomputed')
+    shutil.copytree(artifacts_dir, precomputed_dir)
+    before = load_or_create_data(recipe_csv, precomputed_dir, DEFAULT_FEATURE_WEIGHTS)
+
+    base = pd.read_csv(recipe_csv)
+    new = pd.DataFrame(list(recipe_rows(100, seed=7, first_id=10001)), columns=COLUMNS)
+    changed = base.iloc[10:20].copy()
+    changed['Keywords'] = 'c("Dessert", "Easy")'
+    changed['Calories'] = 123.0
+    deleted = base.iloc[20:40][['RecipeId']].assign(deleted=True)
+    delta = pd.concat([new, base.iloc[0:10], changed, deleted], ignore_index=True)
+    delta_path = tmp_path_factory.mktemp('delta') / 'delta.csv'
+    delta.to_csv(delta_path, index=False)
+
+    state = apply_delta(str(delta_path), precomputed_dir, DEFAULT_FEATURE_WEIGHTS, refit_drift_threshold=1.0)
+    after = load_or_create_data(recipe_csv, precomputed_dir, DEFAULT_FEATURE_WEIGHTS, build_ann_index=True,
+                                build_inverted_index=True)
+    return {'before': before, 'after': after, 'state': state, 'base': base, 'new': new, 'delta': delta,
+            'precomputed_dir': precomputed_dir}
+
+def live_rows(data):
+    return np.flatnonzero(~np.asarray(data['df'].tombstones))
+
+def test_delta_tombstones_and_appends(updated):
+    after, base = updated['after'], updated['base']
+    ids = np.asarray(after['df']['RecipeId'])[live_rows(after)]
+    expected = set(base['RecipeId']) - set(base['RecipeId'].iloc[20:40]) | set(updated['new']['RecipeId'])
+    assert sorted(ids) == sorted(expected)
+    assert updated['state']['tombstoned_rows'] == 40 and updated['state']['appended_rows'] == 120
+    assert not load_update_state(updated['precomputed_dir'])['refit_scheduled']
+
+def test_re_added_recipes_reproduce_their_rows(updated):
+    before, after = updated['before'], updated['after']
+    before_ids, after_ids = np.asarray(before['df']['RecipeId']), np.asarray(after['df']['RecipeId'])
+    live = ~np.asarray(after['df'].tombstones)
+    for recipe_id in updated['base']['RecipeId'].iloc[0:10]:
+        old = np.flatnonzero(before_ids == recipe_id)[0]
+        new = np.flatnonzero((after_ids == recipe_id) & live)[0]
+        old_row, new_row = before['normalized_matrix'][old], after['normalized_matrix'][new]
+        np.testing.assert_array_equal(old_row.indices, new_row.indices)
+        np.testing.assert_allclose(old_row.data, new_row.data, rtol=0, atol=1e-15)
+
+@pytest.mark.parametrize('path', ['scan', 'inverted_index', 'ann_audit'])
+@pytest.mark.parametrize('query', [
+    {'ingredients': ['sugar', 'butter']},
+    {'keywords': ['Dessert', 'Easy']},
+    {'keywords_name': ['salad'], 'ingredients': ['rice']},
+    {'category': 'dessert', 'ingredients': ['salt']},
+    {'category': 'pie'},
+])
+def test_ranking_after_delta_matches_a_scan_of_live_rows(updated, path, query):
+    data = updated['after']
+    matrix, store = data['normalized_matrix'], data['df']
+    builder = QueryVectorBuilder(matrix.shape[1], data['tfidf_vectorizer_ingredients'],
+                                 data['tfidf_vectorizer_keywords'], data['tfidf_vectorizer_keywords_name'],
+                                 data['category_dummies'], data['scaler'])
+    query_vector = builder.build(DEFAULT_FEATURE_WEIGHTS, **query)
+    indexes = {'scan': {}, 'inverted_index': {'inverted_index': data['inverted_index']},
+               'ann_audit': {'ann_index': data['ann_index'], 'ann_mode': 'audit'}}[path]
+    rows, scores = rank_candidates(query_vector, matrix, store, query.get('category'), limit=18,
+                                   category_partitions=data['category_partitions'], **indexes)
+    rows = rows[np.isfinite(scores)]
+
+    candidates = live_rows(data)
+    if query.get('category'):
+        candidates = candidates[np.asarray(store['RecipeCategory'])[candidates] == query['category']]
+    live_scores = cosine_scores(query_vector, matrix[candidates])
+    np.testing.assert_array_equal(rows, candidates[top_k(live_scores, 18)])
+
+def test_refit_after_delta_matches_a_rebuild_from_the_live_rows(updated, tmp_path):
+    refit_dir = str(tmp_path / 'refit')
+    shutil.copytree(updated['precomputed_dir'], refit_dir)
+    refit_catalog(refit_dir, DEFAULT_FEATURE_WEIGHTS)
+
+    # The CSV the live catalog corresponds to: the untouched base rows, then the upserts in
+    # delta order. Missing numbers are filled when a row enters the catalog, so they are
+    # filled here too: with the medians of the first build and of the catalog the delta met.
+    base, delta, before = updated['base'], updated['delta'], updated['before']['df']
+    upserts = delta[delta['deleted'] != True].drop(columns='deleted')
+    base = base.fillna({col: base[col].median() for col in NUMERICAL_COLUMNS})
+    upserts = upserts.fillna({col: float(np.median(np.asarray(before[col]))) for col in NUMERICAL_COLUMNS})
+    csv_path = tmp_path / 'live.csv'
+    pd.concat([base.iloc[40:], upserts], ignore_index=True).to_csv(csv_path, index=False)
+    rebuild_dir = str(tmp_path / 'rebuild')
+    compute_and_save_data(str(csv_path), rebuild_dir, DEFAULT_FEATURE_WEIGHTS, ingest_workers=1)
+
+    refit, rebuild = load_csr(f'{refit_dir}/normalized_matrix'), load_csr(f'{rebuild_dir}/normalized_matrix')
+    for part in ['data', 'indices', 'indptr']:
+        np.testing.assert_array_equal(getattr(refit, part), getattr(rebuild, part))
+    np.testing.assert_array_equal(load_array(refit_dir, 'row_norms'), load_array(rebuild_dir, 'row_norms'))
+    refit_store, rebuild_store = RecipeStore(f'{refit_dir}/df'), RecipeStore(f'{rebuild_dir}/df')
+    assert refit_store.tombstones is None and refit_store.kinds == rebuild_store.kinds
+    for column in refit_store.columns:
+        for part, array in refit_store.arrays[column].items():
+            np.testing.assert_array_equal(array, rebuild_store.arrays[column][part])
+    refit_data, rebuild_data = load_precomputed_data(refit_dir), load_precomputed_data(rebuild_dir)
+    assert refit_data['category_partitions'] == rebuild_data['category_partitions']
+    for block in ['ingredients', 'keywords', 'keywords_name']:
+        assert refit_data[f'tfidf_vectorizer_{block}'].vocabulary_ == rebuild_data[f'tfidf_vectorizer_{block}'].vocabulary_
+
+def test_delta_waits_for_the_directory_lock(recipe_csv, artifacts_dir, tmp_path):
+    precomputed_dir = str(tmp_path / 'precomputed')
+    shutil.copytree(artifacts_dir, precomputed_dir)
+    delta_path = tmp_path / 'delta.csv'
+    pd.read_csv(recipe_csv).iloc[:1][['RecipeId']].assign(deleted=True).to_csv(delta_path, index=False)
+
+    applied = threading.Event()
+    worker = threading.Thread(target=lambda: (apply_delta(str(delta_path), precomputed_dir, DEFAULT_FEATURE_WEIGHTS),
+                                              applied.set()))
+    with directory_lock(precomputed_dir):
+        worker.start()
+        assert not applied.wait(0.5)
+    worker.join(30)
+    assert applied.is_set()
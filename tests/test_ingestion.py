@@ -0,0 +1,51 @@
+import logging
+import numpy as np
+import pandas as pd
+import pytest
+from app.utils.category_partitions import sort_by_category
+from app.utils.data_preprocessing import preprocess_data
+from app.utils.ingestion import ingest_csv
+
+@pytest.fixture(scope='module')
+def messy_csv(recipe_csv, tmp_path_factory):
+    """
+    600 recipes with missing numbers and a description column that is empty for the
+    whole first chunk at a 1 MB memory limit.
+    """
+    raw = pd.read_csv(recipe_csv).iloc[:600].copy()
+    rng = np.random.default_rng(0)
+    for col in ['Calories', 'TotalTime_minutes', 'AggregatedRating', 'ReviewCount', 'Images']:
+        raw.loc[rng.choice(len(raw), 60, replace=False), col] = np.nan
+    raw.loc[:149, 'Description'] = np.nan
+    path = tmp_path_factory.mktemp('messy') / 'messy.csv'
+    raw.to_csv(path, index=False)
+    return str(path)
+
+def assert_same_values(actual, expected):
+    assert len(actual) == len(expected)
+    for x, y in zip(actual, expected):
+        assert x == y or (isinstance(x, float) and isinstance(y, float) and np.isnan(x) and np.isnan(y))
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_small_memory_limit_matches_preprocess_data(messy_csv, tmp_path, caplog, workers):
+    with caplog.at_level(logging.INFO, logger='app.utils.ingestion'):
+        store = ingest_csv(messy_csv, str(tmp_path / 'df'), str(tmp_path / 'scratch'), memory_limit_mb=1,
+                           workers=workers)
+    assert 'from 6 chunks' in caplog.text
+
+    expected = sort_by_category(preprocess_data(pd.read_csv(messy_csv)))
+    assert store.columns == list(expected.columns)
+    # An all-NaN chunk does not turn the column numeric
+    assert store.kinds['Description'] == 'text'
+    for col in expected.columns:
+        if store.kinds[col] == 'numeric':
+            assert np.asarray(store[col]).dtype == expected[col].dtype
+            np.testing.assert_array_equal(np.asarray(store[col]), expected[col].to_numpy())
+        else:
+            assert_same_values(store[col], list(expected[col]))
+
+def test_chunked_column_reads(messy_csv, tmp_path):
+    store = ingest_csv(messy_csv, str(tmp_path / 'df'), str(tmp_path / 'scratch'), workers=1)
+    for col in ['Description', 'Keywords', 'Calories']:
+        assert_same_values(list(store.iter_column(col, chunk_rows=7)), list(store[col]))
+    assert store.decode_column('RecipeIngredientParts', 95, 105) == store['RecipeIngredientParts'][95:105]
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from app.services.recommendation import DEFAULT_FEATURE_WEIGHTS
+from app.utils.data_loading import load_or_create_inverted_index
+from app.utils.feature_engineering import feature_block_layout
+from app.utils.inverted_index import BlockMaxInvertedIndex
+from app.utils.recommendation_utils import rank_candidates
+from app.utils.similarity_calculation import calculate_weighted_similarity, cosine_scores, top_k
+from tests.synthetic import text_queries
+
+EXTRACT_WEIGHTS = {'ingredients': 0.50, 'category': 0.0, 'dietary': 0.0, 'calories': 0.0, 'time': 0.0,
+                   'keywords': 0.40, 'keywords_name': 0.10}
+
+@pytest.fixture(scope='module')
+def index(catalog):
+    layout = feature_block_layout(catalog['tfidf_vectorizer_ingredients'], catalog['tfidf_vectorizer_keywords'],
+                                  catalog['tfidf_vectorizer_keywords_name'], catalog['category_dummies'])
+    columns = np.concatenate([np.arange(*layout[block]) for block in ['ingredients', 'keywords', 'keywords_name']])
+    # Small blocks so that pruning has many blocks to skip
+    return BlockMaxInvertedIndex(block_size=64).fit(catalog['normalized_matrix'], columns)
+
+@pytest.mark.parametrize('feature_weights', [DEFAULT_FEATURE_WEIGHTS, EXTRACT_WEIGHTS], ids=['default', 'extract'])
+@pytest.mark.parametrize('limit', [1, 15, 60])
+def test_index_serves_text_queries_with_the_exact_ranking(catalog, query_builder, index, feature_weights, limit):
+    matrix = catalog['normalized_matrix']
+    for query in text_queries(catalog, 40):
+        query_vector = query_builder.build(feature_weights, **query)
+        result = index.search(query_vector, matrix, limit)
+        assert result is not None
+        scores = cosine_scores(query_vector, matrix)
+        expected = top_k(scores, limit)
+        np.testing.assert_array_equal(result[0], expected)
+        np.testing.assert_array_equal(result[1], scores[expected])
+
+def test_default_weights_put_negative_entries_outside_the_posting_lists(catalog, query_builder, index):
+    # The scaled zero calories and time of a text-only query, which the index has to bound
+    query_vector = query_builder.build(DEFAULT_FEATURE_WEIGHTS, ingredients=['garlic'])
+    assert (query_vector.data < 0).any()
+
+def test_index_skips_excluded_rows(catalog, query_builder, index):
+    matrix = catalog['normalized_matrix']
+    excluded = np.random.RandomState(0).rand(matrix.shape[0]) < 0.2
+    for query in text_queries(catalog, 20, seed=1):
+        query_vector = query_builder.build(DEFAULT_FEATURE_WEIGHTS, **query)
+        rows, scores = index.search(query_vector, matrix, 15, excluded=excluded)
+        full_scores = cosine_scores(query_vector, matrix)
+        full_scores[excluded] = -np.inf
+        expected = top_k(full_scores, 15)
+        np.testing.assert_array_equal(rows, expected)
+        np.testing.assert_array_equal(scores, full_scores[expected])
+
+def test_rank_candidates_answers_from_the_index(catalog, query_builder, index, monkeypatch):
+    matrix, df = catalog['normalized_matrix'], catalog['df']
+    served = []
+    search = index.search
+    monkeypatch.setattr(index, 'search', lambda *args, **kwargs: served.append(search(*args, **kwargs)) or served[-1])
+    for query in text_queries(catalog, 10, seed=2):
+        query_vector = query_builder.build(DEFAULT_FEATURE_WEIGHTS, **query)
+        rows, scores = rank_candidates(query_vector, matrix, df, limit=15, inverted_index=index)
+        full_scores = calculate_weighted_similarity(query_vector, matrix, df)
+        np.testing.assert_array_equal(rows, top_k(full_scores, 15))
+    assert len(served) == 10 and all(result is not None for result in served)
+
+def test_persisted_index_round_trips(artifacts_dir, catalog, query_builder):
+    index = load_or_create_inverted_index(artifacts_dir, catalog)
+    query_vector = query_builder.build(DEFAULT_FEATURE_WEIGHTS, ingredients=['garlic', 'onion'], keywords=['Easy'])
+    rows, _ = index.search(query_vector, catalog['normalized_matrix'], 15)
+    np.testing.assert_array_equal(rows, top_k(cosine_scores(query_vector, catalog['normalized_matrix']), 15))
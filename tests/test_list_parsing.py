@@ -0,0 +1,27 @@
+import random
+import pandas as pd
+import pytest
+from app.utils.data_preprocessing import (parse_list_string, parse_list_string_column, parse_r_vector,
+                                          preprocess_chunk)
+from benchmarks.list_parsing import LIST_EDGE_CASES, list_cell, make_column
+
+def assert_same_lists(cells, actual):
+    expected = [parse_list_string(cell) for cell in cells]
+    assert actual == expected
+    assert [[type(token) for token in row] for row in actual] == [[type(token) for token in row] for row in expected]
+
+def test_column_parser_matches_per_cell_parser_on_edge_cases():
+    assert_same_lists(LIST_EDGE_CASES, parse_list_string_column(LIST_EDGE_CASES))
+
+@pytest.mark.parametrize('seed', range(5))
+def test_column_parser_matches_per_cell_parser_on_mixed_columns(seed):
+    cells = make_column(random.Random(seed), 2000, list_cell, LIST_EDGE_CASES, 0.2)
+    assert_same_lists(cells, parse_list_string_column(cells))
+
+def test_preprocess_chunk_matches_per_cell_parsing(recipe_csv):
+    raw = pd.read_csv(recipe_csv)
+    df = preprocess_chunk(raw.copy())
+    for col in ['RecipeIngredientParts', 'RecipeInstructions', 'RecipeIngredientQuantities']:
+        assert df[col].tolist() == raw[col].apply(parse_r_vector).tolist()
+    for col in ['Keywords', 'keywords_name']:
+        assert df[col].tolist() == raw[col].apply(parse_list_string).tolist()
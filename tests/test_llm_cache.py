@@ -0,0 +1,73 @@
+import asyncio
+import json
+import pytest
+from app.services import extraction
+from app.utils.llm_cache import LLMResponseCache, normalize_input
+
+OUTPUT = json.dumps({'category': 'dessert', 'calories': '', 'time': '', 'ingredients': ['sugar'],
+                     'keywords': ['dessert'], 'keywords_name': ['dessert']})
+
+def test_normalized_inputs_share_an_entry(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / 'llm.db'), 'v1')
+    cache.set('  Chocolate   Cake!', OUTPUT, 1.5)
+    assert normalize_input('chocolate cake') == normalize_input('  Chocolate   Cake!')
+    assert cache.get('chocolate cake') == OUTPUT
+    assert cache.get('chocolate cakes') is None
+
+def test_entries_persist_across_instances(tmp_path):
+    LLMResponseCache(str(tmp_path / 'llm.db'), 'v1').set('chocolate cake', OUTPUT, 1.5)
+    cache = LLMResponseCache(str(tmp_path / 'llm.db'), 'v1')
+    assert cache.get('chocolate cake') == OUTPUT
+    assert cache.get('chocolate cake') == OUTPUT
+    stats = cache.stats()
+    assert (stats['disk_hits'], stats['memory_hits'], stats['misses']) == (1, 1, 0)
+    assert stats['saved_llm_seconds'] == 3.0
+
+def test_prompt_version_change_misses_and_purges_old_entries(tmp_path):
+    path = str(tmp_path / 'llm.db')
+    LLMResponseCache(path, 'v1').set('chocolate cake', OUTPUT, 1.5)
+    assert LLMResponseCache(path, 'v2').get('chocolate cake') is None
+    # Opening the new version purged the old entry from disk
+    assert LLMResponseCache(path, 'v1').get('chocolate cake') is None
+
+@pytest.mark.parametrize('change', ['template', 'model', 'settings', 'categories'])
+def test_prompt_version_covers_everything_that_shapes_the_output(monkeypatch, change):
+    version = extraction.prompt_version()
+    assert extraction.prompt_version() == version
+    if change == 'template':
+        build_prompt = extraction.build_prompt
+        monkeypatch.setattr(extraction, 'build_prompt', lambda text: build_prompt(text) + '\nAnswer briefly.')
+    elif change == 'model':
+        monkeypatch.setattr(extraction, 'MODEL_NAME', 'gemini-other')
+    elif change == 'settings':
+        monkeypatch.setitem(extraction.GENERATION_CONFIG, 'temperature', 0.5)
+    else:
+        monkeypatch.setattr(extraction, 'RECIPE_CATEGORIES', extraction.RECIPE_CATEGORIES + ['ramen'])
+    assert extraction.prompt_version() != version
+
+def test_extraction_asks_the_model_again_after_a_prompt_change(tmp_path, monkeypatch):
+    calls = []
+
+    async def generate_output(text):
+        calls.append(text)
+        return 'not json' if 'broken' in text else OUTPUT
+
+    monkeypatch.setattr(extraction, 'generate_output', generate_output)
+    monkeypatch.setattr(extraction, 'fast_path', None)
+    monkeypatch.setattr(extraction, 'response_cache', None)
+    path = str(tmp_path / 'llm.db')
+    extraction.enable_response_cache(path)
+
+    first = asyncio.run(extraction.extract_recipe_attributes('something sweet'))
+    assert asyncio.run(extraction.extract_recipe_attributes('Something sweet!')) == first
+    assert calls == ['something sweet']
+
+    # Outputs that are not JSON are not cached
+    for _ in range(2):
+        asyncio.run(extraction.extract_recipe_attributes('broken'))
+    assert calls == ['something sweet', 'broken', 'broken']
+
+    monkeypatch.setattr(extraction, 'MODEL_NAME', 'gemini-other')
+    extraction.enable_response_cache(path)
+    asyncio.run(extraction.extract_recipe_attributes('something sweet'))
+    assert calls[-1] == 'something sweet' and len(calls) == 4
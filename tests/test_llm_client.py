@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.utils import llm_client
+from app.utils.llm_client import LLMClient, LLMTimeoutError
+
+class FakeModel:
+    """
+    A model whose generate_content blocks until `release` is set when the input is 'hang'.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.kwargs = []
+
+    def generate_content(self, contents, **kwargs):
+        self.kwargs.append(kwargs)
+        if contents == 'hang':
+            self.release.wait()
+        return f'response to {contents}'
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+@pytest.fixture
+def client(model, monkeypatch):
+    client = LLMClient(max_concurrency=2, timeout=0.2)
+    monkeypatch.setattr(client, 'model', lambda name: model)
+    yield client
+    model.release.set()
+    client.shutdown()
+
+def test_stuck_threads_are_replaced_with_a_new_pool(client, model):
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LLMTimeoutError):
+                await client.generate('gemini', 'hang')
+        return await client.generate('gemini', 'soup')
+
+    assert asyncio.run(run()) == 'response to soup'
+    stats = client.stats()
+    assert stats['pools_replaced'] == 1 and stats['timeouts'] == 2 and stats['stuck'] == 0
+
+def test_pool_is_kept_while_a_thread_is_free(client, model):
+    async def run():
+        with pytest.raises(LLMTimeoutError):
+            await client.generate('gemini', 'hang')
+        assert client.stats()['stuck'] == 1
+        return await client.generate('gemini', 'soup')
+
+    assert asyncio.run(run()) == 'response to soup'
+    assert client.stats()['pools_replaced'] == 0
+    model.release.set()
+    for _ in range(100):
+        if client.stats()['stuck'] == 0:
+            break
+        time.sleep(0.01)
+    assert client.stats()['stuck'] == 0
+
+def test_queued_calls_time_out_with_the_queue_wait(client, model):
+    async def run():
+        return await asyncio.gather(*(client.generate('gemini', 'hang') for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, LLMTimeoutError) for result in results)
+    # The queued call never started, so only the two running ones count as stuck
+    assert client.stats()['pools_replaced'] == 1
+    assert len(model.kwargs) == 2
+
+@pytest.mark.parametrize('supported', [True, False])
+def test_transport_timeout_when_the_library_takes_one(client, model, monkeypatch, supported):
+    monkeypatch.setattr(llm_client, 'TRANSPORT_TIMEOUT', supported)
+    asyncio.run(client.generate('gemini', 'soup', timeout=5))
+    assert model.kwargs[-1] == ({'request_options': {'timeout': 5}} if supported else {})
@@ -0,0 +1,91 @@
+import random
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from app.services.recommendation import DEFAULT_FEATURE_WEIGHTS
+from app.utils.feature_engineering import CompiledTfidf, QueryVectorBuilder, create_query_vector, DIETARY_COLUMNS
+from tests.synthetic import CATEGORIES, INGREDIENTS, KEYWORDS, NAME_WORDS
+
+EXTRACT_WEIGHTS = {'ingredients': 0.50, 'category': 0.0, 'dietary': 0.0, 'calories': 0.0, 'time': 0.0,
+                   'keywords': 0.40, 'keywords_name': 0.10}
+# Words the vectorizers never saw, stop words, odd case and punctuation
+NOISE = ['the', 'and', 'Quinoa', 'GARLIC', 'sun-dried', "chef's", '1/2', 'with', 'Olive  Oil', 'é']
+
+def random_query(rng):
+    def words(vocabulary):
+        return rng.sample(vocabulary + NOISE, rng.randint(0, 4))
+    return {
+        'ingredients': words(INGREDIENTS),
+        'keywords': words(KEYWORDS),
+        'keywords_name': words(NAME_WORDS),
+        'category': rng.choice(CATEGORIES + ['not a category', None]),
+        'dietary_preference': rng.choice(DIETARY_COLUMNS + ['is_carnivore', None]),
+        'calories': rng.choice([None, 0, 250, 1200.5, 50000]),
+        'time': rng.choice([None, 0, 15, 90]),
+    }
+
+@pytest.mark.parametrize('feature_weights', [DEFAULT_FEATURE_WEIGHTS, EXTRACT_WEIGHTS], ids=['default', 'extract'])
+def test_builder_matches_create_query_vector(catalog, query_builder, feature_weights):
+    rng = random.Random(0)
+    for _ in range(300):
+        query = random_query(rng)
+        expected = create_query_vector(catalog['normalized_matrix'], catalog['tfidf_vectorizer_ingredients'],
+                                       catalog['tfidf_vectorizer_keywords'], catalog['tfidf_vectorizer_keywords_name'],
+                                       catalog['category_dummies'], catalog['scaler'], feature_weights, **query)
+        built = query_builder.build(feature_weights, **query)
+        assert built.shape == expected.shape
+        np.testing.assert_array_equal(built.toarray(), expected)
+        assert (built.data != 0).all()
+
+@pytest.mark.parametrize('block', ['ingredients', 'keywords', 'keywords_name'])
+def test_compiled_tfidf_matches_the_vectorizer(catalog, block):
+    vectorizer = catalog[f'tfidf_vectorizer_{block}']
+    compiled = CompiledTfidf(vectorizer)
+    assert compiled.supported
+    rng = random.Random(1)
+    vocabulary = sorted(vectorizer.vocabulary_)
+    for _ in range(200):
+        text = ' '.join(rng.sample(vocabulary + NOISE, rng.randint(0, 6)))
+        row = vectorizer.transform([text])
+        row.sort_indices()
+        columns, values = compiled.transform(text)
+        assert columns == list(row.indices)
+        assert values == list(row.data)
+
+def test_unsupported_vectorizers_fall_back_to_their_transform():
+    vectorizer = TfidfVectorizer(sublinear_tf=True).fit(['garlic bread', 'garlic garlic soup', 'bread pudding'])
+    compiled = CompiledTfidf(vectorizer)
+    assert not compiled.supported
+    row = vectorizer.transform(['garlic garlic bread'])
+    assert compiled.transform('garlic garlic bread') == (list(row.indices), list(row.data))
+
+def test_vectorizers_given_as_callables_are_fetched_on_first_use(catalog):
+    fetched = []
+
+    def keywords_vectorizer():
+        fetched.append('keywords')
+        return catalog['tfidf_vectorizer_keywords']
+
+    builder = QueryVectorBuilder(catalog['normalized_matrix'].shape[1], catalog['tfidf_vectorizer_ingredients'],
+                                 keywords_vectorizer, catalog['tfidf_vectorizer_keywords_name'],
+                                 catalog['category_dummies'], catalog['scaler'])
+    builder.build(DEFAULT_FEATURE_WEIGHTS, ingredients=['garlic'])
+    assert fetched == []
+    builder.build(DEFAULT_FEATURE_WEIGHTS, keywords=['Easy'])
+    builder.build(DEFAULT_FEATURE_WEIGHTS, keywords=['Dessert'])
+    assert fetched == ['keywords']
+
+def test_canonical_query_ignores_case_stop_words_and_unigram_order(query_builder):
+    key = query_builder.canonical_query(DEFAULT_FEATURE_WEIGHTS, ingredients=['Garlic', 'butter'],
+                                        keywords=['Easy', 'Dessert'], category='pie')
+    assert key == query_builder.canonical_query(DEFAULT_FEATURE_WEIGHTS, ingredients=['the garlic', 'BUTTER'],
+                                                keywords=['dessert', 'easy'], category='pie')
+    # Ingredients have bigrams, so their order changes the vector
+    assert key != query_builder.canonical_query(DEFAULT_FEATURE_WEIGHTS, ingredients=['butter', 'garlic'],
+                                                keywords=['Easy', 'Dessert'], category='pie')
+    assert key != query_builder.canonical_query(DEFAULT_FEATURE_WEIGHTS, ingredients=['garlic', 'butter'],
+                                                category='rice')
+    assert key != query_builder.canonical_query(EXTRACT_WEIGHTS, ingredients=['garlic', 'butter'], category='pie')
+    # An empty field and a missing one build the same vector
+    assert query_builder.canonical_query(DEFAULT_FEATURE_WEIGHTS, keywords=[]) == \
+        query_builder.canonical_query(DEFAULT_FEATURE_WEIGHTS)